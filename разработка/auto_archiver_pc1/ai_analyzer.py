@@ -2,43 +2,283 @@
 AI-анализатор для обработки Telegram архивов
 """
 import os
+import io
 import json
-import re
+import hashlib
+import pickle
+import multiprocessing
 from datetime import datetime
-from collections import Counter
 import zipfile
-import tempfile
-import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from chunk_store import ChunkStore, GC_MIN_AGE, open_archive, archive_size, is_archive_name, read_manifest, MANIFEST_SUFFIX
+from message_analysis import MessageAnalysis, ANALYZER_VERSION, build_matcher
+
+PROGRESS_STEP = 10_000  # Сообщений между вызовами progress
+HEADER_FILE = "header.json"
+MESSAGE_FILES = ("messages.ndjson", "metadata.json")
+MEDIA_FOLDER = "media"
+
+class AnalysisCancelled(Exception):
+    """Анализ прерван: бросается из функции progress, чтобы остановить анализ"""
+
+def is_message_member(name):
+    """
+    Файл сообщений внутри архива: messages.ndjson или metadata.json старого формата
+    
+    Медиа канала (<канал>/media/...) не подходит, даже если это JSON-документ.
+    """
+    parts = name.split('/')
+    return parts[-1] in MESSAGE_FILES and MEDIA_FOLDER not in parts[1:-1]
+
+def iter_message_file(fileobj, name):
+    """
+    Генератор сообщений из файла архива (бинарный поток)
+    
+    .ndjson читается построчно (по сообщению на строку), .json старого
+    формата - целиком, сообщения берутся из поля messages.
+    """
+    try:
+        text = io.TextIOWrapper(fileobj, encoding='utf-8')
+        if name.endswith('.ndjson'):
+            for line_number, line in enumerate(text, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"⚠️ Пропущена поврежденная строка {line_number} в {name}")
+        else:
+            metadata = json.load(text)
+            if isinstance(metadata, dict):
+                yield from metadata.get('messages', [])
+    except Exception as e:
+        print(f"⚠️ Ошибка чтения {name}: {e}")
+
+def report_progress(messages, progress, total=None, step=PROGRESS_STEP):
+    """Сообщения без изменений; каждые step сообщений - progress(обработано, всего)"""
+    done = 0
+    for msg in messages:
+        yield msg
+        done += 1
+        if done % step == 0:
+            progress(done, total)
+
+def message_total(zip_ref, members):
+    """
+    Число сообщений по заголовкам каналов (header.json рядом с messages.ndjson)
+    
+    Returns:
+        int: Сообщений во всех members или None, если у какого-то файла заголовка нет
+    """
+    names = set(zip_ref.namelist())
+    total = 0
+    for member in members:
+        header = f"{os.path.dirname(member)}/{HEADER_FILE}" if os.path.dirname(member) else HEADER_FILE
+        if not member.endswith('.ndjson') or header not in names:
+            return None
+        try:
+            with zip_ref.open(header) as f:
+                total += int(json.load(f)['total_messages'])
+        except (KeyError, ValueError, TypeError):
+            return None
+    return total
+
+class MessageStream:
+    """
+    Сообщения из архива без распаковки и загрузки в память
+    
+    Каждый проход (for msg in ...) заново открывает архив и читает из него
+    только файлы сообщений (members) - медиа не читается вовсе. Объект можно
+    передавать в функции анализа вместо списка. Количество считается один раз.
+    """
+    
+    def __init__(self, archive_path, members):
+        self.archive_path = archive_path
+        self.members = members
+        self._count = None
+    
+    def __iter__(self):
+        count = 0
+        with open_archive(self.archive_path) as archive_file, zipfile.ZipFile(archive_file, 'r') as zip_ref:
+            for member in self.members:
+                with zip_ref.open(member) as f:
+                    for msg in iter_message_file(f, member):
+                        count += 1
+                        yield msg
+        self._count = count
+    
+    def __len__(self):
+        if self._count is None:
+            for _ in self:
+                pass
+        return self._count
+    
+    def __bool__(self):
+        if self._count is not None:
+            return self._count > 0
+        messages = iter(self)
+        try:
+            return next(messages, None) is not None
+        finally:
+            messages.close()
+
+class AnalysisCache:
+    """
+    Кэш результатов анализа по содержимому архива
+    
+    Ключ - SHA-256 архива, ANALYZER_VERSION и отпечаток словарей (tag):
+    неизменный архив повторно не анализируется, а после изменения
+    накопителей или словарей кэш устаревает сам.
+    Хранятся результаты и частичные итоги (для общего отчета), по файлу
+    pickle на архив. Хэш .zip запоминается по размеру и времени изменения,
+    чтобы не перечитывать большие архивы при каждом запуске; у манифеста
+    хэш записан в нем самом.
+    """
+    
+    def __init__(self, cache_path, tag=None):
+        self.cache_path = cache_path
+        self.tag = tag
+        self.hashes_path = f"{cache_path}/hashes.json"
+        os.makedirs(cache_path, exist_ok=True)
+        
+        self.hashes = {}
+        if os.path.exists(self.hashes_path):
+            try:
+                with open(self.hashes_path, 'r', encoding='utf-8') as f:
+                    self.hashes = json.load(f)
+            except (OSError, ValueError):
+                self.hashes = {}
+        
+        self.stats = {'hits': 0, 'misses': 0}
+    
+    def archive_hash(self, archive_path):
+        """SHA-256 архива (None если файл не прочитать)"""
+        try:
+            if archive_path.endswith(MANIFEST_SUFFIX):
+                return read_manifest(archive_path)['sha256']
+            
+            stat = os.stat(archive_path)
+            key = os.path.abspath(archive_path)
+            entry = self.hashes.get(key)
+            if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                return entry['sha256']
+            
+            file_hash = hashlib.sha256()
+            with open(archive_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    file_hash.update(chunk)
+            
+            self.hashes[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_hash.hexdigest()}
+            return file_hash.hexdigest()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Не удалось вычислить хэш {os.path.basename(archive_path)}: {e}")
+            return None
+    
+    def _entry_path(self, digest):
+        suffix = f"_{self.tag}" if self.tag else ""
+        return f"{self.cache_path}/{digest}_v{ANALYZER_VERSION}{suffix}.pickle"
+    
+    def get(self, digest):
+        """
+        Returns:
+            tuple: (результаты, MessageAnalysis) или None если в кэше нет
+        """
+        path = self._entry_path(digest)
+        if not os.path.exists(path):
+            self.stats['misses'] += 1
+            return None
+        
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except Exception as e:
+            print(f"⚠️ Поврежденная запись кэша {os.path.basename(path)}: {e}")
+            self.stats['misses'] += 1
+            return None
+        
+        self.stats['hits'] += 1
+        return entry['results'], entry['partial']
+    
+    def put(self, digest, results, partial):
+        path = self._entry_path(digest)
+        with open(f"{path}.tmp", 'wb') as f:
+            pickle.dump({'results': results, 'partial': partial}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f"{path}.tmp", path)
+    
+    def save(self):
+        """Сохранение запомненных хэшей (пути удаленных архивов отбрасываются)"""
+        self.hashes = {path: entry for path, entry in self.hashes.items() if os.path.exists(path)}
+        with open(f"{self.hashes_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(self.hashes, f)
+        os.replace(f"{self.hashes_path}.tmp", self.hashes_path)
 
 class AIAnalyzer:
-    def __init__(self, storage_path="./secure_storage"):
+    def __init__(self, storage_path="./secure_storage", analysis_workers=None, dictionaries_path=None):
         """
         Инициализация AI анализатора
         
         Args:
             storage_path: Путь к хранилищу данных
+            analysis_workers: Процессов для анализа всех архивов (по умолчанию - по числу ядер)
+            dictionaries_path: Словари пользователя (JSON, по умолчанию ai_results/dictionaries.json):
+                {"positive": [...], "negative": [...], "topics": {"тема": ["слово", "фраза", ...]}}
         """
         self.storage_path = storage_path
+        self.analysis_workers = analysis_workers or os.cpu_count() or 1
         self.decrypted_storage = f"{storage_path}/decrypted"
         self.ai_results_path = f"{storage_path}/ai_results"
+        self.dictionaries_path = dictionaries_path or f"{self.ai_results_path}/dictionaries.json"
         
         # Создаем папки
         os.makedirs(self.ai_results_path, exist_ok=True)
         os.makedirs(f"{self.ai_results_path}/reports", exist_ok=True)
         os.makedirs(f"{self.ai_results_path}/stats", exist_ok=True)
         
+        # Словарный автомат строится один раз на анализатор (в пуле - на процесс)
+        self.matcher = build_matcher(self._load_dictionaries())
+        self.cache = AnalysisCache(f"{self.ai_results_path}/cache", tag=self.matcher.fingerprint)
+        
         print("🤖 AI-анализатор инициализирован")
     
-    def analyze_telegram_archive(self, archive_path):
+    def _load_dictionaries(self):
+        """Словари пользователя (None если файла нет или он поврежден)"""
+        if not os.path.exists(self.dictionaries_path):
+            return None
+        try:
+            with open(self.dictionaries_path, 'r', encoding='utf-8') as f:
+                dictionaries = json.load(f)
+            if not isinstance(dictionaries, dict):
+                raise ValueError("ожидается объект JSON")
+            terms = len(dictionaries.get('positive', [])) + len(dictionaries.get('negative', [])) + \
+                sum(len(words) for words in dictionaries.get('topics', {}).values())
+            print(f"📚 Словари пользователя: {terms} терминов, тем: {len(dictionaries.get('topics', {}))}")
+            return dictionaries
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            print(f"⚠️ Словари не загружены ({self.dictionaries_path}): {e}")
+            return None
+    
+    def analyze_telegram_archive(self, archive_path, progress=None):
         """
         Анализ Telegram архива
         
         Args:
-            archive_path: Путь к архиву .zip
+            archive_path: Путь к архиву .zip (или его манифесту .zip.manifest)
+            progress: progress(обработано, всего) каждые PROGRESS_STEP сообщений
+                (всего - None, если заранее неизвестно); может бросить AnalysisCancelled
         
         Returns:
             dict: Результаты анализа
         """
+        results, _ = self._analyze_archive(archive_path, progress)
+        return results
+    
+    def _analyze_archive(self, archive_path, progress=None):
+        """
+        Анализ архива с частичными итогами для общего отчета
+        
+        Returns:
+            tuple: (результаты анализа, MessageAnalysis или None если сообщений нет)
+        """
         print(f"🔍 Анализирую архив: {os.path.basename(archive_path)}")
         
         results = {
@@ -47,297 +287,51 @@ class AIAnalyzer:
             "basic_stats": {},
             "sentiment_analysis": {},
             "content_analysis": {},
+            "topic_analysis": {},
             "user_analysis": {},
             "anomalies": [],
             "summary": ""
         }
         
         try:
-            # Создаем временную папку для распаковки
-            temp_dir = tempfile.mkdtemp()
-            
-            # Распаковываем архив
-            with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
+            # Ищем файлы сообщений по оглавлению архива, ничего не распаковывая
+            with open_archive(archive_path) as archive_file, zipfile.ZipFile(archive_file, 'r') as zip_ref:
+                message_files = [info.filename for info in zip_ref.infolist()
+                                 if not info.is_dir() and is_message_member(info.filename)]
+                total = message_total(zip_ref, message_files) if progress else None
             
-            # Ищем файлы метаданных
-            metadata_files = []
-            for root, dirs, files in os.walk(temp_dir):
-                for file in files:
-                    if file == 'metadata.json' or file.endswith('.json'):
-                        metadata_files.append(os.path.join(root, file))
-            
-            if not metadata_files:
+            if not message_files:
                 results["summary"] = "⚠️ В архиве не найдены метаданные"
-                return results
-            
-            # Анализируем каждый файл метаданных
-            all_messages = []
-            all_users = set()
+                return results, None
             
-            for metadata_file in metadata_files:
-                try:
-                    with open(metadata_file, 'r', encoding='utf-8') as f:
-                        metadata = json.load(f)
-                    
-                    # Базовый анализ
-                    if 'messages' in metadata:
-                        messages = metadata['messages']
-                        all_messages.extend(messages)
-                        
-                        # Собираем пользователей
-                        for msg in messages:
-                            if 'sender_id' in msg:
-                                all_users.add(str(msg['sender_id']))
-                
-                except Exception as e:
-                    print(f"⚠️ Ошибка чтения {metadata_file}: {e}")
+            # Сообщения читаются из архива потоком, все виды анализа - за один проход
+            messages = MessageStream(archive_path, message_files)
+            if progress:
+                messages = report_progress(messages, progress, total)
+            analysis = MessageAnalysis(matcher=self.matcher).feed(messages)
+            if progress:
+                progress(analysis.messages, analysis.messages)
             
-            if not all_messages:
+            if not analysis.messages:
                 results["summary"] = "📭 В архиве нет сообщений для анализа"
-                return results
+                return results, None
             
-            # Выполняем анализ
-            results["basic_stats"] = self._analyze_basic_stats(all_messages, all_users)
-            results["sentiment_analysis"] = self._analyze_sentiment(all_messages)
-            results["content_analysis"] = self._analyze_content(all_messages)
-            results["user_analysis"] = self._analyze_users(all_messages)
-            results["anomalies"] = self._detect_anomalies(all_messages)
+            results.update(analysis.results())
             results["summary"] = self._generate_summary(results)
             
             # Сохраняем результаты
             self._save_results(results, archive_path)
             
-            # Очищаем временную папку
-            shutil.rmtree(temp_dir)
-            
-            print(f"✅ Анализ завершен: {len(all_messages)} сообщений, {len(all_users)} пользователей")
-            return results
+            print(f"✅ Анализ завершен: {analysis.messages} сообщений, {results['basic_stats']['unique_users']} пользователей")
+            return results, analysis
             
+        except AnalysisCancelled:
+            print(f"⏹️ Анализ прерван: {os.path.basename(archive_path)}")
+            raise
         except Exception as e:
             print(f"❌ Ошибка анализа архива: {e}")
             results["summary"] = f"❌ Ошибка анализа: {str(e)}"
-            return results
-    
-    def _analyze_basic_stats(self, messages, users):
-        """Базовая статистика"""
-        stats = {
-            "total_messages": len(messages),
-            "unique_users": len(users),
-            "time_period": {},
-            "media_count": 0,
-            "avg_message_length": 0
-        }
-        
-        # Временной период
-        dates = []
-        total_length = 0
-        
-        for msg in messages:
-            # Дата сообщения
-            if 'date' in msg and msg['date']:
-                try:
-                    date_str = msg['date'].split('T')[0] if 'T' in msg['date'] else msg['date']
-                    dates.append(date_str)
-                except:
-                    pass
-            
-            # Длина сообщения
-            if 'text' in msg and msg['text']:
-                total_length += len(str(msg['text']))
-            
-            # Медиа
-            if 'media_type' in msg and msg['media_type']:
-                stats["media_count"] += 1
-        
-        if dates:
-            stats["time_period"] = {
-                "first_date": min(dates),
-                "last_date": max(dates),
-                "days_span": (datetime.fromisoformat(max(dates)) - datetime.fromisoformat(min(dates))).days
-            }
-        
-        if messages:
-            stats["avg_message_length"] = total_length / len(messages)
-        
-        return stats
-    
-    def _analyze_sentiment(self, messages):
-        """Анализ тональности (упрощенный)"""
-        sentiment = {
-            "positive_words": 0,
-            "negative_words": 0,
-            "neutral_words": 0,
-            "sentiment_score": 0,
-            "dominant_emotion": "neutral"
-        }
-        
-        # Списки слов для анализа
-        positive_words = {
-            'хорошо', 'отлично', 'прекрасно', 'замечательно', 'супер', 'класс', 'отличный',
-            'хороший', 'прекрасный', 'замечательный', 'великолепно', 'превосходно',
-            'спасибо', 'благодарю', 'рад', 'доволен', 'счастлив', 'успех', 'победа',
-            'любовь', 'нравится', 'восхитительно', 'потрясающе', 'здорово'
-        }
-        
-        negative_words = {
-            'плохо', 'ужасно', 'отвратительно', 'кошмар', 'проблема', 'ошибка',
-            'неправильно', 'нельзя', 'запрещено', 'опасно', 'страшно', 'грустно',
-            'печально', 'разочарован', 'злой', 'сердитый', 'ненавижу', 'не люблю',
-            'проигрыш', 'поражение', 'провал', 'катастрофа', 'беда'
-        }
-        
-        total_words = 0
-        
-        for msg in messages:
-            if 'text' in msg and msg['text']:
-                text = str(msg['text']).lower()
-                words = re.findall(r'\b[а-яa-z]+\b', text)
-                
-                for word in words:
-                    total_words += 1
-                    if word in positive_words:
-                        sentiment["positive_words"] += 1
-                    elif word in negative_words:
-                        sentiment["negative_words"] += 1
-                    else:
-                        sentiment["neutral_words"] += 1
-        
-        # Рассчитываем score
-        if total_words > 0:
-            positive_ratio = sentiment["positive_words"] / total_words
-            negative_ratio = sentiment["negative_words"] / total_words
-            sentiment["sentiment_score"] = positive_ratio - negative_ratio
-            
-            if sentiment["sentiment_score"] > 0.1:
-                sentiment["dominant_emotion"] = "positive"
-            elif sentiment["sentiment_score"] < -0.1:
-                sentiment["dominant_emotion"] = "negative"
-            else:
-                sentiment["dominant_emotion"] = "neutral"
-        
-        return sentiment
-    
-    def _analyze_content(self, messages):
-        """Анализ контента"""
-        content = {
-            "common_words": [],
-            "message_frequency": {},
-            "urls_count": 0,
-            "hashtags_count": 0,
-            "mentions_count": 0
-        }
-        
-        # Счетчик слов
-        word_counter = Counter()
-        stop_words = {'и', 'в', 'не', 'на', 'что', 'это', 'как', 'но', 'а', 'или', 'у', 'за', 'к', 'до', 'по', 'из', 'от', 'же', 'бы', 'для', 'то', 'вы', 'он', 'она', 'они', 'мы', 'вас', 'ваш', 'их', 'те', 'та', 'тот', 'этот', 'такой', 'такие', 'свой'}
-        
-        for msg in messages:
-            if 'text' in msg and msg['text']:
-                text = str(msg['text']).lower()
-                
-                # Считаем слова
-                words = re.findall(r'\b[а-яa-z]{3,}\b', text)
-                for word in words:
-                    if word not in stop_words:
-                        word_counter[word] += 1
-                
-                # Считаем URL
-                content["urls_count"] += len(re.findall(r'https?://\S+', text))
-                
-                # Считаем хэштеги
-                content["hashtags_count"] += len(re.findall(r'#\w+', text))
-                
-                # Считаем упоминания
-                content["mentions_count"] += len(re.findall(r'@\w+', text))
-        
-        # Самые частые слова
-        content["common_words"] = word_counter.most_common(20)
-        
-        return content
-    
-    def _analyze_users(self, messages):
-        """Анализ пользователей"""
-        user_analysis = {
-            "top_posters": [],
-            "user_activity": {},
-            "avg_messages_per_user": 0
-        }
-        
-        # Считаем сообщения по пользователям
-        user_counter = Counter()
-        
-        for msg in messages:
-            if 'sender_id' in msg:
-                user_counter[str(msg['sender_id'])] += 1
-        
-        # Топ пользователей
-        user_analysis["top_posters"] = user_counter.most_common(10)
-        
-        # Активность по времени
-        time_counter = Counter()
-        for msg in messages:
-            if 'date' in msg and msg['date']:
-                try:
-                    hour = datetime.fromisoformat(msg['date'].replace('Z', '+00:00')).hour
-                    time_counter[hour] += 1
-                except:
-                    pass
-        
-        # Конвертируем в словарь
-        user_analysis["user_activity"] = dict(time_counter)
-        
-        # Среднее количество сообщений
-        if user_counter:
-            user_analysis["avg_messages_per_user"] = len(messages) / len(user_counter)
-        
-        return user_analysis
-    
-    def _detect_anomalies(self, messages):
-        """Обнаружение аномалий"""
-        anomalies = []
-        
-        if not messages:
-            return anomalies
-        
-        # Проверяем на спам (много сообщений от одного пользователя за короткое время)
-        user_messages = {}
-        for msg in messages:
-            if 'sender_id' in msg and 'date' in msg:
-                user_id = msg['sender_id']
-                if user_id not in user_messages:
-                    user_messages[user_id] = []
-                user_messages[user_id].append(msg['date'])
-        
-        for user_id, dates in user_messages.items():
-            if len(dates) > 50:  # Много сообщений
-                try:
-                    # Проверяем временной интервал
-                    sorted_dates = sorted([datetime.fromisoformat(d.replace('Z', '+00:00')) for d in dates])
-                    time_span = (sorted_dates[-1] - sorted_dates[0]).total_seconds()
-                    
-                    if time_span < 3600 and len(dates) > 20:  # 20+ сообщений за час
-                        anomalies.append({
-                            "type": "possible_spam",
-                            "user_id": user_id,
-                            "messages_count": len(dates),
-                            "time_span_seconds": time_span
-                        })
-                except:
-                    pass
-        
-        # Проверяем на очень длинные сообщения
-        for msg in messages:
-            if 'text' in msg and msg['text']:
-                text_len = len(str(msg['text']))
-                if text_len > 1000:
-                    anomalies.append({
-                        "type": "very_long_message",
-                        "message_id": msg.get('id', 'unknown'),
-                        "length": text_len
-                    })
-        
-        return anomalies
+            return results, None
     
     def _generate_summary(self, analysis_results):
         """Генерация текстового резюме"""
@@ -374,6 +368,12 @@ class AIAnalyzer:
             top_words = ", ".join([f"{word}({count})" for word, count in content['common_words'][:5]])
             summary_lines.append(f"• Частые слова: {top_words}")
         
+        topics = analysis_results.get('topic_analysis', {}).get('topics')
+        if topics:
+            summary_lines.append(f"\n🏷️ ТЕМЫ:")
+            for topic in topics[:5]:
+                summary_lines.append(f"• {topic['topic']}: {topic['mentions']} упоминаний в {topic['messages']} сообщениях")
+        
         if analysis_results.get('anomalies'):
             summary_lines.append(f"\n⚠️  АНОМАЛИИ:")
             for anomaly in analysis_results['anomalies'][:3]:
@@ -383,7 +383,7 @@ class AIAnalyzer:
     
     def _save_results(self, results, archive_path):
         """Сохранение результатов анализа"""
-        archive_name = os.path.basename(archive_path).replace('.zip', '').replace('.enc', '')
+        archive_name = os.path.basename(archive_path).replace(MANIFEST_SUFFIX, '').replace('.zip', '').replace('.enc', '')
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
         # JSON с полными результатами
@@ -405,44 +405,152 @@ class AIAnalyzer:
         print(f"   📊 JSON: {json_file}")
         print(f"   📝 Отчет: {report_file}")
     
-    def analyze_all_archives(self):
-        """Анализ всех архивов в хранилище"""
+    def analyze_all_archives(self, workers=None, use_cache=True, progress=None):
+        """
+        Анализ всех архивов в хранилище
+        
+        Архивы, уже проанализированные в том же содержимом (см. AnalysisCache),
+        берутся из кэша. Остальные с workers > 1 анализируются параллельно
+        в пуле процессов (разбор текста упирается в GIL, потоки не помогают).
+        Каждый архив дает результаты и частичные итоги накопителей, итоги
+        складываются (merge) в общий отчет. Готовый архив сразу попадает
+        в кэш - прерванный анализ не теряет уже сделанное.
+        
+        Args:
+            workers: Число процессов (по умолчанию analysis_workers, 1 - без пула)
+            use_cache: False - проанализировать все архивы заново
+            progress: progress(обработано сообщений, всего) - в пуле после каждого
+                архива, без пула - и по ходу архива; может бросить AnalysisCancelled
+        
+        Returns:
+            list: Результаты по архивам
+        """
         archives_path = self.decrypted_storage
         
         if not os.path.exists(archives_path):
             print(f"❌ Папка с архивами не найдена: {archives_path}")
             return []
         
-        # Ищем .zip файлы
+        # Ищем .zip файлы и манифесты архивов
         archives = []
         for file in os.listdir(archives_path):
-            if file.endswith('.zip'):
+            if is_archive_name(file):
                 archives.append(os.path.join(archives_path, file))
         
         print(f"📁 Найдено архивов для анализа: {len(archives)}")
         
+        # Неизменные архивы - из кэша
+        analyzed = {}
+        pending = []
+        for archive in archives:
+            digest = self.cache.archive_hash(archive)
+            cached = self.cache.get(digest) if digest and use_cache else None
+            if cached:
+                result, partial = cached
+                analyzed[archive] = (dict(result, archive_name=os.path.basename(archive)), partial)
+            else:
+                pending.append((archive, digest))
+        
+        if use_cache:
+            print(f"♻️ Из кэша: {len(archives) - len(pending)}, к анализу: {len(pending)}")
+        
+        done = sum(partial.messages for _, partial in analyzed.values() if partial is not None)
+        expected = self._expected_messages(pending, done) if progress else None
+        if progress:
+            progress(done, expected)
+        
+        def finish(archive, digest, result, partial):
+            analyzed[archive] = (result, partial)
+            # Ошибки и пустые архивы не кэшируются
+            if digest and partial is not None:
+                self.cache.put(digest, result, partial)
+            return partial.messages if partial is not None else 0
+        
+        workers = max(1, min(workers or self.analysis_workers, len(pending)))
+        try:
+            if workers > 1:
+                print(f"⚙️ Параллельный анализ: {workers} процессов")
+                # spawn, а не fork: пул создается из потока очереди задач, и
+                # fork многопоточного процесса может унаследовать занятую блокировку
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                           initializer=_init_worker,
+                                           initargs=(self.storage_path, self.dictionaries_path))
+                try:
+                    futures = {pool.submit(_analyze_in_worker, archive): (archive, digest) for archive, digest in pending}
+                    for future in as_completed(futures):
+                        done += finish(*futures[future], *future.result())
+                        if progress:
+                            progress(done, expected)
+                finally:
+                    # При отмене еще не начатые архивы не запускаются
+                    pool.shutdown(cancel_futures=True)
+            else:
+                for archive, digest in pending:
+                    archive_progress = None
+                    if progress:
+                        archive_progress = lambda current, _, offset=done: progress(offset + current, expected)
+                    done += finish(archive, digest, *self._analyze_archive(archive, archive_progress))
+                    if progress:
+                        progress(done, expected)
+        finally:
+            self.cache.save()
+        
+        # Свертка частичных итогов всех архивов
         results = []
+        total = MessageAnalysis(matcher=self.matcher)
         for archive in archives:
-            result = self.analyze_telegram_archive(archive)
+            result, partial = analyzed[archive]
             results.append(result)
+            if partial is not None:
+                total.merge(partial)
         
         # Создаем общий отчет
         if results:
-            self._create_global_report(results)
+            self._create_global_report(results, total)
         
         return results
     
-    def _create_global_report(self, all_results):
-        """Создание общего отчета по всем архивам"""
+    def _expected_messages(self, pending, cached):
+        """Сообщений всего: из кэша плюс по заголовкам архивов к анализу (None - неизвестно)"""
+        expected = cached
+        for archive, _ in pending:
+            try:
+                with open_archive(archive) as archive_file, zipfile.ZipFile(archive_file, 'r') as zip_ref:
+                    members = [info.filename for info in zip_ref.infolist()
+                               if not info.is_dir() and is_message_member(info.filename)]
+                    count = message_total(zip_ref, members)
+            except Exception:
+                count = None
+            if count is None:
+                return None
+            expected += count
+        return expected
+    
+    def _create_global_report(self, all_results, total=None):
+        """
+        Создание общего отчета по всем архивам
+        
+        Args:
+            all_results: Результаты по архивам
+            total: Сложенные итоги накопителей всех архивов (MessageAnalysis) -
+                пользователи считаются без повторов, тональность - по всем словам
+        """
         if not all_results:
             return
         
-        total_messages = sum(r['basic_stats'].get('total_messages', 0) for r in all_results)
-        total_users = sum(r['basic_stats'].get('unique_users', 0) for r in all_results)
-        
-        # Анализ тональности
-        sentiment_scores = [r['sentiment_analysis'].get('sentiment_score', 0) for r in all_results]
-        avg_sentiment = sum(sentiment_scores) / len(sentiment_scores) if sentiment_scores else 0
+        if total is not None and total.messages:
+            overall = total.results()
+            total_messages = overall['basic_stats']['total_messages']
+            total_users = overall['basic_stats']['unique_users']
+            avg_sentiment = overall['sentiment_analysis']['sentiment_score']
+        else:
+            overall = None
+            total_messages = sum(r['basic_stats'].get('total_messages', 0) for r in all_results)
+            total_users = sum(r['basic_stats'].get('unique_users', 0) for r in all_results)
+            
+            # Анализ тональности
+            sentiment_scores = [r['sentiment_analysis'].get('sentiment_score', 0) for r in all_results]
+            avg_sentiment = sum(sentiment_scores) / len(sentiment_scores) if sentiment_scores else 0
         
         report = f"""
 🌐 ОБЩИЙ ОТЧЕТ ПО АРХИВАМ
@@ -467,6 +575,14 @@ class AIAnalyzer:
             stats = result['basic_stats']
             report += f"{i}. {result['archive_name']}: {stats.get('total_messages', 0)} сообщений, {stats.get('unique_users', 0)} пользователей\n"
         
+        if overall and overall['content_analysis']['common_words']:
+            top_words = ", ".join(f"{word}({count})" for word, count in overall['content_analysis']['common_words'][:10])
+            report += f"\n🔍 ЧАСТЫЕ СЛОВА ПО ВСЕМ АРХИВАМ: {top_words}\n"
+        
+        if overall and overall['topic_analysis']['topics']:
+            topics = ", ".join(f"{topic['topic']}({topic['mentions']})" for topic in overall['topic_analysis']['topics'][:10])
+            report += f"\n🏷️ ТЕМЫ ПО ВСЕМ АРХИВАМ: {topics}\n"
+        
         report += f"\n⚠️  ВСЕГО АНОМАЛИЙ: {sum(len(r['anomalies']) for r in all_results)}"
         
         # Сохраняем общий отчет
@@ -478,6 +594,16 @@ class AIAnalyzer:
         
         print(f"🌐 Общий отчет создан: {report_file}")
 
+# Рабочий процесс пула анализа: свой анализатор на процесс
+_worker_analyzer = None
+
+def _init_worker(storage_path, dictionaries_path=None):
+    global _worker_analyzer
+    _worker_analyzer = AIAnalyzer(storage_path, dictionaries_path=dictionaries_path)
+
+def _analyze_in_worker(archive_path):
+    return _worker_analyzer._analyze_archive(archive_path)
+
 # Утилиты для работы с архивами
 class ArchiveManager:
     def __init__(self, storage_path="./secure_storage"):
@@ -490,9 +616,9 @@ class ArchiveManager:
         
         if os.path.exists(self.decrypted_storage):
             for file in os.listdir(self.decrypted_storage):
-                if file.endswith('.zip'):
+                if is_archive_name(file):
                     filepath = os.path.join(self.decrypted_storage, file)
-                    size = os.path.getsize(filepath) // 1024  # KB
+                    size = archive_size(filepath) // 1024  # KB
                     archives.append({
                         'name': file,
                         'path': filepath,
@@ -503,20 +629,41 @@ class ArchiveManager:
         return sorted(archives, key=lambda x: x['modified'], reverse=True)
     
     def cleanup_old_archives(self, days_old=30):
-        """Очистка старых архивов"""
+        """
+        Очистка старых архивов
+        
+        Удаляется только манифест, поэтому после него собираются части,
+        на которые больше никто не ссылается (кроме недавно записанных -
+        они могут принадлежать загрузке, которая идет сейчас).
+        
+        Returns:
+            tuple: (удалено архивов, освобождено байт)
+        """
         cutoff_date = datetime.now().timestamp() - (days_old * 24 * 3600)
         cleaned = 0
+        freed = 0
+        manifests = 0
         
         for archive in self.list_archives():
             if os.path.getmtime(archive['path']) < cutoff_date:
                 try:
+                    size = os.path.getsize(archive['path'])
                     os.remove(archive['path'])
                     cleaned += 1
+                    if archive['path'].endswith(MANIFEST_SUFFIX):
+                        manifests += 1
+                    else:
+                        freed += size
                     print(f"🗑️ Удален старый архив: {archive['name']}")
                 except Exception as e:
                     print(f"❌ Ошибка удаления {archive['name']}: {e}")
         
-        return cleaned
+        if manifests:
+            removed, chunk_bytes = ChunkStore(self.storage_path).collect_garbage([self.decrypted_storage], min_age=GC_MIN_AGE)
+            freed += chunk_bytes
+            print(f"🧹 Удалено частей: {removed} ({chunk_bytes / (1024 * 1024):.1f} MB)")
+        
+        return cleaned, freed
 
 if __name__ == "__main__":
     # Тестовый запуск
@@ -536,5 +683,5 @@ if __name__ == "__main__":
         print("📭 Архивы не найдены. Сначала отправьте архивы с ПК2.")
     
     # Очистка старых архивов
-    cleaned = manager.cleanup_old_archives(days_old=7)
+    cleaned, _ = manager.cleanup_old_archives(days_old=7)
     print(f"🧹 Очищено старых архивов: {cleaned}")
\ No newline at end of file
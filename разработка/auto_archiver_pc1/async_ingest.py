@@ -0,0 +1,220 @@
+"""
+Асинхронное ядро приема подключений для серверов ПК1
+Заменяет схему "один поток на подключение" на asyncio.start_server
+"""
+import asyncio
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+# Настройки по умолчанию
+DEFAULT_BACKLOG = 1024
+DEFAULT_MAX_CONCURRENCY = 64
+DEFAULT_READ_TIMEOUT = 60
+PREFETCH_LIMIT = 1024 * 1024  # Данные до 1 MB читаются целиком до передачи обработчику
+
+# Заголовки с полем размера (20 байт) и длиной дополнительного поля после него
+SIZED_HEADERS = {
+    "MONITORING": 0,
+    "SECURE_FILE": 0,
+    "SECURE_STM": 0,  # Размер - длина метаданных, кадры файла читает обработчик
+    "TELEGRAM": 100,  # Имя файла
+}
+
+# Заголовки без поля размера: обработчик читает данные одним recv
+UNSIZED_HEADERS = ("METRICS", "COMMAND_R")
+
+class StreamSocket:
+    """
+    Обертка над asyncio-потоком с интерфейсом обычного сокета
+
+    Обработчики серверов написаны под блокирующий socket (recv/send/close).
+    Заранее прочитанные байты отдаются из буфера, остальное читается
+    из asyncio-потока через цикл событий.
+    """
+    
+    def __init__(self, loop, reader, writer, prefetched=b"", timeout=DEFAULT_READ_TIMEOUT):
+        self._loop = loop
+        self._reader = reader
+        self._writer = writer
+        self._buffer = bytearray(prefetched)
+        self._timeout = timeout
+        self.closed = False
+    
+    def recv(self, size):
+        """Чтение до size байт (как socket.recv)"""
+        if self._buffer:
+            chunk = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            return chunk
+        
+        future = asyncio.run_coroutine_threadsafe(self._reader.read(size), self._loop)
+        try:
+            return future.result(self._timeout)
+        except TimeoutError:
+            future.cancel()
+            raise socket.timeout("timed out")
+    
+    def send(self, data):
+        """Отправка данных (как socket.send)"""
+        self._loop.call_soon_threadsafe(self._writer.write, bytes(data))
+        return len(data)
+    
+    def sendall(self, data):
+        self.send(data)
+    
+    def settimeout(self, timeout):
+        self._timeout = timeout
+    
+    def close(self):
+        # Соединение закрывается ядром после завершения обработчика
+        self.closed = True
+
+class AsyncIngestServer:
+    """
+    Асинхронный сервер приема данных от агентов
+
+    Принимает подключения в цикле событий, читает заголовок и небольшие
+    пакеты без участия потоков, затем передает подключение в
+    handler.handle_client через пул потоков фиксированного размера.
+    """
+    
+    def __init__(self, handler, host='0.0.0.0', port=9090,
+                 backlog=DEFAULT_BACKLOG, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 read_timeout=DEFAULT_READ_TIMEOUT):
+        """
+        Args:
+            handler: Сервер с методами handle_client, log_event и флагом running
+            host (str): IP адрес для прослушивания
+            port (int): Порт для прослушивания
+            backlog (int): Размер очереди входящих подключений ядра
+            max_concurrency (int): Максимум одновременно обрабатываемых подключений
+            read_timeout (int): Таймаут чтения данных от клиента (сек)
+        """
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.max_concurrency = max_concurrency
+        self.read_timeout = read_timeout
+        
+        self.stats = {
+            'accepted': 0,
+            'active': 0,
+            'completed': 0,
+            'errors': 0,
+            'waiting': 0
+        }
+        
+        self._executor = None
+        self._semaphore = None
+    
+    def get_stats(self):
+        """Счетчики подключений"""
+        return dict(self.stats)
+    
+    async def _read_frame_prefix(self, reader, header_raw):
+        """Чтение заголовка и данных, которые можно прочитать без обработчика"""
+        prefetched = bytearray(header_raw)
+        header = header_raw.decode('utf-8', errors='replace').strip()
+        
+        # "SECURE_FILE" длиннее 10 байт - последний символ идет следом
+        if header == "SECURE_FIL":
+            prefetched += await reader.readexactly(1)
+            header = "SECURE_FILE"
+        
+        if header in SIZED_HEADERS:
+            size_raw = await reader.readexactly(20)
+            prefetched += size_raw
+            
+            extra = SIZED_HEADERS[header]
+            if extra:
+                prefetched += await reader.readexactly(extra)
+            
+            try:
+                data_size = int(size_raw.decode('utf-8').strip())
+            except ValueError:
+                data_size = -1
+            
+            # Большие файлы читаются обработчиком потоково
+            if 0 <= data_size <= PREFETCH_LIMIT:
+                prefetched += await reader.readexactly(data_size)
+        
+        elif header in UNSIZED_HEADERS:
+            prefetched += await reader.read(8192)
+        
+        return bytes(prefetched)
+    
+    async def _on_connection(self, reader, writer):
+        """Обработка одного подключения"""
+        self.stats['accepted'] += 1
+        address = writer.get_extra_info('peername') or ('unknown', 0)
+        loop = asyncio.get_running_loop()
+        
+        self.stats['waiting'] += 1
+        async with self._semaphore:
+            self.stats['waiting'] -= 1
+            self.stats['active'] += 1
+            try:
+                header_raw = await asyncio.wait_for(reader.readexactly(10), self.read_timeout)
+                prefetched = await asyncio.wait_for(
+                    self._read_frame_prefix(reader, header_raw), self.read_timeout
+                )
+                
+                client_socket = StreamSocket(loop, reader, writer, prefetched, self.read_timeout)
+                await loop.run_in_executor(self._executor, self.handler.handle_client, client_socket, address)
+                
+                await writer.drain()
+                self.stats['completed'] += 1
+            
+            except asyncio.IncompleteReadError as e:
+                # Пустое подключение - проверка связи агентом (test_connection)
+                if e.partial:
+                    self.stats['errors'] += 1
+                    self.handler.log_event(f"⚠️ Подключение {address[0]} прервано: неполный пакет", "WARNING")
+            except (asyncio.TimeoutError, ConnectionError) as e:
+                self.stats['errors'] += 1
+                self.handler.log_event(f"⚠️ Подключение {address[0]} прервано: {type(e).__name__}", "WARNING")
+            except Exception as e:
+                self.stats['errors'] += 1
+                self.handler.log_event(f"❌ Ошибка обработки подключения {address[0]}: {e}", "ERROR")
+            finally:
+                self.stats['active'] -= 1
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except Exception:
+                    pass
+    
+    async def _serve(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                            thread_name_prefix="ingest")
+        
+        server = await asyncio.start_server(
+            self._on_connection, self.host, self.port,
+            backlog=self.backlog, reuse_address=True
+        )
+        
+        self.handler.log_event(
+            f"✅ Асинхронный сервер запущен на {self.host}:{self.port} "
+            f"(backlog={self.backlog}, max_concurrency={self.max_concurrency})"
+        )
+        
+        try:
+            async with server:
+                # Проверяем флаг running как и потоковый сервер
+                while self.handler.running:
+                    await asyncio.sleep(1)
+        finally:
+            server.close()
+            await server.wait_closed()
+            self._executor.shutdown(wait=True)
+    
+    def serve_forever(self):
+        """Запуск сервера (блокирует до сброса handler.running)"""
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            self.handler.log_event(f"❌ Критическая ошибка сервера: {e}", "ERROR")
+        finally:
+            self.handler.log_event("🔴 Асинхронный сервер остановлен")
\ No newline at end of file
@@ -0,0 +1,77 @@
+"""
+Тест скорости анализа пользователей и аномалий: циклы Python против NumPy
+Создает синтетические сообщения (с пачками сообщений от спамеров) и
+сравнивает накопители Users/Anomalies (разбор даты каждого сообщения
+в цикле) со столбцовыми ColumnarUsers/ColumnarAnomalies. Отдельно
+показано время самих накопителей - без общей для всех подготовки
+сообщений (PreparedMessage). Результаты обеих схем должны совпасть.
+Запуск: python bench_activity.py [сообщений]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from message_analysis import (MessageAnalysis, Users, Anomalies, ColumnarUsers, ColumnarAnomalies,
+                              NUMPY_ENABLED)
+
+SPAMMERS = 20
+SPAM_BURST = 80
+
+def build_messages(count):
+    """Сообщения канала: обычные пользователи раз в ~30 секунд и короткие пачки спамеров"""
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    messages = []
+    
+    for i in range(count):
+        messages.append({
+            'id': i,
+            'date': (start + timedelta(seconds=i * 30)).isoformat(),
+            'sender_id': rng.randint(1, 50000),
+            'text': "x" * (1500 if rng.random() < 0.001 else 50)
+        })
+    
+    for spammer in range(SPAMMERS):
+        burst_start = start + timedelta(seconds=rng.randint(0, count * 30))
+        for i in range(SPAM_BURST):
+            messages.append({
+                'id': count + spammer * SPAM_BURST + i,
+                'date': (burst_start + timedelta(seconds=i * 10)).isoformat(),
+                'sender_id': 1_000_000 + spammer,
+                'text': "купи"
+            })
+    
+    return messages
+
+def measure(accumulators, messages):
+    start = time.perf_counter()
+    results = MessageAnalysis(accumulators).feed(messages).results()
+    return time.perf_counter() - start, results
+
+if __name__ == "__main__":
+    if not NUMPY_ENABLED:
+        print("❌ NumPy не установлен: pip install numpy")
+        sys.exit(1)
+    
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"📦 Создаю сообщения: {count}...")
+    messages = build_messages(count)
+    
+    base_time, _ = measure((), messages)
+    python_time, python_results = measure((Users, Anomalies), messages)
+    numpy_time, numpy_results = measure((ColumnarUsers, ColumnarAnomalies), messages)
+    python_net = python_time - base_time
+    numpy_net = numpy_time - base_time
+    
+    spam = sum(1 for anomaly in numpy_results['anomalies'] if anomaly['type'] == 'possible_spam')
+    print(f"📝 Подготовка сообщений: {base_time:.2f} сек")
+    print(f"🐢 Циклы Python: {python_time:.2f} сек, накопители {python_net:.2f} сек")
+    print(f"⚡ NumPy:        {numpy_time:.2f} сек, накопители {numpy_net:.2f} сек")
+    print(f"📈 Ускорение: {python_time / numpy_time:.2f}x всего, {python_net / numpy_net:.2f}x накопителей, "
+          f"найдено спамеров: {spam}")
+    
+    if python_results != numpy_results:
+        print("❌ Результаты различаются")
+        sys.exit(1)
+    print("✅ Результаты совпадают")
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+Тест скорости анализа архива: один проход против прохода на каждый вид анализа
+Создает синтетический архив с messages.ndjson и сравнивает однопроходный
+анализ (MessageAnalysis со всеми накопителями) с прежней схемой - отдельный
+проход по архиву и отдельный разбор текста на каждый вид анализа.
+Результаты обеих схем должны совпасть.
+Запуск: python bench_analyzer.py [сообщений]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta
+
+from ai_analyzer import MessageStream
+from message_analysis import MessageAnalysis, DEFAULT_ACCUMULATORS
+
+WORDS = (
+    "привет как дела это хорошо плохо проблема спасибо отлично новости канал сегодня завтра "
+    "работа город погода фото видео ссылка вопрос ответ друзья встреча время деньги проект"
+).split()
+EXTRAS = ["https://t.me/example", "#новости", "@admin", "", "", "", "", ""]
+
+def build_archive(path, messages):
+    """Архив канала с messages.ndjson из синтетических сообщений"""
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        with zip_ref.open("bench/messages.ndjson", 'w') as f:
+            for i in range(messages):
+                text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 40)))
+                msg = {
+                    'id': i,
+                    'date': (start + timedelta(seconds=i * 30)).isoformat(),
+                    'sender_id': rng.randint(1, 5000),
+                    'text': f"{text} {rng.choice(EXTRAS)}".strip(),
+                    'media_type': 'photo' if rng.random() < 0.1 else None,
+                    'media_path': None
+                }
+                f.write(json.dumps(msg, ensure_ascii=False).encode('utf-8') + b"\n")
+        zip_ref.writestr("bench/header.json", json.dumps({'format': 'ndjson', 'total_messages': messages}))
+
+def run_fused(archive_path, members):
+    return MessageAnalysis().feed(MessageStream(archive_path, members)).results()
+
+def run_separate(archive_path, members):
+    """Прежняя схема: по проходу (и разбору текста) на каждый вид анализа"""
+    results = {}
+    for accumulator in DEFAULT_ACCUMULATORS:
+        results.update(MessageAnalysis((accumulator,)).feed(MessageStream(archive_path, members)).results())
+    return results
+
+def measure(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+if __name__ == "__main__":
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        archive_path = os.path.join(tmp, "bench.zip")
+        print(f"📦 Создаю архив: {messages} сообщений...")
+        build_archive(archive_path, messages)
+        print(f"   Размер: {os.path.getsize(archive_path) / (1024 * 1024):.1f} MB")
+        
+        members = ["bench/messages.ndjson"]
+        separate_time, separate = measure(run_separate, archive_path, members)
+        fused_time, fused = measure(run_fused, archive_path, members)
+        
+        print(f"🐢 Проходов {len(DEFAULT_ACCUMULATORS)}: {separate_time:.1f} сек ({messages / separate_time:,.0f} сообщ/с)")
+        print(f"⚡ Один проход:   {fused_time:.1f} сек ({messages / fused_time:,.0f} сообщ/с)")
+        print(f"📈 Ускорение: {separate_time / fused_time:.2f}x")
+        
+        if fused != separate:
+            print("❌ Результаты различаются")
+            sys.exit(1)
+        print("✅ Результаты совпадают")
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+Тест скорости каталога хранилища против обхода папок на каждый запрос
+Создает во временной папке архивы, отчеты и файлы результатов (всего
+50 000 файлов по умолчанию) и сравнивает обработку запросов веб-интерфейса:
+как раньше (listdir, stat и чтение файлов при каждом вызове) и через
+StorageCatalog - первый запрос, повторный и после добавления файла.
+Запуск: python bench_catalog.py [файлов]
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from storage_catalog import StorageCatalog
+
+REPEATS = 5
+REPORT_TEXT = "📊 AI АНАЛИЗ ТЕЛЕГРАМ АРХИВА\n" + "=" * 50 + "\n\n" + "строка отчета\n" * 100
+
+def build_storage(root, count):
+    """Папки archives, reports и stats: 2/5, 2/5 и 1/5 файлов"""
+    paths = {name: os.path.join(root, name) for name in ('archives', 'reports', 'stats')}
+    for path in paths.values():
+        os.makedirs(path)
+    for i in range(count * 2 // 5):
+        with open(os.path.join(paths['archives'], f"archive_{i}.zip"), 'wb') as f:
+            f.write(b"PK" * 64)
+        with open(os.path.join(paths['reports'], f"archive_{i}_20240101_120000_report.txt"), 'w', encoding='utf-8') as f:
+            f.write(REPORT_TEXT)
+    for i in range(count - count * 4 // 5):
+        with open(os.path.join(paths['stats'], f"archive_{i}_20240101_120000.json"), 'w', encoding='utf-8') as f:
+            json.dump({'archive_name': f"archive_{i}.zip", 'basic_stats': {'total_messages': i, 'unique_users': 3},
+                       'sentiment_analysis': {'sentiment_score': 0.2}, 'anomalies': []}, f)
+    return paths
+
+def scan_requests(paths):
+    """Запросы status, archives, reports и stats - обходом папок, как без каталога"""
+    archives = []
+    for file in os.listdir(paths['archives']):
+        filepath = os.path.join(paths['archives'], file)
+        base_name = file.replace('.zip', '')
+        report_exists = os.path.exists(f"{paths['reports']}/{base_name}_report.txt")
+        archives.append((file, os.path.getsize(filepath),
+                         datetime.fromtimestamp(os.path.getmtime(filepath)).strftime('%Y-%m-%d %H:%M:%S'), report_exists))
+    
+    reports = []
+    for file in os.listdir(paths['reports']):
+        filepath = os.path.join(paths['reports'], file)
+        with open(filepath, 'r', encoding='utf-8') as f:
+            preview = f.read(500)
+        reports.append((file, os.path.getsize(filepath),
+                        datetime.fromtimestamp(os.path.getmtime(filepath)).strftime('%Y-%m-%d %H:%M:%S'), preview[:200]))
+    
+    messages = 0
+    for file in os.listdir(paths['stats']):
+        with open(os.path.join(paths['stats'], file), 'r', encoding='utf-8') as f:
+            messages += json.load(f)['basic_stats']['total_messages']
+    
+    status = (len(archives), len(reports), sum(size for _, size, _, _ in archives))
+    return status, len(archives), len(reports), messages
+
+def read_preview(filepath):
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return f.read(500)
+
+def read_messages(filepath):
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return json.load(f)['basic_stats']['total_messages']
+
+def total_size(entries):
+    return sum(entry.size for entry in entries)
+
+def reports_by_archive(entries):
+    return {entry.name.rsplit('_', 3)[0]: entry.name for entry in entries}
+
+def report_list(entries):
+    return [(entry.name, entry.size, entry.modified_text, entry.data[:200]) for entry in entries]
+
+def total_messages(entries):
+    return sum(entry.data for entry in entries)
+
+def catalog_requests(catalog):
+    """Те же запросы через каталог"""
+    reports_index = catalog.index('reports', reports_by_archive)
+    archives = [(entry.name, entry.size, entry.modified_text, entry.name[:-4] in reports_index)
+                for entry in catalog.list('archives')]
+    reports = catalog.index('reports', report_list)
+    messages = catalog.index('stats', total_messages)
+    status = (len(catalog.list('archives')), len(catalog.list('reports')), catalog.index('archives', total_size))
+    return status, len(archives), len(reports), messages
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    root = tempfile.mkdtemp(prefix="bench_catalog_")
+    try:
+        start = time.perf_counter()
+        paths = build_storage(root, count)
+        print(f"📦 Файлов: {count} (создано за {time.perf_counter() - start:.1f} с)")
+        
+        scan_time = min(timed(scan_requests, paths)[0] for _ in range(REPEATS))
+        expected = scan_requests(paths)
+        
+        catalog = StorageCatalog()
+        catalog.watch('archives', paths['archives'], match=lambda name: name.endswith('.zip'))
+        catalog.watch('reports', paths['reports'], match=lambda name: name.endswith('.txt'), loader=read_preview)
+        catalog.watch('stats', paths['stats'], match=lambda name: name.endswith('.json'), loader=read_messages)
+        cold_time, cold = timed(catalog_requests, catalog)
+        
+        # Папки изменены только что - первые запросы еще пересматривают их, ждем
+        time.sleep(1.1)
+        catalog_requests(catalog)
+        scans = catalog.stats['scans']
+        warm_time = min(timed(catalog_requests, catalog)[0] for _ in range(REPEATS))
+        warm_scans = catalog.stats['scans'] - scans
+        
+        with open(os.path.join(paths['stats'], "archive_new_20240102_120000.json"), 'w', encoding='utf-8') as f:
+            json.dump({'basic_stats': {'total_messages': 1}}, f)
+        changed_time, changed = timed(catalog_requests, catalog)
+        
+        # Ответы каталога совпадают с обходом папок
+        assert cold == expected, (cold, expected)
+        assert changed == scan_requests(paths), changed
+        
+        print(f"{'вариант':<32} {'время, мс':>10}")
+        print(f"{'обход папок (каждый запрос)':<32} {scan_time * 1000:>10.1f}")
+        print(f"{'каталог: первый запрос':<32} {cold_time * 1000:>10.1f}")
+        print(f"{'каталог: без изменений':<32} {warm_time * 1000:>10.1f}   пересмотров папок: {warm_scans}")
+        print(f"{'каталог: добавлен файл':<32} {changed_time * 1000:>10.1f}")
+        print(f"⚡ Повторный запрос быстрее обхода в {scan_time / warm_time:.1f} раз")
+    finally:
+        shutil.rmtree(root)
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""
+Сравнение шифрования архивов: Fernet целиком против потокового контейнера
+Замеряет скорость (MB/s) и пиковую память процесса для шифрования + расшифровки
+Запуск: python bench_crypto.py [размеры_MB через запятую]  (например 100,1000,5000)
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BLOCK = 1024 * 1024
+
+def _make_input(path, size_mb):
+    """Файл заданного размера (случайный блок, повторенный size_mb раз)"""
+    block = os.urandom(BLOCK)
+    with open(path, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+def _run_fernet(src, workdir):
+    """Текущий путь: файл целиком в память, Fernet.encrypt / decrypt"""
+    from cryptography.fernet import Fernet
+    cipher = Fernet(Fernet.generate_key())
+    
+    with open(src, 'rb') as f:
+        data = f.read()
+    token = cipher.encrypt(data)
+    with open(os.path.join(workdir, 'out.enc'), 'wb') as f:
+        f.write(token)
+    
+    with open(os.path.join(workdir, 'out.enc'), 'rb') as f:
+        plain = cipher.decrypt(f.read())
+    with open(os.path.join(workdir, 'out.dec'), 'wb') as f:
+        f.write(plain)
+
+def _run_stream(src, workdir):
+    """Потоковый контейнер stream_crypto"""
+    from cryptography.fernet import Fernet
+    from stream_crypto import encrypt_file, decrypt_file, key_id
+    key = Fernet.generate_key()
+    
+    encrypt_file(src, os.path.join(workdir, 'out.enc'), key)
+    decrypt_file(os.path.join(workdir, 'out.enc'), os.path.join(workdir, 'out.dec'), {key_id(key): key}.get)
+
+def _child(mode, src, workdir):
+    """Один замер в отдельном процессе (чистый пик памяти)"""
+    started = time.perf_counter()
+    try:
+        if mode == 'fernet':
+            _run_fernet(src, workdir)
+        else:
+            _run_stream(src, workdir)
+        error = None
+    except MemoryError:
+        error = 'MemoryError'
+    elapsed = time.perf_counter() - started
+    
+    # ru_maxrss в килобайтах (Linux)
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'seconds': elapsed, 'peak_rss_mb': peak_mb, 'error': error}))
+
+def run_case(mode, src, size_mb, workdir):
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', mode, src, workdir],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        return {'mode': mode, 'error': result.stderr.strip().splitlines()[-1] if result.stderr else 'killed'}
+    
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    data['mode'] = mode
+    # Шифрование и расшифровка - данные проходят дважды
+    data['mb_per_sec'] = 2 * size_mb / data['seconds'] if data['seconds'] else 0
+    return data
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        _child(*sys.argv[2:5])
+        sys.exit(0)
+    
+    sizes = [int(s) for s in sys.argv[1].split(',')] if len(sys.argv) > 1 else [100, 1000]
+    
+    print("=" * 60)
+    print("🔐 ШИФРОВАНИЕ АРХИВОВ: FERNET ПРОТИВ ПОТОКОВОГО КОНТЕЙНЕРА")
+    print("=" * 60)
+    
+    for size_mb in sizes:
+        with tempfile.TemporaryDirectory(prefix="bench_crypto_") as workdir:
+            src = os.path.join(workdir, 'input.bin')
+            _make_input(src, size_mb)
+            print(f"📁 Файл {size_mb} MB")
+            
+            for mode in ('fernet', 'stream'):
+                result = run_case(mode, src, size_mb, workdir)
+                if result.get('error'):
+                    print(f"  {mode:<7} | ❌ {result['error']}")
+                else:
+                    print(f"  {mode:<7} | {result['mb_per_sec']:8.1f} MB/s | "
+                          f"пик памяти: {result['peak_rss_mb']:8.1f} MB | {result['seconds']:.2f} сек")
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""
+Тест задержки API дашборда мониторинга на большой базе
+Заполняет monitoring.db миллионами строк и проверяет, что эндпоинты
+/api/agents, /api/agent/<id>/stats и /api/dashboard/stats укладываются в бюджет
+Запуск: python bench_dashboard.py [агентов] [замеров_на_агента]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+LATENCY_BUDGET_MS = 200  # Бюджет на один запрос (p95)
+REQUESTS_PER_ENDPOINT = 20
+
+def seed_database(db_path, agents, samples_per_agent, days=7):
+    """Заполнение базы синтетическими данными мониторинга"""
+    conn = sqlite3.connect(db_path)
+    now = datetime.now()
+    step = timedelta(days=days) / samples_per_agent
+    agent_ids = [f"agent_bench_{i}" for i in range(agents)]
+    
+    conn.executemany('''
+        INSERT OR REPLACE INTO agents
+        (agent_id, hostname, os, cpu_info, memory_gb, first_seen, last_seen, status, ip_address)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(a, f"host_{i}", "Linux", "CPU", 16, now - timedelta(days=days), now, 'ONLINE', '10.0.0.1')
+          for i, a in enumerate(agent_ids)])
+    
+    for agent_id in agent_ids:
+        timestamps = [now - step * i for i in range(samples_per_agent)]
+        conn.executemany(
+            'INSERT INTO cpu_monitoring (agent_id, timestamp, cpu_percent) VALUES (?, ?, ?)',
+            [(agent_id, ts, random.random() * 100) for ts in timestamps]
+        )
+        conn.executemany(
+            'INSERT INTO memory_monitoring (agent_id, timestamp, ram_percent) VALUES (?, ?, ?)',
+            [(agent_id, ts, random.random() * 100) for ts in timestamps]
+        )
+        conn.executemany(
+            'INSERT INTO disk_monitoring (agent_id, timestamp, mountpoint, disk_percent) VALUES (?, ?, ?, ?)',
+            [(agent_id, ts, '/', random.random() * 100) for ts in timestamps[::10]]
+        )
+        conn.executemany(
+            'INSERT INTO events (agent_id, timestamp, event_type, event_message, severity) VALUES (?, ?, ?, ?, ?)',
+            [(agent_id, ts, 'MONITORING_DATA', 'bench', random.choice(('INFO', 'INFO', 'INFO', 'ERROR')))
+             for ts in timestamps[::5]]
+        )
+        conn.commit()
+    
+    conn.close()
+    return agent_ids
+
+def measure(client, url):
+    """Задержка запроса (p50, p95) в миллисекундах"""
+    timings = []
+    for _ in range(REQUESTS_PER_ENDPOINT):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"{url}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}")
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.95) - 1]
+
+if __name__ == "__main__":
+    agents = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    
+    workdir = tempfile.mkdtemp(prefix="bench_dashboard_")
+    os.chdir(workdir)
+    
+    # Схема и индексы создаются сервером так же, как в работе
+    from server_monitoring import MonitoringServer
+    server = MonitoringServer()
+    server.db_writer.close()
+    
+    print(f"🧪 Заполняю базу: {agents} агентов x {samples} замеров...")
+    started = time.time()
+    agent_ids = seed_database(server.db_path, agents, samples)
+    
+    # Данные залиты в обход приема - заполняем agent_latest так же, как при обновлении старой базы
+    server.db_cursor.execute('PRAGMA user_version = 1')
+    server._migrate_database()
+    server.db_conn.close()
+    print(f"✅ База заполнена за {time.time() - started:.1f} сек "
+          f"({os.path.getsize(server.db_path) // (1024 * 1024)} MB)")
+    
+    import web_monitoring_dashboard
+    web_monitoring_dashboard.DB_PATH = server.db_path
+    client = web_monitoring_dashboard.app.test_client()
+    
+    endpoints = [
+        '/api/agents',
+        f'/api/agent/{agent_ids[0]}/stats',
+        '/api/dashboard/stats',
+    ]
+    
+    failed = False
+    for url in endpoints:
+        p50, p95 = measure(client, url)
+        ok = p95 <= LATENCY_BUDGET_MS
+        failed = failed or not ok
+        print(f"  {'✅' if ok else '❌'} {url:<40} p50={p50:7.1f} мс  p95={p95:7.1f} мс")
+    
+    if failed:
+        print(f"❌ Превышен бюджет задержки {LATENCY_BUDGET_MS} мс")
+        sys.exit(1)
+    
+    print(f"✅ Все эндпоинты укладываются в {LATENCY_BUDGET_MS} мс")
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""
+Нагрузочный тест приема подключений: потоковый сервер против asyncio
+Запуск: python bench_ingest.py [клиентов] [подключений_на_клиента]
+"""
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from async_ingest import DEFAULT_BACKLOG, DEFAULT_MAX_CONCURRENCY
+
+HOST = '127.0.0.1'
+
+def _free_port():
+    """Поиск свободного порта"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+def _run_server_process(mode, port, workdir):
+    """Запуск сервера в отдельном процессе (без вывода в консоль)"""
+    os.chdir(workdir)
+    sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+    
+    from server import MasterServer
+    server = MasterServer(host=HOST, port=port)
+    
+    if mode == 'threaded':
+        server._run_server()
+    else:
+        server._run_async_server(DEFAULT_BACKLOG, DEFAULT_MAX_CONCURRENCY)
+
+def _wait_for_port(port, timeout=10):
+    """Ожидание запуска сервера"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((HOST, port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def _client_worker(port, connections, payload):
+    """Один клиент: серия подключений с отправкой метрик"""
+    ok = 0
+    errors = 0
+    for _ in range(connections):
+        try:
+            with socket.create_connection((HOST, port), timeout=10) as sock:
+                sock.sendall("METRICS".ljust(10).encode('utf-8') + payload)
+                sock.shutdown(socket.SHUT_WR)
+                # Ждем закрытия соединения сервером = пакет обработан
+                while sock.recv(4096):
+                    pass
+            ok += 1
+        except OSError:
+            errors += 1
+    return ok, errors
+
+def run_benchmark(mode, clients, per_client):
+    """Замер подключений в секунду для одного режима сервера"""
+    port = _free_port()
+    workdir = tempfile.mkdtemp(prefix=f"bench_{mode}_")
+    
+    process = multiprocessing.Process(target=_run_server_process, args=(mode, port, workdir), daemon=True)
+    process.start()
+    
+    if not _wait_for_port(port):
+        process.terminate()
+        raise RuntimeError(f"Сервер {mode} не запустился")
+    
+    payload = json.dumps({'cpu_percent': 12.5, 'memory_percent': 48.0}).encode('utf-8')
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda _: _client_worker(port, per_client, payload), range(clients)))
+    elapsed = time.perf_counter() - start
+    
+    process.terminate()
+    process.join()
+    
+    ok = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    return {
+        'mode': mode,
+        'connections': ok,
+        'errors': errors,
+        'seconds': elapsed,
+        'conn_per_sec': ok / elapsed if elapsed else 0
+    }
+
+if __name__ == "__main__":
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_client = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    
+    print("=" * 60)
+    print("📈 НАГРУЗОЧНЫЙ ТЕСТ ПРИЕМА ПОДКЛЮЧЕНИЙ")
+    print("=" * 60)
+    print(f"👥 Клиентов: {clients}, подключений на клиента: {per_client}")
+    
+    for mode in ('threaded', 'async'):
+        result = run_benchmark(mode, clients, per_client)
+        print(f"  {result['mode']:<9} | {result['conn_per_sec']:8.1f} conn/s | "
+              f"успешно: {result['connections']} | ошибок: {result['errors']} | "
+              f"{result['seconds']:.2f} сек")
\ No newline at end of file
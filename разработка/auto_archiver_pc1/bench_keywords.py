@@ -0,0 +1,68 @@
+"""
+Тест скорости словарного автомата при росте словаря
+Строит KeywordMatcher для словарей от встроенного (десятки терминов) до
+десятков тысяч слов и фраз и ищет их в синтетических сообщениях. Для
+сравнения - наивный поиск (проверка каждого термина в каждом тексте),
+время которого растет вместе со словарем.
+Запуск: python bench_keywords.py [сообщений]
+"""
+import random
+import sys
+import time
+
+from keyword_matcher import KeywordMatcher, tokenize
+from message_analysis import POSITIVE_WORDS, NEGATIVE_WORDS
+from bench_analyzer import WORDS
+
+DICTIONARY_SIZES = (1_000, 10_000, 50_000)
+NAIVE_SAMPLE = 500  # Сообщений для наивного поиска (он слишком медленный для всех)
+LETTERS = "абвгдежзиклмнопрстуфхцчшщэюя"
+
+def build_messages(count):
+    rng = random.Random(7)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 40))) for _ in range(count)]
+
+def build_dictionary(size):
+    """Встроенные словари плюс size случайных слов и фраз (каждый пятый термин - фраза)"""
+    rng = random.Random(size)
+    make_word = lambda: "".join(rng.choice(LETTERS) for _ in range(rng.randint(4, 10)))
+    terms = []
+    for i in range(size):
+        terms.append(f"{make_word()} {rng.choice(WORDS)}" if i % 5 == 0 else make_word())
+    return {
+        'positive': list(POSITIVE_WORDS) + terms[::2],
+        'negative': list(NEGATIVE_WORDS) + terms[1::2]
+    }
+
+def run_matcher(matcher, texts):
+    start = time.perf_counter()
+    for words in texts:
+        matcher.count(words)
+    return time.perf_counter() - start
+
+def run_naive(dictionary, texts):
+    terms = [term for terms in dictionary.values() for term in terms]
+    start = time.perf_counter()
+    for text in texts:
+        padded = f" {text} "
+        sum(padded.count(f" {term} ") for term in terms)
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    messages = build_messages(count)
+    texts = [tokenize(text) for text in messages]
+    sample = messages[:NAIVE_SAMPLE]
+    
+    print(f"📦 Сообщений: {count}, наивный поиск - по {NAIVE_SAMPLE}")
+    print(f"{'терминов':>10} {'сборка, с':>10} {'автомат, сообщ/с':>18} {'наивно, сообщ/с':>17}")
+    
+    for size in (0,) + DICTIONARY_SIZES:
+        dictionary = build_dictionary(size)
+        start = time.perf_counter()
+        matcher = KeywordMatcher(dictionary)
+        build_time = time.perf_counter() - start
+        
+        matcher_time = run_matcher(matcher, texts)
+        naive_time = run_naive(dictionary, sample)
+        print(f"{matcher.terms:>10} {build_time:>10.2f} {count / matcher_time:>18,.0f} {NAIVE_SAMPLE / naive_time:>17,.0f}")
\ No newline at end of file
@@ -0,0 +1,363 @@
+"""
+Хранилище архивов с дедупликацией по содержимому
+Файл режется на части по содержимому: граница ставится там, где отпечаток
+скользящего окна из WINDOW байт совпадает с образцом, поэтому вставка или
+удаление данных сдвигает только соседние границы, а не все последующие.
+Каждая часть хранится один раз под своим SHA-256:
+    chunks/ab/abcdef...   - данные части
+Вместо файла пишется манифест (JSON): размер, хэш файла и список частей.
+
+Отпечаток окна: каждый байт заменяется 2-битным символом (bytes.translate),
+граница - первое вхождение образца из WINDOW символов (bytes.find).
+Оба шага выполняются на C, побайтовый цикл на Python не нужен.
+"""
+import bisect
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+MANIFEST_SUFFIX = ".manifest"
+MANIFEST_VERSION = 1
+
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+GC_MIN_AGE = 3600  # Части моложе часа сборщик мусора не трогает - их может ждать манифест загрузки
+WINDOW = 10  # 10 символов по 2 бита - граница в среднем через 1 MB после MIN_CHUNK_SIZE
+
+# Байт -> символ 0..3 (фиксированная псевдослучайная таблица, менять нельзя -
+# иначе границы частей сместятся и старые части перестанут совпадать)
+SYMBOLS = bytes(hashlib.sha256(b"chunk_store symbols" + bytes([i])).digest()[0] & 3 for i in range(256))
+# Образец содержит все четыре символа - в сериях одинаковых байт граница не ставится
+BOUNDARY_PATTERN = bytes([0, 1, 2, 3, 1, 3, 0, 2, 3, 1])
+
+def find_boundary(data, min_size=MIN_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE):
+    """Длина первой части data (не меньше min_size и не больше max_size, если данных хватает)"""
+    end = min(len(data), max_size)
+    if end <= min_size:
+        return end
+    
+    symbols = data[min_size - WINDOW:end].translate(SYMBOLS)
+    index = symbols.find(BOUNDARY_PATTERN)
+    return min_size + index if index >= 0 else end
+
+def iter_chunks(fileobj, min_size=MIN_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE):
+    """Генератор частей файла с границами по содержимому"""
+    buffer = bytearray()
+    eof = False
+    
+    while True:
+        while not eof and len(buffer) < max_size:
+            data = fileobj.read(max_size)
+            if not data:
+                eof = True
+            buffer += data
+        
+        if not buffer:
+            return
+        
+        cut = find_boundary(buffer, min_size, max_size)
+        yield bytes(buffer[:cut])
+        del buffer[:cut]
+
+def is_archive_name(name):
+    """Архив .zip или манифест архива"""
+    return name.endswith('.zip') or name.endswith('.zip' + MANIFEST_SUFFIX)
+
+def read_manifest(manifest_path):
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"Неподдерживаемая версия манифеста: {manifest.get('version')}")
+    return manifest
+
+def archive_size(path):
+    """Размер архива (для манифеста - исходного файла)"""
+    if path.endswith(MANIFEST_SUFFIX):
+        return read_manifest(path)['size']
+    return os.path.getsize(path)
+
+def open_archive(path):
+    """
+    Открытие архива на чтение: обычный файл или файл, собранный по манифесту
+    
+    Результат поддерживает seek, поэтому подходит для zipfile.ZipFile.
+    """
+    if not path.endswith(MANIFEST_SUFFIX):
+        return open(path, 'rb')
+    
+    manifest = read_manifest(path)
+    store_root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(path)), manifest['store']))
+    return io.BufferedReader(ManifestReader(ChunkStore(store_root), manifest))
+
+class ManifestReader(io.RawIOBase):
+    """Чтение файла по манифесту (части подгружаются по мере надобности)"""
+    
+    def __init__(self, store, manifest):
+        self.store = store
+        self.size = manifest['size']
+        self.chunks = [digest for digest, _ in manifest['chunks']]
+        
+        # Смещения начала частей (для поиска части по позиции)
+        self.offsets = []
+        offset = 0
+        for _, length in manifest['chunks']:
+            self.offsets.append(offset)
+            offset += length
+        
+        self.position = 0
+        self._cached_index = None
+        self._cached_data = b""
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def tell(self):
+        return self.position
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("Отрицательная позиция")
+        self.position = offset
+        return self.position
+    
+    def _chunk(self, index):
+        if index != self._cached_index:
+            self._cached_data = self.store.read_chunk(self.chunks[index])
+            self._cached_index = index
+        return self._cached_data
+    
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        
+        index = bisect.bisect_right(self.offsets, self.position) - 1
+        data = self._chunk(index)
+        start = self.position - self.offsets[index]
+        piece = data[start:start + len(buffer)]
+        
+        buffer[:len(piece)] = piece
+        self.position += len(piece)
+        return len(piece)
+
+class ChunkStore:
+    """Хранилище частей по SHA-256"""
+    
+    def __init__(self, root):
+        self.root = root
+        self.chunks_path = os.path.join(root, "chunks")
+        os.makedirs(self.chunks_path, exist_ok=True)
+    
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunks_path, digest[:2], digest)
+    
+    def put_chunk(self, data):
+        """
+        Сохранение части (если такой еще нет)
+        
+        Returns:
+            tuple: (sha256 hex, записана ли новая часть)
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if os.path.exists(path):
+            try:
+                # Время изменения обновляется: пока пишется манифест, часть считается свежей
+                os.utime(path)
+                return digest, False
+            except FileNotFoundError:
+                pass  # Удалена сборщиком мусора - записываем заново
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return digest, True
+    
+    def read_chunk(self, digest):
+        with open(self._chunk_path(digest), 'rb') as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Часть {digest} повреждена")
+        return data
+    
+    def store_file(self, src_path, manifest_path, info=None):
+        """
+        Запись файла в хранилище и манифеста вместо него
+        
+        Args:
+            src_path (str): Исходный файл
+            manifest_path (str): Куда записать манифест
+            info (dict): Дополнительные поля манифеста (agent_id и т.п.)
+        
+        Returns:
+            dict: size, sha256, chunks, new_chunks, new_bytes
+        """
+        file_hash = hashlib.sha256()
+        chunks = []
+        new_chunks = 0
+        new_bytes = 0
+        
+        with open(src_path, 'rb') as f:
+            for data in iter_chunks(f):
+                file_hash.update(data)
+                digest, is_new = self.put_chunk(data)
+                chunks.append([digest, len(data)])
+                if is_new:
+                    new_chunks += 1
+                    new_bytes += len(data)
+        
+        size = sum(length for _, length in chunks)
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'filename': os.path.basename(manifest_path)[:-len(MANIFEST_SUFFIX)],
+            'size': size,
+            'sha256': file_hash.hexdigest(),
+            'created': datetime.now().isoformat(),
+            'store': os.path.relpath(os.path.abspath(self.root), os.path.dirname(os.path.abspath(manifest_path))),
+            'chunks': chunks
+        }
+        manifest.update(info or {})
+        
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+        
+        return {
+            'size': size,
+            'sha256': manifest['sha256'],
+            'chunks': len(chunks),
+            'new_chunks': new_chunks,
+            'new_bytes': new_bytes
+        }
+    
+    def restore(self, manifest_path, dst_path):
+        """Сборка исходного файла по манифесту (с проверкой хэша)"""
+        manifest = read_manifest(manifest_path)
+        file_hash = hashlib.sha256()
+        
+        with open(f"{dst_path}.part", 'wb') as f:
+            for digest, _ in manifest['chunks']:
+                data = self.read_chunk(digest)
+                file_hash.update(data)
+                f.write(data)
+        
+        if file_hash.hexdigest() != manifest['sha256']:
+            os.remove(f"{dst_path}.part")
+            raise ValueError(f"Хэш собранного файла не совпадает: {manifest_path}")
+        os.replace(f"{dst_path}.part", dst_path)
+    
+    def _iter_manifests(self, manifest_dirs):
+        for folder in manifest_dirs:
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if name.endswith(MANIFEST_SUFFIX):
+                    yield read_manifest(os.path.join(folder, name))
+    
+    def _iter_chunk_files(self):
+        for entry in os.scandir(self.chunks_path):
+            if entry.is_dir():
+                for chunk in os.scandir(entry.path):
+                    if not chunk.name.endswith('.tmp'):
+                        yield chunk
+    
+    def get_stats(self, manifest_dirs):
+        """
+        Отчет о дедупликации
+        
+        Args:
+            manifest_dirs (list): Папки с манифестами
+        
+        Returns:
+            dict: manifests, logical_bytes, stored_bytes, unique_chunks, saved_bytes, dedup_ratio
+        """
+        manifests = 0
+        logical_bytes = 0
+        for manifest in self._iter_manifests(manifest_dirs):
+            manifests += 1
+            logical_bytes += manifest['size']
+        
+        unique_chunks = 0
+        stored_bytes = 0
+        for chunk in self._iter_chunk_files():
+            unique_chunks += 1
+            stored_bytes += chunk.stat().st_size
+        
+        return {
+            'manifests': manifests,
+            'logical_bytes': logical_bytes,
+            'stored_bytes': stored_bytes,
+            'unique_chunks': unique_chunks,
+            'saved_bytes': max(logical_bytes - stored_bytes, 0),
+            'dedup_ratio': logical_bytes / stored_bytes if stored_bytes else 1.0
+        }
+    
+    def collect_garbage(self, manifest_dirs, min_age=0):
+        """
+        Удаление частей, на которые не ссылается ни один манифест
+        
+        Часть новой загрузки записывается раньше ее манифеста: при min_age=0
+        запускать, когда в хранилище никто не пишет, иначе - с GC_MIN_AGE.
+        
+        Args:
+            manifest_dirs (list): Папки с манифестами
+            min_age (int): Части, измененные менее min_age секунд назад, не удаляются
+        
+        Returns:
+            tuple: (удалено частей, освобождено байт)
+        """
+        referenced = set()
+        for manifest in self._iter_manifests(manifest_dirs):
+            referenced.update(digest for digest, _ in manifest['chunks'])
+        
+        cutoff = time.time() - min_age
+        removed = 0
+        freed = 0
+        for chunk in self._iter_chunk_files():
+            if chunk.name not in referenced:
+                stat = chunk.stat()
+                if min_age and stat.st_mtime > cutoff:
+                    continue
+                freed += stat.st_size
+                os.remove(chunk.path)
+                removed += 1
+        
+        return removed, freed
+
+def format_report(stats):
+    """Текст отчета о дедупликации"""
+    mb = 1024 * 1024
+    return (
+        f"🧩 Дедупликация: манифестов {stats['manifests']}, частей {stats['unique_chunks']}\n"
+        f"   📦 Данных в архивах: {stats['logical_bytes'] / mb:.1f} MB\n"
+        f"   💾 Занято на диске: {stats['stored_bytes'] / mb:.1f} MB\n"
+        f"   ✂️  Сэкономлено: {stats['saved_bytes'] / mb:.1f} MB (коэффициент {stats['dedup_ratio']:.2f}x)"
+    )
+
+if __name__ == "__main__":
+    # python chunk_store.py [report|gc] [папка хранилища]
+    command = sys.argv[1] if len(sys.argv) > 1 else "report"
+    storage = sys.argv[2] if len(sys.argv) > 2 else "./secure_storage"
+    
+    store = ChunkStore(storage)
+    manifest_dirs = [f"{storage}/decrypted"]
+    
+    if command == "gc":
+        removed, freed = store.collect_garbage(manifest_dirs)
+        print(f"🧹 Удалено частей: {removed} ({freed / (1024 * 1024):.1f} MB)")
+    else:
+        print(format_report(store.get_stats(manifest_dirs)))
\ No newline at end of file
@@ -0,0 +1,199 @@
+"""
+Единственный поток записи в SQLite с пакетной вставкой
+Обработчики подключений кладут строки в очередь, поток записи
+группирует их в executemany и фиксирует транзакцию по размеру/времени
+"""
+import queue
+import sqlite3
+import threading
+import time
+
+# Служебные элементы очереди
+_STOP = object()
+
+class BatchedDBWriter:
+    def __init__(self, db_path, max_batch=500, flush_interval=0.5, queue_size=10000,
+                 stats_callback=None, stats_interval=60):
+        """
+        Инициализация потока записи
+        
+        Args:
+            db_path (str): Путь к базе данных
+            max_batch (int): Количество строк, после которого транзакция фиксируется
+            flush_interval (float): Максимальное время ожидания перед фиксацией (сек)
+            queue_size (int): Размер очереди (при заполнении отправители ждут)
+            stats_callback: Функция, которой периодически передаются счетчики
+            stats_interval (int): Интервал вызова stats_callback (сек)
+        """
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.stats_callback = stats_callback
+        self.stats_interval = stats_interval
+        
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = {
+            'rows_submitted': 0,
+            'rows_written': 0,
+            'rows_failed': 0,
+            'rows_dropped': 0,
+            'batches': 0,
+            'last_batch_rows': 0,
+            'last_batch_ms': 0.0,
+            'max_batch_ms': 0.0,
+            'total_batch_ms': 0.0
+        }
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._writer_loop, name="db-writer")
+        self._thread.daemon = True
+    
+    def start(self):
+        """Запуск потока записи"""
+        self._thread.start()
+        return self
+    
+    def submit(self, sql, params, timeout=5):
+        """Добавление одной строки в очередь записи"""
+        return self.submit_many(sql, [params], timeout)
+    
+    def submit_many(self, sql, rows, timeout=5):
+        """
+        Добавление нескольких строк одного запроса в очередь записи
+        
+        Returns:
+            bool: False если очередь переполнена и строки отброшены
+        """
+        if not rows:
+            return True
+        
+        try:
+            self.queue.put((sql, list(rows)), timeout=timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self.stats['rows_dropped'] += len(rows)
+            return False
+        
+        with self._stats_lock:
+            self.stats['rows_submitted'] += len(rows)
+        return True
+    
+    def flush(self, timeout=10):
+        """Ожидание записи всего, что уже стоит в очереди"""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+    
+    def close(self, timeout=30):
+        """Запись оставшихся данных и остановка потока"""
+        if self._thread.is_alive():
+            self.queue.put(_STOP)
+            self._thread.join(timeout)
+    
+    def get_stats(self):
+        """Счетчики очереди и пакетной записи"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        
+        stats['queue_depth'] = self.queue.qsize()
+        stats['queue_capacity'] = self.queue.maxsize
+        stats['avg_batch_ms'] = stats['total_batch_ms'] / stats['batches'] if stats['batches'] else 0.0
+        del stats['total_batch_ms']
+        return stats
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        return conn
+    
+    def _writer_loop(self):
+        """Цикл потока записи"""
+        conn = self._connect()
+        pending = {}  # sql -> строки, порядок запросов сохраняется
+        pending_rows = 0
+        batch_started = None
+        waiters = []
+        last_stats_time = time.time()
+        stopping = False
+        
+        while not stopping:
+            # Ждем не дольше, чем осталось до фиксации текущего пакета
+            if batch_started is None:
+                wait = 1.0
+            else:
+                wait = max(0.0, self.flush_interval - (time.time() - batch_started))
+            
+            try:
+                item = self.queue.get(timeout=wait)
+            except queue.Empty:
+                item = None
+            
+            if item is _STOP:
+                stopping = True
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            elif item is not None:
+                sql, rows = item
+                pending.setdefault(sql, []).extend(rows)
+                pending_rows += len(rows)
+                if batch_started is None:
+                    batch_started = time.time()
+            
+            flush_due = (
+                stopping or waiters or pending_rows >= self.max_batch or
+                (batch_started is not None and time.time() - batch_started >= self.flush_interval)
+            )
+            
+            if flush_due and pending:
+                self._write_batch(conn, pending, pending_rows)
+                pending = {}
+                pending_rows = 0
+                batch_started = None
+            
+            if flush_due:
+                for event in waiters:
+                    event.set()
+                waiters = []
+            
+            if self.stats_callback and time.time() - last_stats_time >= self.stats_interval:
+                last_stats_time = time.time()
+                try:
+                    self.stats_callback(self.get_stats())
+                except Exception:
+                    pass
+        
+        conn.close()
+    
+    def _write_batch(self, conn, pending, pending_rows):
+        """Запись пакета одной транзакцией"""
+        started = time.perf_counter()
+        written = 0
+        failed = 0
+        
+        try:
+            with conn:
+                for sql, rows in pending.items():
+                    conn.executemany(sql, rows)
+            written = pending_rows
+        except sqlite3.Error:
+            # Пакет откатился - пишем построчно, пропуская битые строки
+            for sql, rows in pending.items():
+                for row in rows:
+                    try:
+                        with conn:
+                            conn.execute(sql, row)
+                        written += 1
+                    except sqlite3.Error:
+                        failed += 1
+        
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        with self._stats_lock:
+            self.stats['rows_written'] += written
+            self.stats['rows_failed'] += failed
+            self.stats['batches'] += 1
+            self.stats['last_batch_rows'] = pending_rows
+            self.stats['last_batch_ms'] = elapsed_ms
+            self.stats['max_batch_ms'] = max(self.stats['max_batch_ms'], elapsed_ms)
+            self.stats['total_batch_ms'] += elapsed_ms
\ No newline at end of file
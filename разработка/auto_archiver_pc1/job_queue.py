@@ -0,0 +1,297 @@
+"""
+Очередь фоновых задач веб-интерфейса (SQLite)
+Задача - вид (kind) и параметры (JSON); выполняет ее обработчик вида
+в одном из ограниченного числа рабочих потоков. Очередь хранится в базе:
+после перезапуска задачи, ожидавшие запуска, остаются в очереди, а
+прерванные на ходу запускаются заново.
+
+Одинаковая задача (тот же вид и параметры или тот же ключ dedup), пока она
+ждет или выполняется, второй раз не ставится - возвращается уже
+существующая. Обработчик
+сообщает прогресс через job.progress(обработано, всего) и проверяет
+job.cancelled; задача, отмененная на ходу, завершается со статусом cancelled.
+"""
+import json
+import sqlite3
+import threading
+import traceback
+from datetime import datetime
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+ACTIVE_STATUSES = (PENDING, RUNNING)
+
+POLL_INTERVAL = 5  # Секунд между проверками базы, если новых задач не было
+KEEP_FINISHED = 500  # Завершенных задач в истории
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        params TEXT NOT NULL,
+        dedup_key TEXT NOT NULL,
+        status TEXT NOT NULL,
+        progress_done INTEGER NOT NULL DEFAULT 0,
+        progress_total INTEGER,
+        result TEXT,
+        error TEXT,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, id);
+    -- Одна активная задача на dedup_key
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active ON jobs(dedup_key) WHERE status IN ('pending', 'running');
+'''
+
+COLUMNS = ('id', 'kind', 'params', 'status', 'progress_done', 'progress_total', 'result', 'error',
+           'cancel_requested', 'created_at', 'started_at', 'finished_at')
+
+class Job:
+    """Выполняемая задача - то, что получает обработчик"""
+    
+    def __init__(self, queue, job_id, kind, params):
+        self.queue = queue
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+    
+    def progress(self, done, total=None):
+        """Прогресс: обработано done из total (total None - неизвестно)"""
+        self.queue._set_progress(self.id, done, total)
+    
+    @property
+    def cancelled(self):
+        """Запрошена отмена - обработчику пора остановиться"""
+        return self.id in self.queue._cancel_requested
+
+class JobQueue:
+    def __init__(self, db_path, handlers, workers=2):
+        """
+        Очередь задач
+        
+        Args:
+            db_path (str): Путь к базе очереди
+            handlers (dict): Вид задачи -> handler(job); возвращаемое значение
+                (JSON-совместимое) сохраняется как результат задачи
+            workers (int): Рабочих потоков - задач, выполняемых одновременно
+        """
+        self.db_path = db_path
+        self.handlers = handlers
+        self.workers = max(1, workers)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition()
+        self.threads = []
+        self._stopping = threading.Event()
+        self._cancel_requested = set()
+    
+    def start(self):
+        """Запуск рабочих потоков; задачи, прерванные перезапуском, возвращаются в очередь"""
+        with self.lock:
+            now = datetime.now().isoformat()
+            self.conn.execute(
+                'UPDATE jobs SET status = ?, finished_at = ? WHERE status = ? AND cancel_requested = 1',
+                (CANCELLED, now, RUNNING)
+            )
+            requeued = self.conn.execute(
+                'UPDATE jobs SET status = ?, progress_done = 0, started_at = NULL WHERE status = ?',
+                (PENDING, RUNNING)
+            ).rowcount
+            self.conn.commit()
+        if requeued:
+            print(f"🔁 Возвращено в очередь прерванных задач: {requeued}")
+        
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{number + 1}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+    
+    def stop(self, timeout=None):
+        """Остановка рабочих потоков (выполняемые задачи доделываются)"""
+        self._stopping.set()
+        with self.wakeup:
+            self.wakeup.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+    
+    def submit(self, kind, params=None, dedup=None):
+        """
+        Постановка задачи в очередь
+        
+        Args:
+            kind (str): Вид задачи
+            params (dict): Параметры (JSON-совместимые)
+            dedup (str): Ключ одинаковых задач этого вида вместо параметров целиком
+                ("" - одна активная задача вида, какими бы ни были параметры)
+        
+        Returns:
+            tuple: (задача (dict), True если поставлена новая, False если такая уже ждет или выполняется)
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Неизвестный вид задачи: {kind}")
+        
+        params_json = json.dumps(params or {}, sort_keys=True, ensure_ascii=False)
+        dedup_key = f"{kind}:{params_json if dedup is None else dedup}"
+        with self.lock:
+            try:
+                cursor = self.conn.execute(
+                    'INSERT INTO jobs (kind, params, dedup_key, status, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (kind, params_json, dedup_key, PENDING, datetime.now().isoformat())
+                )
+                self.conn.commit()
+                job_id, created = cursor.lastrowid, True
+            except sqlite3.IntegrityError:
+                # Такая задача уже активна (уникальный индекс idx_jobs_active)
+                self.conn.rollback()
+                job_id, = self.conn.execute(
+                    'SELECT id FROM jobs WHERE dedup_key = ? AND status IN (?, ?)',
+                    (dedup_key,) + ACTIVE_STATUSES
+                ).fetchone()
+                created = False
+        
+        if created:
+            with self.wakeup:
+                self.wakeup.notify()
+        return self.get(job_id), created
+    
+    def get(self, job_id):
+        """Задача по id (None если нет)"""
+        with self.lock:
+            row = self.conn.execute(f'SELECT {", ".join(COLUMNS)} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+    
+    def list(self, status=None, limit=50):
+        """Последние задачи (новые первыми), при status - только с этим статусом"""
+        query = f'SELECT {", ".join(COLUMNS)} FROM jobs'
+        params = []
+        if status:
+            query += ' WHERE status = ?'
+            params.append(status)
+        query += ' ORDER BY id DESC LIMIT ?'
+        params.append(max(1, int(limit)))
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        return [self._to_dict(row) for row in rows]
+    
+    def cancel(self, job_id):
+        """
+        Отмена задачи: ожидающая снимается сразу, выполняемая - когда обработчик это заметит
+        
+        Returns:
+            dict: Задача (None если нет)
+        """
+        with self.lock:
+            row = self.conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row[0] == PENDING:
+                self.conn.execute(
+                    'UPDATE jobs SET status = ?, cancel_requested = 1, finished_at = ? WHERE id = ? AND status = ?',
+                    (CANCELLED, datetime.now().isoformat(), job_id, PENDING)
+                )
+            elif row[0] == RUNNING:
+                self.conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ?', (job_id,))
+                self._cancel_requested.add(job_id)
+            self.conn.commit()
+        return self.get(job_id)
+    
+    def get_stats(self):
+        """Число задач по статусам"""
+        with self.lock:
+            rows = self.conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        stats = {status: 0 for status in (PENDING, RUNNING, DONE, FAILED, CANCELLED)}
+        stats.update(dict(rows))
+        stats['workers'] = self.workers
+        return stats
+    
+    def _worker(self):
+        while not self._stopping.is_set():
+            job = self._claim()
+            if job is None:
+                with self.wakeup:
+                    self.wakeup.wait(POLL_INTERVAL)
+                continue
+            self._run(job)
+    
+    def _claim(self):
+        """Самая старая ожидающая задача -> running (None если очередь пуста)"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT id, kind, params FROM jobs WHERE status = ? ORDER BY id LIMIT 1', (PENDING,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                'UPDATE jobs SET status = ?, started_at = ? WHERE id = ?',
+                (RUNNING, datetime.now().isoformat(), row[0])
+            )
+            self.conn.commit()
+        job_id, kind, params = row
+        return Job(self, job_id, kind, json.loads(params))
+    
+    def _run(self, job):
+        handler = self.handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise ValueError(f"Нет обработчика для задач вида {job.kind}")
+            result = handler(job)
+        except Exception as e:
+            if job.cancelled:
+                self._finish(job.id, CANCELLED)
+            else:
+                print(f"❌ Задача #{job.id} ({job.kind}) завершилась ошибкой: {e}")
+                traceback.print_exc()
+                self._finish(job.id, FAILED, error=str(e))
+        else:
+            self._finish(job.id, CANCELLED if job.cancelled else DONE, result=result)
+    
+    def _set_progress(self, job_id, done, total):
+        with self.lock:
+            self.conn.execute('UPDATE jobs SET progress_done = ?, progress_total = ? WHERE id = ?',
+                              (int(done), None if total is None else int(total), job_id))
+            self.conn.commit()
+    
+    def _finish(self, job_id, status, result=None, error=None):
+        with self.lock:
+            self.conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?',
+                (status, None if result is None else json.dumps(result, ensure_ascii=False, default=str),
+                 error, datetime.now().isoformat(), job_id)
+            )
+            # История завершенных задач ограничена
+            self.conn.execute(
+                'DELETE FROM jobs WHERE status NOT IN (?, ?) AND id NOT IN '
+                '(SELECT id FROM jobs WHERE status NOT IN (?, ?) ORDER BY id DESC LIMIT ?)',
+                ACTIVE_STATUSES + ACTIVE_STATUSES + (KEEP_FINISHED,)
+            )
+            self.conn.commit()
+            self._cancel_requested.discard(job_id)
+    
+    @staticmethod
+    def _to_dict(row):
+        job = dict(zip(COLUMNS, row))
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        done, total = job.pop('progress_done'), job.pop('progress_total')
+        job['progress'] = {
+            'done': done,
+            'total': total,
+            'percent': round(done / total * 100, 1) if total else None
+        }
+        return job
+    
+    def close(self):
+        """Остановка очереди (дожидается выполняемых задач) и закрытие базы"""
+        self.stop()
+        with self.lock:
+            self.conn.close()
\ No newline at end of file
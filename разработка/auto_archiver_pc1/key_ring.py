@@ -0,0 +1,134 @@
+"""
+Индекс ключей шифрования агентов
+Пакеты несут key_id (первые 8 байт SHA-256 ключа), сервер находит ключ
+и готовый объект Fernet одним обращением к словарю вместо перебора всех ключей
+"""
+import threading
+from cryptography.fernet import Fernet, InvalidToken
+from stream_crypto import key_id
+
+# Метка зашифрованных пакетов с идентификатором ключа: ENCKEYID::<key_id>::<токен Fernet>
+KEYED_PREFIX = b"ENCKEYID::"
+# Старая метка без идентификатора (ключ подбирается перебором)
+LEGACY_PREFIX = b"ENCRYPTED::"
+
+def split_keyed_packet(data):
+    """Разбор пакета ENCKEYID:: -> (key_id, токен)"""
+    raw_key_id, _, token = data[len(KEYED_PREFIX):].partition(b"::")
+    return raw_key_id.decode('ascii', errors='replace'), token
+
+class KeyRing:
+    """
+    Ключи агентов с индексом key_id -> (agent_id, Fernet)
+    
+    Поддерживает интерфейс словаря agent_id -> ключ (len, items, in),
+    поэтому заменяет прежний self.encryption_keys.
+    """
+    
+    def __init__(self, keys=None):
+        self._lock = threading.Lock()
+        self._keys = {}     # agent_id -> ключ
+        self._by_id = {}    # key_id -> agent_id
+        self._ciphers = {}  # key_id -> Fernet
+        
+        self.stats = {
+            'lookups': 0,
+            'failed_lookups': 0,
+            'legacy_packets': 0,
+            'legacy_attempts': 0
+        }
+        
+        for agent_id, key in (keys or {}).items():
+            self.add(agent_id, key)
+    
+    def add(self, agent_id, key):
+        """Добавление (или замена) ключа агента"""
+        key = key.strip()
+        with self._lock:
+            old_key = self._keys.get(agent_id)
+            if old_key is not None:
+                old_id = key_id(old_key)
+                self._by_id.pop(old_id, None)
+                self._ciphers.pop(old_id, None)
+            
+            self._keys[agent_id] = key
+            self._by_id[key_id(key)] = agent_id
+    
+    def __len__(self):
+        return len(self._keys)
+    
+    def __contains__(self, agent_id):
+        return agent_id in self._keys
+    
+    def items(self):
+        with self._lock:
+            return list(self._keys.items())
+    
+    def _count(self, found):
+        with self._lock:
+            self.stats['lookups'] += 1
+            if not found:
+                self.stats['failed_lookups'] += 1
+    
+    def agent_for(self, kid):
+        """agent_id владельца ключа (None если ключ неизвестен)"""
+        return self._by_id.get(kid)
+    
+    def get_key(self, kid):
+        """Ключ по key_id (None если неизвестен)"""
+        agent_id = self._by_id.get(kid)
+        self._count(agent_id is not None)
+        return self._keys.get(agent_id) if agent_id else None
+    
+    def get_cipher(self, kid):
+        """
+        Готовый Fernet по key_id
+        
+        Returns:
+            tuple: (agent_id, Fernet) или (None, None)
+        """
+        agent_id = self._by_id.get(kid)
+        self._count(agent_id is not None)
+        if agent_id is None:
+            return None, None
+        return agent_id, self._cached_cipher(kid, self._keys[agent_id])
+    
+    def get_agent_cipher(self, agent_id):
+        """Готовый Fernet для ключа агента (None если ключа нет)"""
+        key = self._keys.get(agent_id)
+        return self._cached_cipher(key_id(key), key) if key else None
+    
+    def _cached_cipher(self, kid, key):
+        cipher = self._ciphers.get(kid)
+        if cipher is None:
+            cipher = Fernet(key)
+            with self._lock:
+                self._ciphers[kid] = cipher
+        return cipher
+    
+    def trial_decrypt(self, token):
+        """
+        Подбор ключа перебором (пакеты старых агентов без key_id)
+        
+        Returns:
+            tuple: (agent_id, расшифрованные данные) или (None, None)
+        """
+        with self._lock:
+            self.stats['legacy_packets'] += 1
+        
+        for agent_id, key in self.items():
+            with self._lock:
+                self.stats['legacy_attempts'] += 1
+            try:
+                return agent_id, self._cached_cipher(key_id(key), key).decrypt(token)
+            except (InvalidToken, ValueError):
+                continue
+        
+        return None, None
+    
+    def get_stats(self):
+        """Счетчики обращений к ключам"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats['keys'] = len(self._keys)
+        return stats
\ No newline at end of file
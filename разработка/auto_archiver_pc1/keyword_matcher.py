@@ -0,0 +1,169 @@
+"""
+Поиск слов и фраз словарей в тексте сообщений (автомат Ахо-Корасик)
+Словарь - категории с терминами: отдельными словами или фразами из
+нескольких слов. Термины и текст одинаково приводятся к основам
+(stem - упрощенное отсечение русских окончаний), поэтому «хорошо»
+находит и «хороший», и «хорошая».
+
+Автомат строится один раз над последовательностями основ: на слово
+текста приходится один переход, сколько бы терминов ни было в словаре,
+так что время анализа от размера словаря почти не зависит.
+"""
+import hashlib
+import json
+import re
+from collections import Counter, deque
+
+WORD_RE = re.compile(r'\b[а-яa-z]+\b')
+
+# Окончания, отсекаемые от русских слов (сначала длинные)
+ENDINGS = tuple(sorted((
+    # прилагательные и причастия
+    'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие',
+    'ый', 'ий', 'ой', 'ей', 'ую', 'юю', 'ых', 'их', 'ым', 'им', 'ом', 'ем',
+    # существительные и наречия
+    'ами', 'ями', 'ах', 'ях', 'ов', 'ев', 'ам', 'ям', 'ия', 'ию', 'ью',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+    # глаголы
+    'ешь', 'ишь', 'ете', 'ите', 'ет', 'ит', 'ут', 'ют', 'ат', 'ят', 'ть'
+), key=len, reverse=True))
+REFLEXIVE = ('ся', 'сь')
+MIN_STEM = 3  # Короче основа не обрезается
+MEMO_LIMIT = 500_000  # Запомненных слов текста, после - память сбрасывается
+
+def stem(word):
+    """Основа слова: без возвратной частицы и окончания"""
+    word = word.replace('ё', 'е')
+    for suffix in REFLEXIVE:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            word = word[:-len(suffix)]
+            break
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+def tokenize(text):
+    """Текст -> слова в нижнем регистре (тот же разбор, что у анализа сообщений)"""
+    return WORD_RE.findall(text.lower())
+
+class KeywordMatcher:
+    """
+    Автомат Ахо-Корасик над основами слов
+    
+    Термин, повторенный в категории (или совпавший по основе с другим ее
+    термином), учитывается один раз; термины одной категории, которые
+    кончаются на одном слове («не люблю» и «люблю»), - тоже. Фраза
+    засчитывается, только если ее слова идут подряд.
+    
+    Args:
+        dictionaries (dict): Категория -> термины (слова или фразы)
+        stemming (bool): Сравнивать основы слов (False - слова целиком)
+    """
+    
+    def __init__(self, dictionaries, stemming=True):
+        self.stemming = stemming
+        self.categories = list(dictionaries)
+        self.tokens = {}        # основа -> номер
+        self.goto = [{}]        # переходы узла: номер основы -> узел
+        self.fail = [0]         # суффиксная ссылка узла
+        self.outputs = [()]     # категории терминов, оканчивающихся в узле
+        self.terms = 0
+        self._memo = {}         # слово текста -> номер основы (-1 - нет в словарях)
+        
+        fingerprint = hashlib.sha256(json.dumps([stemming, sorted(
+            (str(category), sorted(map(str, terms))) for category, terms in dictionaries.items()
+        )], ensure_ascii=False).encode('utf-8'))
+        self.fingerprint = fingerprint.hexdigest()[:16]
+        
+        for category, terms in dictionaries.items():
+            for term in terms:
+                self._add_term(category, str(term))
+        self._build_links()
+    
+    def _normalize(self, word):
+        return stem(word) if self.stemming else word
+    
+    def _add_term(self, category, term):
+        words = tokenize(term)
+        if not words:
+            return
+        
+        node = 0
+        for word in words:
+            token = self.tokens.setdefault(self._normalize(word), len(self.tokens))
+            child = self.goto[node].get(token)
+            if child is None:
+                child = self.goto[node][token] = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append(())
+            node = child
+        
+        if category not in self.outputs[node]:
+            self.outputs[node] += (category,)
+            self.terms += 1
+    
+    def _build_links(self):
+        """Суффиксные ссылки (обход в ширину); узел получает и категории своей ссылки"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and token not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(token, 0)
+                self.outputs[child] += tuple(category for category in self.outputs[self.fail[child]]
+                                             if category not in self.outputs[child])
+    
+    def _token(self, word):
+        if len(self._memo) >= MEMO_LIMIT:
+            self._memo.clear()
+        token = self._memo[word] = self.tokens.get(self._normalize(word), -1)
+        return token
+    
+    def count(self, words):
+        """
+        Вхождения терминов в последовательность слов
+        
+        Args:
+            words (list): Слова текста в нижнем регистре (см. tokenize)
+        
+        Returns:
+            dict: Категория -> число вхождений (пустой, если ничего не найдено)
+        """
+        tokens = list(map(self._memo.get, words))
+        if None in tokens:
+            # Основы считаются один раз на слово, дальше - из памяти
+            tokens = [self._token(word) if token is None else token for word, token in zip(words, tokens)]
+        if max(tokens, default=-1) < 0:
+            return {}
+        
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+        counts = Counter()
+        state = 0
+        for token in tokens:
+            if token < 0:
+                # Слова нет ни в одном термине - совпадение обрывается
+                state = 0
+                continue
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            if outputs[state]:
+                counts.update(outputs[state])
+        return counts
+    
+    def count_text(self, text):
+        """То же, что count, для произвольного текста"""
+        return self.count(tokenize(text))
+    
+    def __getstate__(self):
+        # Память слов текста не передается в другие процессы
+        state = self.__dict__.copy()
+        state['_memo'] = {}
+        return state
\ No newline at end of file
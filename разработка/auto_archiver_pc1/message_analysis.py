@@ -0,0 +1,813 @@
+"""
+Однопроходный анализ сообщений Telegram архива
+Каждый вид анализа - накопитель (accumulator): получает сообщения по одному
+и в конце выдает свой раздел результатов. Текст приводится к нижнему
+регистру и разбивается на слова один раз на сообщение, все накопители
+работают с уже подготовленным сообщением.
+
+Слова тональности и тем ищутся словарным автоматом (KeywordMatcher):
+встроенные словари плюс словари пользователя, с фразами и основами слов.
+
+Накопители можно объединять (merge) - частичные итоги, посчитанные
+по частям данных, складываются в общий результат.
+
+Если установлен NumPy, пользователи и аномалии считаются столбцовыми
+накопителями: сообщения копятся пачками, даты, отправители и длины
+текстов переводятся в массивы NumPy один раз на пачку, а гистограмма
+по часам, счетчики по пользователям и всплески считаются векторно.
+Результаты те же, что у обычных накопителей.
+"""
+import ast
+import re
+from collections import Counter
+from datetime import datetime
+
+from keyword_matcher import KeywordMatcher, WORD_RE
+
+try:
+    import numpy as np
+    NUMPY_ENABLED = True
+except ImportError:
+    np = None
+    NUMPY_ENABLED = False
+
+URL_RE = re.compile(r'https?://\S+')
+HASHTAG_RE = re.compile(r'#\w+')
+MENTION_RE = re.compile(r'@\w+')
+
+POSITIVE_WORDS = frozenset({
+    'хорошо', 'отлично', 'прекрасно', 'замечательно', 'супер', 'класс', 'отличный',
+    'хороший', 'прекрасный', 'замечательный', 'великолепно', 'превосходно',
+    'спасибо', 'благодарю', 'рад', 'доволен', 'счастлив', 'успех', 'победа',
+    'любовь', 'нравится', 'восхитительно', 'потрясающе', 'здорово'
+})
+
+NEGATIVE_WORDS = frozenset({
+    'плохо', 'ужасно', 'отвратительно', 'кошмар', 'проблема', 'ошибка',
+    'неправильно', 'нельзя', 'запрещено', 'опасно', 'страшно', 'грустно',
+    'печально', 'разочарован', 'злой', 'сердитый', 'ненавижу', 'не люблю',
+    'проигрыш', 'поражение', 'провал', 'катастрофа', 'беда'
+})
+
+STOP_WORDS = frozenset({
+    'и', 'в', 'не', 'на', 'что', 'это', 'как', 'но', 'а', 'или', 'у', 'за', 'к', 'до', 'по', 'из',
+    'от', 'же', 'бы', 'для', 'то', 'вы', 'он', 'она', 'они', 'мы', 'вас', 'ваш', 'их', 'те', 'та',
+    'тот', 'этот', 'такой', 'такие', 'свой'
+})
+
+# Версия анализа - увеличивать при изменении накопителей (сбрасывает кэш результатов).
+# Итоги столбцовых и обычных накопителей не складываются - кэш у них раздельный
+ANALYZER_VERSION = "5np" if NUMPY_ENABLED else 4
+
+# Категории словарного автомата
+POSITIVE = "positive"
+NEGATIVE = "negative"
+TOPIC_PREFIX = "topic:"
+
+MIN_CONTENT_WORD = 3  # Короче - не учитываются в частых словах
+LONG_MESSAGE = 1000
+SPAM_MIN_MESSAGES = 50
+SPAM_MAX_SPAN = 3600
+COLUMN_BATCH = 100_000  # Сообщений в пачке столбцового накопителя
+
+EPOCH = datetime(1970, 1, 1)
+# Позиции цифр в YYYY-MM-DDTHH:MM:SS+HH:MM
+DATE_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18, 20, 21, 23, 24]
+MONTH_DAYS = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+_UNPARSED = object()
+
+def build_matcher(dictionaries=None):
+    """
+    Словарный автомат анализа: POSITIVE_WORDS/NEGATIVE_WORDS и словари пользователя
+    
+    Args:
+        dictionaries (dict): {"positive": [...], "negative": [...], "topics": {тема: [...]}} -
+            слова и фразы добавляются к встроенным
+    
+    Returns:
+        KeywordMatcher
+    """
+    dictionaries = dictionaries or {}
+    categories = {
+        POSITIVE: list(POSITIVE_WORDS) + list(dictionaries.get('positive', [])),
+        NEGATIVE: list(NEGATIVE_WORDS) + list(dictionaries.get('negative', []))
+    }
+    for topic, terms in dictionaries.get('topics', {}).items():
+        categories[f"{TOPIC_PREFIX}{topic}"] = list(terms)
+    return KeywordMatcher(categories)
+
+_default_matcher = None
+
+def default_matcher():
+    """Автомат встроенных словарей (строится один раз на процесс)"""
+    global _default_matcher
+    if _default_matcher is None:
+        _default_matcher = build_matcher()
+    return _default_matcher
+
+def parse_date(value):
+    """Дата сообщения (ISO, возможно с Z) или None"""
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def epoch_seconds(date):
+    """
+    Момент даты для сравнения: (секунды от 1970-01-01, вид даты)
+    
+    Вид как в date_columns: 0 - даты нет, 1 - без часового пояса (секунды
+    по местному времени), 2 - с поясом (секунды UTC).
+    """
+    if date is None:
+        return 0.0, 0
+    seconds = (date.replace(tzinfo=None) - EPOCH).total_seconds()
+    utc_offset = date.utcoffset()
+    if utc_offset is None:
+        return seconds, 1
+    return seconds - utc_offset.total_seconds(), 2
+
+class PreparedMessage:
+    """Сообщение, подготовленное для накопителей (разбор делается один раз)"""
+    
+    __slots__ = ('text', 'lower', 'words', 'raw_date', 'matcher', '_date', '_keywords')
+    
+    def __init__(self, msg, matcher=None):
+        text = msg.get('text')
+        self.text = str(text) if text else None
+        self.lower = self.text.lower() if self.text else None
+        self.words = WORD_RE.findall(self.lower) if self.lower else []
+        self.raw_date = msg.get('date')
+        self.matcher = matcher or default_matcher()
+        self._date = _UNPARSED
+        self._keywords = None
+    
+    @property
+    def keywords(self):
+        """Вхождения словарей: {категория: число} - ищутся при первом обращении"""
+        if self._keywords is None:
+            self._keywords = self.matcher.count(self.words) if self.words else {}
+        return self._keywords
+    
+    @property
+    def date(self):
+        """Дата сообщения (datetime или None) - разбирается при первом обращении"""
+        if self._date is _UNPARSED:
+            self._date = parse_date(self.raw_date) if self.raw_date else None
+        return self._date
+
+class Accumulator:
+    """
+    Базовый накопитель
+    
+    key - раздел результатов, который заполняет накопитель.
+    """
+    
+    key = None
+    
+    def add(self, msg, prepared):
+        raise NotImplementedError
+    
+    def merge(self, other):
+        """Добавление частичного итога того же накопителя"""
+        raise NotImplementedError
+    
+    def result(self):
+        raise NotImplementedError
+
+class BasicStats(Accumulator):
+    """Базовая статистика"""
+    
+    key = "basic_stats"
+    
+    def __init__(self):
+        self.messages = 0
+        self.users = set()
+        self.first_date = None
+        self.last_date = None
+        self.total_length = 0
+        self.media_count = 0
+    
+    def add(self, msg, prepared):
+        self.messages += 1
+        if 'sender_id' in msg:
+            self.users.add(str(msg['sender_id']))
+        
+        date = msg.get('date')
+        if date and isinstance(date, str):
+            day = date.split('T')[0]
+            if self.first_date is None or day < self.first_date:
+                self.first_date = day
+            if self.last_date is None or day > self.last_date:
+                self.last_date = day
+        
+        if prepared.text:
+            self.total_length += len(prepared.text)
+        if msg.get('media_type'):
+            self.media_count += 1
+    
+    def merge(self, other):
+        self.messages += other.messages
+        self.users |= other.users
+        for day in (other.first_date, other.last_date):
+            if day is not None:
+                self.first_date = day if self.first_date is None else min(self.first_date, day)
+                self.last_date = day if self.last_date is None else max(self.last_date, day)
+        self.total_length += other.total_length
+        self.media_count += other.media_count
+    
+    def result(self):
+        stats = {
+            "total_messages": self.messages,
+            "unique_users": len(self.users),
+            "time_period": {},
+            "media_count": self.media_count,
+            "avg_message_length": self.total_length / self.messages if self.messages else 0
+        }
+        
+        if self.first_date is not None:
+            stats["time_period"] = {
+                "first_date": self.first_date,
+                "last_date": self.last_date,
+                "days_span": (datetime.fromisoformat(self.last_date) - datetime.fromisoformat(self.first_date)).days
+            }
+        
+        return stats
+
+class Sentiment(Accumulator):
+    """
+    Анализ тональности (упрощенный, по словарям)
+    
+    Вхождение фразы - одно слово тональности, остальные слова нейтральные.
+    """
+    
+    key = "sentiment_analysis"
+    
+    def __init__(self):
+        self.positive = 0
+        self.negative = 0
+        self.neutral = 0
+    
+    def add(self, msg, prepared):
+        words = prepared.words
+        if not words:
+            return
+        keywords = prepared.keywords
+        positive = keywords.get(POSITIVE, 0)
+        negative = keywords.get(NEGATIVE, 0)
+        self.positive += positive
+        self.negative += negative
+        self.neutral += max(0, len(words) - positive - negative)
+    
+    def merge(self, other):
+        self.positive += other.positive
+        self.negative += other.negative
+        self.neutral += other.neutral
+    
+    def result(self):
+        sentiment = {
+            "positive_words": self.positive,
+            "negative_words": self.negative,
+            "neutral_words": self.neutral,
+            "sentiment_score": 0,
+            "dominant_emotion": "neutral"
+        }
+        
+        total_words = self.positive + self.negative + self.neutral
+        if total_words > 0:
+            score = self.positive / total_words - self.negative / total_words
+            sentiment["sentiment_score"] = score
+            if score > 0.1:
+                sentiment["dominant_emotion"] = "positive"
+            elif score < -0.1:
+                sentiment["dominant_emotion"] = "negative"
+        
+        return sentiment
+
+class Content(Accumulator):
+    """
+    Анализ контента: частые слова, ссылки, хэштеги, упоминания
+    
+    Считаются все слова подряд, короткие и стоп-слова отбрасываются только
+    в result() - так подсчет идет внутри Counter, без фильтра на каждое слово.
+    """
+    
+    key = "content_analysis"
+    
+    def __init__(self):
+        self.words = Counter()
+        self.urls = 0
+        self.hashtags = 0
+        self.mentions = 0
+    
+    def add(self, msg, prepared):
+        if not prepared.lower:
+            return
+        
+        self.words.update(prepared.words)
+        
+        # Быстрая проверка символа перед регулярным выражением - у большинства сообщений их нет
+        lower = prepared.lower
+        if 'http' in lower:
+            self.urls += len(URL_RE.findall(lower))
+        if '#' in lower:
+            self.hashtags += len(HASHTAG_RE.findall(lower))
+        if '@' in lower:
+            self.mentions += len(MENTION_RE.findall(lower))
+    
+    def merge(self, other):
+        self.words.update(other.words)
+        self.urls += other.urls
+        self.hashtags += other.hashtags
+        self.mentions += other.mentions
+    
+    def result(self):
+        return {
+            "common_words": Counter({
+                word: count for word, count in self.words.items()
+                if len(word) >= MIN_CONTENT_WORD and word not in STOP_WORDS
+            }).most_common(20),
+            "message_frequency": {},
+            "urls_count": self.urls,
+            "hashtags_count": self.hashtags,
+            "mentions_count": self.mentions
+        }
+
+class Topics(Accumulator):
+    """Темы из словарей пользователя: упоминания и сообщения с темой"""
+    
+    key = "topic_analysis"
+    
+    def __init__(self):
+        self.mentions = Counter()
+        self.messages = Counter()
+    
+    def add(self, msg, prepared):
+        if not prepared.words:
+            return
+        for category, count in prepared.keywords.items():
+            if category.startswith(TOPIC_PREFIX):
+                topic = category[len(TOPIC_PREFIX):]
+                self.mentions[topic] += count
+                self.messages[topic] += 1
+    
+    def merge(self, other):
+        self.mentions.update(other.mentions)
+        self.messages.update(other.messages)
+    
+    def result(self):
+        return {
+            "topics": [
+                {"topic": topic, "mentions": mentions, "messages": self.messages[topic]}
+                for topic, mentions in self.mentions.most_common()
+            ]
+        }
+
+class Users(Accumulator):
+    """Анализ пользователей: самые активные и активность по часам"""
+    
+    key = "user_analysis"
+    
+    def __init__(self):
+        self.messages = 0
+        self.posters = Counter()
+        self.hours = Counter()
+    
+    def add(self, msg, prepared):
+        self.messages += 1
+        if 'sender_id' in msg:
+            self.posters[str(msg['sender_id'])] += 1
+        if prepared.date is not None:
+            self.hours[prepared.date.hour] += 1
+    
+    def merge(self, other):
+        self.messages += other.messages
+        self.posters.update(other.posters)
+        self.hours.update(other.hours)
+    
+    def result(self):
+        return {
+            "top_posters": self.posters.most_common(10),
+            "user_activity": dict(self.hours),
+            "avg_messages_per_user": self.messages / len(self.posters) if self.posters else 0
+        }
+
+class Anomalies(Accumulator):
+    """
+    Обнаружение аномалий
+    
+    Возможный спам - больше SPAM_MIN_MESSAGES сообщений пользователя
+    подряд за SPAM_MAX_SPAN секунд: по отсортированным моментам его
+    сообщений t всплеск есть, если t[i + SPAM_MIN_MESSAGES] - t[i] < SPAM_MAX_SPAN.
+    Постоянный участник, однажды устроивший всплеск, тоже находится.
+    Все даты пользователя должны быть разобраны и одного вида (с поясом
+    и без - не сравниваются). Очень длинные сообщения перечисляются по порядку.
+    """
+    
+    key = "anomalies"
+    
+    def __init__(self):
+        self.users = {}  # sender_id -> [сообщений, моменты сообщений, вид дат (0 - разные или не разобраны)]
+        self.long_messages = []
+    
+    def add(self, msg, prepared):
+        if 'sender_id' in msg and 'date' in msg:
+            entry = self.users.get(msg['sender_id'])
+            if entry is None:
+                entry = self.users[msg['sender_id']] = [0, [], None]
+            seconds, kind = epoch_seconds(prepared.date)
+            self._add_times(entry, 1, [seconds], kind)
+        
+        if prepared.text and len(prepared.text) > LONG_MESSAGE:
+            self.long_messages.append({
+                "type": "very_long_message",
+                "message_id": msg.get('id', 'unknown'),
+                "length": len(prepared.text)
+            })
+    
+    def _add_times(self, entry, count, times, kind):
+        entry[0] += count
+        if entry[2] is not None and entry[2] != kind:
+            kind = 0
+        entry[2] = kind
+        if kind:
+            entry[1].extend(times)
+        else:
+            entry[1] = []  # Всплеск у такого пользователя не ищется - моменты не нужны
+    
+    def merge(self, other):
+        for user_id, (count, times, kind) in other.users.items():
+            entry = self.users.get(user_id)
+            if entry is None:
+                self.users[user_id] = [count, list(times), kind]
+            else:
+                self._add_times(entry, count, times, kind)
+        self.long_messages.extend(other.long_messages)
+    
+    def result(self):
+        anomalies = []
+        for user_id, (count, times, kind) in self.users.items():
+            if count > SPAM_MIN_MESSAGES and kind:
+                times = sorted(times)
+                # Самый короткий отрезок из SPAM_MIN_MESSAGES + 1 сообщений подряд
+                time_span = min(times[i + SPAM_MIN_MESSAGES] - times[i] for i in range(len(times) - SPAM_MIN_MESSAGES))
+                if time_span < SPAM_MAX_SPAN:
+                    anomalies.append({
+                        "type": "possible_spam",
+                        "user_id": user_id,
+                        "messages_count": count,
+                        "time_span_seconds": time_span
+                    })
+        
+        return anomalies + self.long_messages
+
+def days_from_civil(year, month, day):
+    """Номер дня от 1970-01-01 по году, месяцу и дню (векторно, григорианский календарь)"""
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+def date_columns(values):
+    """
+    ISO даты -> столбцы NumPy: (час, секунды, вид даты)
+    
+    Даты вида YYYY-MM-DDTHH:MM:SS[Z|±HH:MM] (так их пишет архиватор)
+    разбираются векторно по кодам символов, остальные - по одной через
+    parse_date. Вид: 0 - даты нет или она не разобрана, 1 - без часового
+    пояса, 2 - с поясом. Секунды у дат с поясом - UTC, без пояса - по
+    местному времени; час - всегда по местному времени даты (как datetime.hour).
+    """
+    count = len(values)
+    hours = np.zeros(count, dtype=np.int64)
+    seconds = np.zeros(count, dtype=np.float64)
+    kinds = np.zeros(count, dtype=np.int8)
+    if not count:
+        return hours, seconds, kinds
+    
+    text = np.array(values)
+    if text.dtype.kind != 'U':
+        text = np.array([value if isinstance(value, str) else '' for value in values])
+    if text.dtype.itemsize // 4 < 25:
+        text = text.astype('U25')
+    # Строки как матрица кодов символов (недостающие символы - нули)
+    chars = text.view(np.uint32).reshape(count, -1)
+    length = np.count_nonzero(chars, axis=1)
+    
+    digits = chars[:, DATE_DIGITS].astype(np.int64) - ord('0')
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    hour = digits[:, 8] * 10 + digits[:, 9]
+    minute = digits[:, 10] * 10 + digits[:, 11]
+    second = digits[:, 12] * 10 + digits[:, 13]
+    offset_hours = digits[:, 14] * 10 + digits[:, 15]
+    offset_minutes = digits[:, 16] * 10 + digits[:, 17]
+    
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = np.array(MONTH_DAYS)[np.clip(month, 0, 12)] + ((month == 2) & leap)
+    valid = (((digits[:, :14] >= 0) & (digits[:, :14] <= 9)).all(axis=1) &
+             (chars[:, 4] == ord('-')) & (chars[:, 7] == ord('-')) &
+             ((chars[:, 10] == ord('T')) | (chars[:, 10] == ord(' '))) &
+             (chars[:, 13] == ord(':')) & (chars[:, 16] == ord(':')) &
+             (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days) &
+             (hour < 24) & (minute < 60) & (second < 60))
+    naive = valid & (length == 19)
+    zulu = valid & (length == 20) & (chars[:, 19] == ord('Z'))
+    offset = (valid & (length == 25) & ((chars[:, 19] == ord('+')) | (chars[:, 19] == ord('-'))) &
+              (chars[:, 22] == ord(':')) & ((digits[:, 14:] >= 0) & (digits[:, 14:] <= 9)).all(axis=1) &
+              (offset_hours < 24) & (offset_minutes < 60))
+    fast = naive | zulu | offset
+    
+    local = days_from_civil(year, month, day) * 86400 + hour * 3600 + minute * 60 + second
+    shift = np.where(offset, offset_hours * 3600 + offset_minutes * 60, 0)
+    shift = np.where(chars[:, 19] == ord('-'), -shift, shift)
+    hours[fast] = hour[fast]
+    seconds[fast] = (local - shift)[fast]
+    kinds[naive] = 1
+    kinds[zulu | offset] = 2
+    
+    for i in np.flatnonzero(~fast & (length > 0)):
+        date = parse_date(values[i])
+        if date is None:
+            continue
+        hours[i] = date.hour
+        seconds[i], kinds[i] = epoch_seconds(date)
+    
+    return hours, seconds, kinds
+
+def sender_column(senders, typed=False):
+    """
+    id отправителей -> массив NumPy: целые, а если встречаются другие типы - строки
+    
+    typed=True - строки repr: 1 и "1" остаются разными отправителями, как
+    ключи словаря (значение восстанавливает _label_value). repr целого
+    совпадает с str, поэтому такие столбцы складываются с целыми.
+    """
+    column = np.array(senders)
+    if column.dtype.kind not in 'iu':
+        column = np.array([repr(sender) if typed else str(sender) for sender in senders])
+    return column
+
+def first_seen_codes(labels):
+    """
+    Уникальные значения в порядке первого появления и код каждого элемента
+    
+    Returns:
+        tuple: (уникальные значения, коды - индексы в них)
+    """
+    unique, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return unique[order], rank[inverse.reshape(-1)]
+
+def _join_labels(left, right):
+    if left.dtype.kind in 'iu' and right.dtype.kind in 'iu':
+        return np.concatenate([left, right])
+    return np.concatenate([left.astype(str), right.astype(str)])
+
+def _label_value(label, typed=False):
+    if isinstance(label, np.integer):
+        return int(label)
+    return ast.literal_eval(str(label)) if typed else str(label)
+
+def group_starts(codes, groups):
+    """Порядок, сортирующий codes, и начало каждой группы в нем (все коды 0..groups-1 должны встречаться)"""
+    order = np.argsort(codes, kind='stable')
+    return order, np.searchsorted(codes[order], np.arange(groups))
+
+class MessageColumns:
+    """
+    Пачка сообщений для столбцовых накопителей
+    
+    Столбцы NumPy (даты, длины текстов) строятся при первом обращении
+    и общие для всех накопителей пачки.
+    """
+    
+    def __init__(self, messages):
+        self.messages = messages
+        self._dates = None
+        self._lengths = None
+    
+    def dates(self):
+        """(час, секунды, вид даты) каждого сообщения - см. date_columns"""
+        if self._dates is None:
+            self._dates = date_columns([msg.get('date') for msg in self.messages])
+        return self._dates
+    
+    def text_lengths(self):
+        """Длина текста каждого сообщения (0 - текста нет)"""
+        if self._lengths is None:
+            self._lengths = np.array([len(str(msg['text'])) if msg.get('text') else 0 for msg in self.messages],
+                                     dtype=np.int64)
+        return self._lengths
+
+class ColumnarAccumulator(Accumulator):
+    """
+    Накопитель по столбцам NumPy
+    
+    Получает не сообщения по одному, а пачки по COLUMN_BATCH (MessageColumns)
+    и сворачивает их векторно.
+    """
+    
+    def add(self, msg, prepared):
+        self.add_columns(MessageColumns([msg]))
+    
+    def add_columns(self, columns):
+        raise NotImplementedError
+
+class ColumnarUsers(ColumnarAccumulator):
+    """Анализ пользователей (как Users): счетчики по пользователям и по часам считаются NumPy"""
+    
+    key = "user_analysis"
+    
+    def __init__(self):
+        self.messages = 0
+        self.senders = np.zeros(0, dtype=np.int64)  # В порядке первого появления
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.hours = np.zeros(24, dtype=np.int64)
+    
+    def add_columns(self, columns):
+        self.messages += len(columns.messages)
+        senders = [msg['sender_id'] for msg in columns.messages if 'sender_id' in msg]
+        if senders:
+            self._add_counts(sender_column(senders), np.ones(len(senders), dtype=np.int64))
+        hours, _, kinds = columns.dates()
+        self.hours += np.bincount(hours[kinds > 0], minlength=24)
+    
+    def _add_counts(self, labels, counts):
+        self.senders, codes = first_seen_codes(_join_labels(self.senders, labels))
+        self.counts = np.bincount(codes, weights=np.concatenate([self.counts, counts]),
+                                  minlength=len(self.senders)).astype(np.int64)
+    
+    def merge(self, other):
+        self.messages += other.messages
+        self._add_counts(other.senders, other.counts)
+        self.hours += other.hours
+    
+    def result(self):
+        # Устойчивая сортировка - при равенстве раньше тот, кто раньше появился (как Counter.most_common)
+        top = np.argsort(-self.counts, kind='stable')[:10]
+        return {
+            "top_posters": [(str(_label_value(self.senders[i])), int(self.counts[i])) for i in top],
+            "user_activity": {hour: int(count) for hour, count in enumerate(self.hours) if count},
+            "avg_messages_per_user": self.messages / len(self.senders) if len(self.senders) else 0
+        }
+
+class ColumnarAnomalies(ColumnarAccumulator):
+    """
+    Обнаружение аномалий (как Anomalies) по столбцам NumPy
+    
+    На каждое сообщение хранятся код отправителя, момент и вид даты
+    (около 17 байт). В result сообщения сортируются по отправителю и
+    моменту (np.lexsort), и всплеск ищется сдвигом на SPAM_MIN_MESSAGES
+    внутри серии одного отправителя. Отправители разных типов (1 и "1")
+    считаются раздельно, user_id - исходного типа.
+    """
+    
+    key = "anomalies"
+    
+    def __init__(self):
+        self.senders = np.zeros(0, dtype=np.int64)  # В порядке первого появления
+        # Пачки столбцов: код отправителя (индекс в senders), момент и вид даты сообщения
+        self.codes = []
+        self.seconds = []
+        self.kinds = []
+        self.long_messages = []
+    
+    def add_columns(self, columns):
+        messages = columns.messages
+        dated = np.array([('sender_id' in msg and 'date' in msg) for msg in messages], dtype=bool)
+        if dated.any():
+            _, seconds, kinds = columns.dates()
+            senders = sender_column([msg['sender_id'] for msg in messages if 'sender_id' in msg and 'date' in msg],
+                                    typed=True)
+            self._add_messages(senders, [np.arange(len(senders))], [seconds[dated]], [kinds[dated]])
+        
+        lengths = columns.text_lengths()
+        for i in np.flatnonzero(lengths > LONG_MESSAGE):
+            self.long_messages.append({
+                "type": "very_long_message",
+                "message_id": messages[i].get('id', 'unknown'),
+                "length": int(lengths[i])
+            })
+    
+    def _add_messages(self, senders, codes, seconds, kinds):
+        """Пачки сообщений отправителей senders[codes]"""
+        known = len(self.senders)
+        # Прежние отправители сохраняют свои коды - в начале порядка первого появления
+        self.senders, joined = first_seen_codes(_join_labels(self.senders, senders))
+        self.codes.extend(joined[known:][batch] for batch in codes)
+        self.seconds.extend(seconds)
+        self.kinds.extend(kinds)
+    
+    def merge(self, other):
+        self._add_messages(other.senders, other.codes, other.seconds, other.kinds)
+        self.long_messages.extend(other.long_messages)
+    
+    def result(self):
+        groups = len(self.senders)
+        anomalies = []
+        if groups:
+            codes = np.concatenate(self.codes)
+            seconds = np.concatenate(self.seconds)
+            kinds = np.concatenate(self.kinds)
+            # По отправителю, внутри - по времени
+            order = np.lexsort((seconds, codes))
+            codes, seconds, kinds = codes[order], seconds[order], kinds[order]
+            starts = np.searchsorted(codes, np.arange(groups))
+            counts = np.diff(np.append(starts, len(codes)))
+            # Все даты пользователя разобраны и одного вида (с поясом и без - не сравниваются)
+            valid = np.minimum.reduceat(kinds, starts) > 0
+            valid &= np.minimum.reduceat(kinds, starts) == np.maximum.reduceat(kinds, starts)
+            
+            # Самый короткий отрезок из SPAM_MIN_MESSAGES + 1 сообщений подряд одного отправителя
+            shortest = np.full(groups, np.inf)
+            span = seconds[SPAM_MIN_MESSAGES:] - seconds[:len(seconds) - SPAM_MIN_MESSAGES]
+            same = codes[SPAM_MIN_MESSAGES:] == codes[:len(codes) - SPAM_MIN_MESSAGES]
+            np.minimum.at(shortest, codes[SPAM_MIN_MESSAGES:][same], span[same])
+            
+            anomalies = [{
+                "type": "possible_spam",
+                "user_id": _label_value(self.senders[i], typed=True),
+                "messages_count": int(counts[i]),
+                "time_span_seconds": float(shortest[i])
+            } for i in np.flatnonzero(valid & (shortest < SPAM_MAX_SPAN))]
+        
+        return anomalies + self.long_messages
+
+if NUMPY_ENABLED:
+    DEFAULT_ACCUMULATORS = (BasicStats, Sentiment, Content, Topics, ColumnarUsers, ColumnarAnomalies)
+else:
+    DEFAULT_ACCUMULATORS = (BasicStats, Sentiment, Content, Topics, Users, Anomalies)
+
+class MessageAnalysis:
+    """
+    Анализ потока сообщений за один проход
+    
+    Обычные накопители получают сообщения по одному, столбцовые - пачками
+    по COLUMN_BATCH (перед слиянием, результатом и передачей в другой
+    процесс неполная пачка досылается).
+    
+    Args:
+        accumulators: Классы накопителей (по умолчанию DEFAULT_ACCUMULATORS)
+        matcher: Словарный автомат (по умолчанию - встроенные словари, см. build_matcher)
+    """
+    
+    def __init__(self, accumulators=DEFAULT_ACCUMULATORS, matcher=None):
+        self.accumulators = [accumulator() for accumulator in accumulators]
+        self.matcher = matcher or default_matcher()
+        self.row_accumulators = [a for a in self.accumulators if not isinstance(a, ColumnarAccumulator)]
+        self.column_accumulators = [a for a in self.accumulators if isinstance(a, ColumnarAccumulator)]
+        self.messages = 0
+        self._pending = []
+    
+    def add(self, msg):
+        prepared = PreparedMessage(msg, self.matcher)
+        self.messages += 1
+        for accumulator in self.row_accumulators:
+            accumulator.add(msg, prepared)
+        if self.column_accumulators:
+            self._pending.append(msg)
+            if len(self._pending) >= COLUMN_BATCH:
+                self._flush()
+    
+    def _flush(self):
+        if self._pending:
+            columns = MessageColumns(self._pending)
+            for accumulator in self.column_accumulators:
+                accumulator.add_columns(columns)
+            self._pending = []
+    
+    def feed(self, messages):
+        for msg in messages:
+            self.add(msg)
+        return self
+    
+    def merge(self, other):
+        """Добавление частичного итога (набор накопителей должен совпадать)"""
+        self._flush()
+        other._flush()
+        self.messages += other.messages
+        for accumulator, partial in zip(self.accumulators, other.accumulators):
+            accumulator.merge(partial)
+        return self
+    
+    def results(self):
+        """Разделы результатов: {key накопителя: результат}"""
+        self._flush()
+        return {accumulator.key: accumulator.result() for accumulator in self.accumulators}
+    
+    def __getstate__(self):
+        self._flush()
+        # Автомат с частичными итогами не передается - для слияния он не нужен
+        state = self.__dict__.copy()
+        state['matcher'] = None
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.matcher = default_matcher()
\ No newline at end of file
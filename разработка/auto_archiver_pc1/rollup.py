@@ -0,0 +1,434 @@
+"""
+Сжатие истории мониторинга по уровням детализации
+Фоновое задание сворачивает сырые замеры в таблицы rollup_1m/1h/1d
+(min/max/avg/p95 на агента) и удаляет данные старше срока хранения уровня
+"""
+import math
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from itertools import groupby
+
+# Метрики: имя -> (таблица сырых данных, колонка)
+METRICS = {
+    'cpu': ('cpu_monitoring', 'cpu_percent'),
+    'ram': ('memory_monitoring', 'ram_percent'),
+    'disk': ('disk_monitoring', 'disk_percent'),
+}
+
+# Уровни от мелкого к крупному: имя -> (размер корзины, длина префикса timestamp, дополнение до времени)
+TIERS = {
+    '1m': (timedelta(minutes=1), 16, ':00'),
+    '1h': (timedelta(hours=1), 13, ':00:00'),
+    '1d': (timedelta(days=1), 10, ' 00:00:00'),
+}
+
+# Сроки хранения: сырые данные и каждый уровень
+DEFAULT_RETENTION = {
+    'raw': timedelta(days=2),
+    '1m': timedelta(days=7),
+    '1h': timedelta(days=90),
+    '1d': timedelta(days=730),
+}
+
+# Таблицы, которые только очищаются по сроку хранения сырых данных
+RETENTION_ONLY_TABLES = ('processes',)
+
+# Минимум точек, который должен дать выбранный уровень за запрошенный период
+MIN_POINTS = 60
+
+DELETE_CHUNK = 5000
+
+ROLLUP_SCHEMA = [
+    f'''
+    CREATE TABLE IF NOT EXISTS rollup_{tier} (
+        agent_id TEXT,
+        metric TEXT,
+        bucket TIMESTAMP,
+        min_value REAL,
+        max_value REAL,
+        avg_value REAL,
+        p95_value REAL,
+        samples INTEGER,
+        PRIMARY KEY (agent_id, metric, bucket)
+    ) WITHOUT ROWID
+    ''' for tier in TIERS
+] + [
+    f'CREATE INDEX IF NOT EXISTS idx_rollup_{tier}_bucket ON rollup_{tier} (bucket)' for tier in TIERS
+] + [
+    # Граница, до которой уровень уже посчитан (все корзины раньше нее завершены)
+    '''
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        tier TEXT PRIMARY KEY,
+        watermark TIMESTAMP
+    )
+    ''',
+]
+
+def floor_time(value, tier):
+    """Начало корзины уровня, в которую попадает время"""
+    if tier == '1m':
+        return value.replace(second=0, microsecond=0)
+    if tier == '1h':
+        return value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def ceil_time(value, tier):
+    """Начало первой корзины уровня, целиком лежащей не раньше времени"""
+    start = floor_time(value, tier)
+    return start if start == value else start + TIERS[tier][0]
+
+def percentile(sorted_values, fraction):
+    """Процентиль по рангу для отсортированного списка"""
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+def choose_tier(hours, retention=None):
+    """
+    Самый крупный уровень, который покрывает период и дает не меньше MIN_POINTS точек
+    
+    Если такого нет - сырые данные, когда их срок хранения покрывает период,
+    иначе самый подробный уровень, который его покрывает, а для периода длиннее
+    хранения всех уровней - уровень с самым долгим хранением (сырые данные
+    хранятся пару дней и почти ничего бы не дали).
+    
+    Returns:
+        str: '1d', '1h', '1m' или 'raw'
+    """
+    retention = retention or DEFAULT_RETENTION
+    window = timedelta(hours=hours)
+    
+    for tier in reversed(list(TIERS)):
+        bucket = TIERS[tier][0]
+        if retention[tier] >= window and window / bucket >= MIN_POINTS:
+            return tier
+    if retention['raw'] >= window:
+        return 'raw'
+    for tier in TIERS:
+        if retention[tier] >= window:
+            return tier
+    return max(TIERS, key=lambda tier: retention[tier])
+
+def get_watermark(cursor, tier):
+    """Граница посчитанных данных уровня (None если уровень еще не считался)"""
+    cursor.execute('SELECT watermark FROM rollup_state WHERE tier = ?', (tier,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def raw_outside_buckets(start, tier, watermark):
+    """
+    Диапазоны сырых замеров периода, не покрытые корзинами уровня
+    
+    Returns:
+        list: (от, до) - до None означает «до конца»; сначала хвост после границы
+    """
+    raw_from = max(str(start), watermark)
+    ranges = [(raw_from, None)]
+    head_end = min(str(ceil_time(start, tier)), raw_from)
+    if head_end > str(start):
+        ranges.append((start, head_end))
+    return ranges
+
+def get_window_stats(cursor, agent_id, metric, hours, retention=None):
+    """
+    Среднее, максимум и количество замеров метрики агента за период
+    
+    Берет корзины выбранного уровня, целиком лежащие в периоде, до границы
+    уровня и сырые замеры вне этих корзин: после границы и от начала периода
+    до первой корзины (если они еще хранятся).
+    
+    Returns:
+        dict: avg, max, samples, tier
+    """
+    table, column = METRICS[metric]
+    tier = choose_tier(hours, retention)
+    start = datetime.now() - timedelta(hours=hours)
+    
+    total = 0.0
+    maximum = None
+    samples = 0
+    raw_ranges = [(start, None)]
+    
+    watermark = get_watermark(cursor, tier) if tier != 'raw' else None
+    if watermark:
+        cursor.execute(f'''
+            SELECT SUM(avg_value * samples), MAX(max_value), SUM(samples)
+            FROM rollup_{tier}
+            WHERE agent_id = ? AND metric = ? AND bucket >= ? AND bucket < ?
+        ''', (agent_id, metric, ceil_time(start, tier), watermark))
+        tier_sum, tier_max, tier_samples = cursor.fetchone()
+        if tier_samples:
+            total, maximum, samples = tier_sum, tier_max, tier_samples
+        raw_ranges = raw_outside_buckets(start, tier, watermark)
+    
+    # Начало периода до первой корзины и хвост, который еще не попал в корзины
+    for raw_from, raw_to in raw_ranges:
+        cursor.execute(f'''
+            SELECT SUM({column}), MAX({column}), COUNT({column})
+            FROM {table}
+            WHERE agent_id = ? AND timestamp >= ? AND timestamp < COALESCE(?, '9999')
+        ''', (agent_id, raw_from, raw_to))
+        raw_sum, raw_max, raw_samples = cursor.fetchone()
+        if raw_samples:
+            total += raw_sum
+            maximum = raw_max if maximum is None else max(maximum, raw_max)
+            samples += raw_samples
+    
+    return {
+        'avg': total / samples if samples else None,
+        'max': maximum,
+        'samples': samples,
+        'tier': tier
+    }
+
+def get_series(cursor, agent_id, metric, hours, retention=None):
+    """
+    Ряд значений метрики агента за период (новые значения первыми)
+    
+    Returns:
+        tuple: (уровень, список словарей timestamp/avg/min/max/p95)
+    """
+    table, column = METRICS[metric]
+    tier = choose_tier(hours, retention)
+    start = datetime.now() - timedelta(hours=hours)
+    
+    series = []
+    
+    watermark = get_watermark(cursor, tier) if tier != 'raw' else None
+    raw_ranges = raw_outside_buckets(start, tier, watermark) if watermark else [(start, None)]
+    
+    def add_raw(raw_from, raw_to):
+        cursor.execute(f'''
+            SELECT timestamp, {column}
+            FROM {table}
+            WHERE agent_id = ? AND timestamp >= ? AND timestamp < COALESCE(?, '9999')
+            ORDER BY timestamp DESC
+        ''', (agent_id, raw_from, raw_to))
+        for timestamp, value in cursor.fetchall():
+            series.append({'timestamp': timestamp, 'avg': value, 'min': value, 'max': value, 'p95': value})
+    
+    add_raw(*raw_ranges[0])
+    
+    if watermark:
+        # Корзина, начатая до периода, содержит замеры вне его - берутся только целые
+        cursor.execute(f'''
+            SELECT bucket, avg_value, min_value, max_value, p95_value
+            FROM rollup_{tier}
+            WHERE agent_id = ? AND metric = ? AND bucket >= ? AND bucket < ?
+            ORDER BY bucket DESC
+        ''', (agent_id, metric, ceil_time(start, tier), watermark))
+        for bucket, avg_value, min_value, max_value, p95_value in cursor.fetchall():
+            series.append({'timestamp': bucket, 'avg': avg_value, 'min': min_value,
+                           'max': max_value, 'p95': p95_value})
+    
+    for raw_range in raw_ranges[1:]:
+        add_raw(*raw_range)
+    
+    return tier, series
+
+class RollupJob:
+    """
+    Фоновое задание свертки и очистки истории мониторинга
+    
+    Каждый уровень считается из сырых замеров только по завершенным корзинам
+    (с запасом late_margin на опоздавшие данные из истории агента).
+    Сырые данные не удаляются, пока их не свернули все уровни.
+    """
+    
+    def __init__(self, db_path, retention=None, interval=60, retention_interval=3600,
+                 late_margin=300, log_callback=None):
+        """
+        Args:
+            db_path (str): Путь к базе данных
+            retention (dict): Сроки хранения ('raw', '1m', '1h', '1d' -> timedelta)
+            interval (int): Период свертки (сек)
+            retention_interval (int): Период очистки старых данных (сек)
+            late_margin (int): Задержка перед сверткой корзины (сек)
+            log_callback: Функция для вывода сообщений
+        """
+        self.db_path = db_path
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.interval = interval
+        self.retention_interval = retention_interval
+        self.late_margin = timedelta(seconds=late_margin)
+        self.log_callback = log_callback or print
+        
+        self.stats = {
+            'runs': 0,
+            'buckets_written': 0,
+            'rows_deleted': 0,
+            'last_run_ms': 0.0,
+            'errors': 0
+        }
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="rollup")
+        self._thread.daemon = True
+    
+    def start(self):
+        """Запуск фонового задания"""
+        self._thread.start()
+        return self
+    
+    def stop(self, timeout=30):
+        """Остановка фонового задания"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+    
+    def get_stats(self):
+        """Счетчики свертки и очистки"""
+        return dict(self.stats)
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        return conn
+    
+    def _loop(self):
+        last_retention = 0
+        
+        while not self._stop.is_set():
+            with_retention = time.time() - last_retention >= self.retention_interval
+            try:
+                self.run_once(with_retention=with_retention)
+                if with_retention:
+                    last_retention = time.time()
+            except Exception as e:
+                self.stats['errors'] += 1
+                self.log_callback(f"❌ Ошибка свертки истории: {e}")
+            
+            self._stop.wait(self.interval)
+    
+    def run_once(self, now=None, with_retention=True):
+        """
+        Один проход: свертка всех уровней и (опционально) очистка
+        
+        Returns:
+            dict: buckets - записано корзин, deleted - удалено строк
+        """
+        now = now or datetime.now()
+        started = time.perf_counter()
+        conn = self._connect()
+        
+        try:
+            buckets = 0
+            for tier in TIERS:
+                buckets += self._roll_tier(conn, tier, now)
+            
+            deleted = self._apply_retention(conn, now) if with_retention else 0
+        finally:
+            conn.close()
+        
+        self.stats['runs'] += 1
+        self.stats['buckets_written'] += buckets
+        self.stats['rows_deleted'] += deleted
+        self.stats['last_run_ms'] = (time.perf_counter() - started) * 1000
+        
+        if deleted:
+            self.log_callback(f"🧹 История мониторинга: удалено {deleted} устаревших строк")
+        
+        return {'buckets': buckets, 'deleted': deleted}
+    
+    def _roll_tier(self, conn, tier, now):
+        """Свертка всех завершенных корзин уровня после его границы"""
+        bucket_size = TIERS[tier][0]
+        end = floor_time(now - self.late_margin, tier)
+        
+        watermark = get_watermark(conn.cursor(), tier)
+        if watermark:
+            start = datetime.fromisoformat(watermark)
+        else:
+            # Первый запуск: начинаем с самых старых данных, но не раньше срока хранения уровня
+            oldest = [conn.execute(f'SELECT MIN(timestamp) FROM {table}').fetchone()[0]
+                      for table, _ in METRICS.values()]
+            oldest = [datetime.fromisoformat(value) for value in oldest if value]
+            if not oldest:
+                return 0
+            start = floor_time(max(min(oldest), now - self.retention[tier]), tier)
+        
+        # Окна по часу (или по корзине для дневного уровня) - память ограничена одним окном
+        step = max(bucket_size, timedelta(hours=1))
+        written = 0
+        
+        while start < end:
+            window_end = min(start + step, end)
+            with conn:
+                written += self._roll_window(conn, tier, start, window_end)
+                conn.execute('INSERT OR REPLACE INTO rollup_state (tier, watermark) VALUES (?, ?)',
+                             (tier, str(window_end)))
+            start = window_end
+        
+        return written
+    
+    def _roll_window(self, conn, tier, start, end):
+        """Свертка сырых замеров [start, end) в корзины уровня"""
+        _, prefix_length, suffix = TIERS[tier]
+        rows = []
+        
+        for metric, (table, column) in METRICS.items():
+            cursor = conn.execute(f'''
+                SELECT agent_id, substr(timestamp, 1, {prefix_length}) as bucket, {column}
+                FROM {table}
+                WHERE timestamp >= ? AND timestamp < ? AND {column} IS NOT NULL
+                ORDER BY agent_id, bucket
+            ''', (str(start), str(end)))
+            
+            for (agent_id, bucket), group in groupby(cursor, key=lambda row: (row[0], row[1])):
+                values = sorted(row[2] for row in group)
+                rows.append((
+                    agent_id,
+                    metric,
+                    bucket + suffix,
+                    values[0],
+                    values[-1],
+                    sum(values) / len(values),
+                    percentile(values, 0.95),
+                    len(values)
+                ))
+        
+        conn.executemany(f'''
+            INSERT OR REPLACE INTO rollup_{tier}
+            (agent_id, metric, bucket, min_value, max_value, avg_value, p95_value, samples)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        return len(rows)
+    
+    def _delete_before(self, conn, table, column, cutoff):
+        """Удаление строк старше cutoff порциями (запись не блокируется надолго)"""
+        deleted = 0
+        while True:
+            with conn:
+                cursor = conn.execute(f'''
+                    DELETE FROM {table} WHERE rowid IN (
+                        SELECT rowid FROM {table} WHERE {column} < ? LIMIT {DELETE_CHUNK}
+                    )
+                ''', (str(cutoff),))
+            deleted += cursor.rowcount
+            if cursor.rowcount < DELETE_CHUNK:
+                return deleted
+    
+    def _apply_retention(self, conn, now):
+        """Удаление данных старше срока хранения каждого уровня"""
+        deleted = 0
+        
+        # Сырые метрики удаляются только после свертки всеми уровнями
+        raw_cutoff = now - self.retention['raw']
+        watermarks = [get_watermark(conn.cursor(), tier) for tier in TIERS]
+        if all(watermarks):
+            metrics_cutoff = min([raw_cutoff] + [datetime.fromisoformat(w) for w in watermarks])
+            for table, _ in METRICS.values():
+                deleted += self._delete_before(conn, table, 'timestamp', metrics_cutoff)
+        
+        for table in RETENTION_ONLY_TABLES:
+            deleted += self._delete_before(conn, table, 'timestamp', raw_cutoff)
+        
+        for tier in TIERS:
+            # WITHOUT ROWID: удаляем по индексу bucket одним запросом
+            with conn:
+                cursor = conn.execute(f'DELETE FROM rollup_{tier} WHERE bucket < ?',
+                                      (str(now - self.retention[tier]),))
+            deleted += cursor.rowcount
+        
+        return deleted
\ No newline at end of file
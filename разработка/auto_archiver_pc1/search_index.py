@@ -0,0 +1,424 @@
+"""
+Полнотекстовый поиск по сообщениям всех архивов (SQLite FTS5)
+Сообщения каждого расшифрованного архива загружаются в search_index.db
+один раз. Запись идет пакетами по INSERT_BATCH сообщений, каждый пакет -
+отдельная короткая транзакция (в базу пишут и сервер, и веб-интерфейс,
+долгая транзакция одного из них упирается в "database is locked" у
+другого). Архив помечается загруженным (archives.done) последним пакетом;
+прерванная загрузка при следующей попытке проходит архив заново. Повторы
+(инкрементальные архивы канала содержат прежние сообщения, пакеты
+прерванной загрузки) отсекаются по (channel, message_id).
+    
+    messages      - channel, message_id, date, date_utc, day, sender, text, archive
+    messages_fts  - FTS5 по text, channel и day (external content, заполняется триггером)
+    archives      - какие архивы загружены (done = 1) или загружаются
+
+Поиск читает через отдельное соединение: в режиме WAL чтение не ждет
+записи, поэтому индексация не задерживает поиск.
+
+Канал и день (YYYYMMDD) тоже проиндексированы в FTS5: фильтр по ним
+пересекает списки вхождений внутри FTS5, а не перебирает все найденные
+по частому слову сообщения.
+
+Фильтр по дате сравнивает date_utc - дату, приведенную при загрузке к UTC
+в записи одной длины (YYYY-MM-DDTHH:MM:SS.ffffff): исходные даты бывают
+с поясом и без, как строки они не сравниваются. Дата без пояса считается UTC.
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta, timezone
+
+from ai_analyzer import MessageStream, is_message_member
+from chunk_store import open_archive, archive_size, is_archive_name
+from message_analysis import parse_date
+
+INSERT_BATCH = 5000
+LOCK_RETRIES = 5  # Попыток записать пакет, пока база занята другим процессом
+LOCK_RETRY_DELAY = 2  # Секунд перед первым повтором (дальше вдвое больше)
+MAX_PAGE_SIZE = 100
+MAX_FILTER_DAYS = 366  # Более широкий диапазон дат фильтруется только по messages.date_utc
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY,
+        channel TEXT NOT NULL,
+        message_id INTEGER NOT NULL,
+        date TEXT,
+        date_utc TEXT,
+        day TEXT,
+        sender TEXT,
+        text TEXT NOT NULL,
+        archive TEXT,
+        UNIQUE (channel, message_id)
+    );
+    
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        text, channel, day, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    );
+    
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, text, channel, day) VALUES (new.id, new.text, new.channel, new.day);
+    END;
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, text, channel, day)
+        VALUES ('delete', old.id, old.text, old.channel, old.day);
+    END;
+    
+    CREATE TABLE IF NOT EXISTS archives (
+        name TEXT PRIMARY KEY,
+        size INTEGER,
+        messages INTEGER,
+        indexed_at TEXT,
+        done INTEGER NOT NULL DEFAULT 1
+    );
+'''
+
+# После миграции: в индексе прежней версии столбца date_utc еще нет
+INDEXES = '''
+    CREATE INDEX IF NOT EXISTS idx_messages_date_utc ON messages(date_utc);
+    CREATE INDEX IF NOT EXISTS idx_messages_channel_date_utc ON messages(channel, date_utc);
+'''
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+def fts_query(text):
+    """
+    Запрос пользователя -> выражение FTS5 по тексту сообщений
+    
+    Каждое слово берется в кавычки (спецсимволы FTS5 не ломают запрос),
+    слова объединяются по И. Слово со звездочкой на конце - поиск по префиксу.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        if word:
+            terms.append(_quote(word) + ('*' if prefix else ''))
+    return f"text : ({' '.join(terms)})" if terms else ""
+
+def _message_day(value):
+    """День сообщения для индекса: YYYYMMDD"""
+    return value[:10].replace('-', '') if isinstance(value, str) and len(value) >= 10 else None
+
+def utc_date(value):
+    """Дата сообщения для сравнения (date_utc): UTC, YYYY-MM-DDTHH:MM:SS.ffffff; None если не разобрать"""
+    parsed = parse_date(value)
+    if parsed is None:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat(timespec='microseconds')
+
+def _date_bound(value, end=False):
+    """Граница фильтра по дате (как date_utc): YYYY-MM-DD (для конца - весь день) или ISO дата-время"""
+    if not value:
+        return None
+    if len(value) == 10:
+        day = date.fromisoformat(value)
+        if end:
+            day += timedelta(days=1)
+        return datetime.combine(day, datetime.min.time()).isoformat(timespec='microseconds')
+    bound = utc_date(value)
+    if bound is None:
+        raise ValueError(f"Неверная дата: {value}")
+    return bound
+
+class SearchIndex:
+    def __init__(self, db_path):
+        """
+        Открытие (создание) индекса
+        
+        Args:
+            db_path (str): Путь к базе индекса
+        """
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(archives)')]
+        if 'done' not in columns:
+            # Индекс прежней версии: все записанные архивы загружены целиком
+            self.conn.execute('ALTER TABLE archives ADD COLUMN done INTEGER NOT NULL DEFAULT 1')
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(messages)')]
+        if 'date_utc' not in columns:
+            # Индекс прежней версии: дата для фильтров вычисляется по уже загруженным сообщениям
+            self.conn.create_function('utc_date', 1, utc_date, deterministic=True)
+            self.conn.execute('ALTER TABLE messages ADD COLUMN date_utc TEXT')
+            self.conn.execute('UPDATE messages SET date_utc = utc_date(date) WHERE date IS NOT NULL')
+            self.conn.execute('DROP INDEX IF EXISTS idx_messages_date')
+            self.conn.execute('DROP INDEX IF EXISTS idx_messages_channel_date')
+        self.conn.executescript(INDEXES)
+        self.conn.commit()
+        self.lock = threading.Lock()
+        
+        # Соединение для поиска (запись идет через self.conn)
+        self.read_conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.read_lock = threading.Lock()
+    
+    def is_indexed(self, archive_path):
+        name = os.path.basename(archive_path)
+        with self.read_lock:
+            row = self.read_conn.execute('SELECT size, done FROM archives WHERE name = ?', (name,)).fetchone()
+        return row is not None and row[1] == 1 and row[0] == archive_size(archive_path)
+    
+    def index_archive(self, archive_path):
+        """
+        Загрузка сообщений архива в индекс (повторно архив не загружается)
+        
+        Returns:
+            int: Сколько новых сообщений добавлено (None если архив уже в индексе)
+        """
+        if self.is_indexed(archive_path):
+            return None
+        
+        with open_archive(archive_path) as archive_file, zipfile.ZipFile(archive_file, 'r') as zip_ref:
+            members = [info.filename for info in zip_ref.infolist()
+                       if not info.is_dir() and is_message_member(info.filename)]
+        
+        name = os.path.basename(archive_path)
+        size = archive_size(archive_path)
+        # Архив отмечается начатым; прерванная загрузка того же архива продолжает счет сообщений
+        self._write(lambda: self.conn.execute('''
+            INSERT INTO archives (name, size, messages, indexed_at, done) VALUES (?, ?, 0, NULL, 0)
+            ON CONFLICT(name) DO UPDATE SET
+                messages = CASE WHEN done = 0 AND size = excluded.size THEN messages ELSE 0 END,
+                size = excluded.size, indexed_at = NULL, done = 0
+        ''', (name, size)))
+        
+        added = 0
+        for member in members:
+            # Канал - папка канала внутри архива
+            channel = os.path.basename(os.path.dirname(member)) or name
+            batch = []
+            for msg in MessageStream(archive_path, [member]):
+                if not msg.get('text') or msg.get('id') is None:
+                    continue
+                sender = msg.get('sender_id')
+                msg_date = msg.get('date')
+                batch.append((channel, msg['id'], msg_date, utc_date(msg_date), _message_day(msg_date),
+                              None if sender is None else str(sender), str(msg['text']), name))
+                if len(batch) >= INSERT_BATCH:
+                    added += self._insert(name, batch)
+                    batch = []
+            added += self._insert(name, batch)
+        
+        self._write(lambda: self.conn.execute(
+            'UPDATE archives SET indexed_at = ?, done = 1 WHERE name = ?', (datetime.now().isoformat(), name)
+        ))
+        return added
+    
+    def _write(self, statements):
+        """
+        Короткая транзакция записи: statements() и commit
+        
+        Пока базу держит другой процесс ("database is locked" после timeout),
+        транзакция повторяется LOCK_RETRIES раз с растущей паузой.
+        """
+        for attempt in range(LOCK_RETRIES):
+            with self.lock:
+                try:
+                    result = statements()
+                    self.conn.commit()
+                    return result
+                except sqlite3.OperationalError as e:
+                    self.conn.rollback()
+                    if 'locked' not in str(e) or attempt == LOCK_RETRIES - 1:
+                        raise
+                except Exception:
+                    self.conn.rollback()
+                    raise
+            time.sleep(LOCK_RETRY_DELAY * 2 ** attempt)
+    
+    def _insert(self, name, rows):
+        if not rows:
+            return 0
+        
+        def insert():
+            cursor = self.conn.executemany(
+                'INSERT OR IGNORE INTO messages (channel, message_id, date, date_utc, day, sender, text, archive) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+            # Пропущенные повторы в rowcount не входят
+            self.conn.execute('UPDATE archives SET messages = messages + ? WHERE name = ?', (cursor.rowcount, name))
+            return cursor.rowcount
+        
+        return self._write(insert)
+    
+    def sync(self, archives_dir):
+        """
+        Загрузка всех еще не проиндексированных архивов папки
+        
+        Архивы, загрузка которых не удалась, ставятся в конец очереди и
+        пробуются еще раз после остальных (до LOCK_RETRIES проходов).
+        
+        Returns:
+            tuple: (загружено архивов, добавлено сообщений)
+        """
+        archives = 0
+        messages = 0
+        if not os.path.isdir(archives_dir):
+            return archives, messages
+        
+        pending = [file for file in sorted(os.listdir(archives_dir)) if is_archive_name(file)]
+        for attempt in range(LOCK_RETRIES):
+            if attempt:
+                time.sleep(LOCK_RETRY_DELAY * 2 ** attempt)
+            
+            failed = []
+            for file in pending:
+                try:
+                    added = self.index_archive(os.path.join(archives_dir, file))
+                except zipfile.BadZipFile:
+                    continue  # Не zip - искать нечего
+                except Exception as e:
+                    print(f"⚠️ Не удалось проиндексировать {file}: {e}")
+                    failed.append(file)
+                    continue
+                if added is not None:
+                    archives += 1
+                    messages += added
+                    print(f"🔎 Проиндексирован {file}: {added} сообщений")
+            
+            pending = failed
+            if not pending:
+                break
+        
+        return archives, messages
+    
+    def search(self, query, channel=None, date_from=None, date_to=None, page=1, per_page=20, order='recent'):
+        """
+        Поиск сообщений
+        
+        Args:
+            query (str): Слова для поиска (все должны встретиться, 'слово*' - префикс)
+            channel (str): Только этот канал
+            date_from (str): С даты (YYYY-MM-DD или ISO дата-время)
+            date_to (str): По дату включительно
+            page (int): Страница (с 1)
+            per_page (int): Результатов на странице (не больше MAX_PAGE_SIZE)
+            order (str): 'recent' - сначала новые поступления (быстро при частых словах),
+                'relevance' - по релевантности (bm25)
+        
+        Returns:
+            dict: results, page, per_page, has_more, took_ms
+        """
+        started = time.perf_counter()
+        per_page = max(1, min(int(per_page), MAX_PAGE_SIZE))
+        page = max(1, int(page))
+        
+        match = fts_query(query or "")
+        if not match:
+            return {'results': [], 'page': page, 'per_page': per_page, 'has_more': False, 'took_ms': 0}
+        
+        # Фильтры проверяются и в FTS5 (быстро), и по столбцам messages (точно).
+        # Унарный + не дает планировщику взять индексы messages вместо FTS5
+        conditions = ['messages_fts MATCH ?']
+        params = []
+        if channel:
+            match += f" AND channel : ({_quote(channel)})"
+            conditions.append('+m.channel = ?')
+            params.append(channel)
+        if date_from:
+            conditions.append('+m.date_utc >= ?')
+            params.append(_date_bound(date_from))
+        if date_to:
+            # Для дня - все его сообщения, для дата-времени - включительно
+            conditions.append('+m.date_utc < ?' if len(date_to) == 10 else '+m.date_utc <= ?')
+            params.append(_date_bound(date_to, end=True))
+        if date_from or date_to:
+            first, last = self._day_range(date_from, date_to)
+            days = (last - first).days + 1 if first and last else 0
+            if 0 < days <= MAX_FILTER_DAYS:
+                # day - день по записи даты в архиве (в своем поясе), а не по UTC: берется
+                # на день шире с обеих сторон, точную границу проверяет date_utc
+                first -= timedelta(days=1)
+                days += 2
+                day_terms = " OR ".join(_quote((first + timedelta(days=i)).strftime('%Y%m%d')) for i in range(days))
+                match += f" AND day : ({day_terms})"
+        params.insert(0, match)
+        
+        order_by = 'rank' if order == 'relevance' else 'messages_fts.rowid DESC'
+        # На одну строку больше страницы - чтобы узнать, есть ли следующая, без COUNT(*)
+        params += [per_page + 1, (page - 1) * per_page]
+        
+        with self.read_lock:
+            rows = self.read_conn.execute(f'''
+                SELECT m.channel, m.message_id, m.date, m.sender, m.archive,
+                       snippet(messages_fts, 0, '[', ']', '…', 16)
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                WHERE {' AND '.join(conditions)}
+                ORDER BY {order_by}
+                LIMIT ? OFFSET ?
+            ''', params).fetchall()
+        
+        results = [{
+            'channel': channel_name,
+            'message_id': message_id,
+            'date': message_date,
+            'sender_id': sender,
+            'archive': archive,
+            'snippet': snippet
+        } for channel_name, message_id, message_date, sender, archive, snippet in rows[:per_page]]
+        
+        return {
+            'results': results,
+            'page': page,
+            'per_page': per_page,
+            'has_more': len(rows) > per_page,
+            'took_ms': round((time.perf_counter() - started) * 1000, 2)
+        }
+    
+    def _day_range(self, date_from, date_to):
+        """Дни фильтра; недостающая граница - крайняя дата в индексе (по idx_messages_date_utc)"""
+        if not date_from or not date_to:
+            with self.read_lock:
+                # Два подзапроса: MIN и MAX в одном SELECT перебирают весь индекс
+                first, last = self.read_conn.execute(
+                    'SELECT (SELECT MIN(date_utc) FROM messages), (SELECT MAX(date_utc) FROM messages)'
+                ).fetchone()
+            date_from = date_from or first
+            date_to = date_to or last
+        if not date_from or not date_to:
+            return None, None
+        return date.fromisoformat(date_from[:10]), date.fromisoformat(date_to[:10])
+    
+    def get_stats(self):
+        """Размер индекса: загруженных архивов, сообщений, каналов"""
+        with self.read_lock:
+            archives, = self.read_conn.execute('SELECT COUNT(*) FROM archives WHERE done = 1').fetchone()
+            # MAX(id) вместо COUNT(*) - мгновенно и на десятках миллионов строк (строки не удаляются)
+            messages, = self.read_conn.execute('SELECT MAX(id) FROM messages').fetchone()
+            channels = [row[0] for row in self.read_conn.execute('SELECT DISTINCT channel FROM messages ORDER BY channel')]
+        return {'archives': archives, 'messages': messages or 0, 'channels': channels}
+    
+    def close(self):
+        with self.read_lock:
+            self.read_conn.close()
+        with self.lock:
+            self.conn.close()
+
+if __name__ == "__main__":
+    # python search_index.py sync [папка архивов] | python search_index.py search <запрос>
+    storage = "./secure_storage"
+    index = SearchIndex(f"{storage}/search_index.db")
+    command = sys.argv[1] if len(sys.argv) > 1 else "sync"
+    
+    if command == "search":
+        found = index.search(" ".join(sys.argv[2:]))
+        for result in found['results']:
+            print(f"[{result['date']}] {result['channel']} #{result['message_id']}: {result['snippet']}")
+        print(f"⏱️ {found['took_ms']} мс{' (есть еще)' if found['has_more'] else ''}")
+    else:
+        archives_dir = sys.argv[2] if len(sys.argv) > 2 else f"{storage}/decrypted"
+        archives, messages = index.sync(archives_dir)
+        print(f"✅ Загружено архивов: {archives}, сообщений: {messages}")
+    
+    index.close()
\ No newline at end of file
@@ -0,0 +1,438 @@
+"""
+Потоковый прием защищенных файлов (заголовок SECURE_STM)
+Пакет: заголовок (10 байт) + длина метаданных (20 байт) + JSON метаданных,
+затем кадры [длина 4 байта][данные]; кадр нулевой длины завершает передачу.
+Кадры пишутся на диск по мере получения, хэши считаются на лету -
+память не зависит от размера файла.
+
+Кодировки данных (metadata['encoding']):
+    aesgcm-stream - контейнер stream_crypto, кадры - его части подряд
+    fernet-chunks - каждый кадр отдельный токен Fernet
+    plain-chunks  - без шифрования
+
+Возобновляемая загрузка (в метаданных есть upload_id):
+    сервер сразу отвечает [длина 20 байт][JSON] с числом уже сохраненных
+    кадров (frames) и stream_id начатого контейнера, агент досылает
+    оставшиеся кадры. Принятое копится в uploads/<upload_id>.part,
+    состояние - в uploads/<upload_id>.json (обновляется после каждого
+    целого кадра). Под итоговым именем файл появляется только после
+    полной проверки хэша. Если ключ известен, но данные не расшифровались
+    или хэш не совпал, принятое удаляется (StreamFormatError) - следующая
+    попытка начнется заново.
+"""
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import time
+from cryptography.fernet import InvalidToken
+from stream_crypto import StreamDecryptor, StreamFormatError, HEADER_SIZE, read_header
+from key_ring import KeyRing
+
+STREAM_HEADER = "SECURE_STM"
+FRAME_LENGTH = struct.Struct('>I')
+
+MAX_METADATA_SIZE = 64 * 1024
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+READ_BLOCK = 1024 * 1024
+
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{16,64}$')
+# Поля метаданных, которые должны совпасть, чтобы продолжить начатую загрузку
+RESUME_FIELDS = ('agent_id', 'filename', 'original_size', 'hash', 'encrypted', 'encoding', 'chunk_size', 'key_id')
+UPLOAD_TTL = 7 * 24 * 3600  # Брошенные загрузки удаляются через неделю
+
+# Загрузки, которые сейчас принимаются (повторное подключение агента
+# при живом старом соединении не должно писать в тот же .part)
+_active_uploads = set()
+_active_lock = threading.Lock()
+
+def recv_exact(sock, size):
+    """Чтение ровно size байт (ConnectionError если соединение закрыто раньше)"""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(65536, size - len(data)))
+        if not chunk:
+            raise ConnectionError(f"Соединение закрыто: получено {len(data)} из {size} байт")
+        data += chunk
+    return bytes(data)
+
+def read_stream_metadata(sock):
+    """Чтение длины и JSON метаданных потоковой передачи"""
+    metadata_size = int(recv_exact(sock, 20).decode('utf-8').strip())
+    if not 0 < metadata_size <= MAX_METADATA_SIZE:
+        raise ValueError(f"Недопустимый размер метаданных: {metadata_size}")
+    
+    return json.loads(recv_exact(sock, metadata_size).decode('utf-8'))
+
+def send_reply(sock, data):
+    """Промежуточный ответ агенту: длина JSON (20 байт) + JSON"""
+    payload = json.dumps(data).encode('utf-8')
+    sock.sendall(f"{len(payload):<20}".encode('utf-8') + payload)
+
+def _read_frames(sock):
+    """Генератор кадров до завершающего пустого кадра"""
+    while True:
+        frame_size = FRAME_LENGTH.unpack(recv_exact(sock, FRAME_LENGTH.size))[0]
+        if frame_size == 0:
+            return
+        if frame_size > MAX_FRAME_SIZE:
+            raise ValueError(f"Недопустимый размер кадра: {frame_size}")
+        yield recv_exact(sock, frame_size)
+
+def _is_raw(metadata):
+    """Данные хранятся подряд (контейнер stream_crypto и открытые данные) или кадрами с длинами (fernet-chunks)"""
+    return not metadata.get('encrypted', False) or metadata.get('encoding') == 'aesgcm-stream'
+
+def _iter_stored(fileobj, raw):
+    """Чтение сохраненных данных: блоками или кадрами с длинами"""
+    if raw:
+        yield from iter(lambda: fileobj.read(READ_BLOCK), b"")
+        return
+    
+    while True:
+        length = fileobj.read(FRAME_LENGTH.size)
+        if not length:
+            return
+        frame_size = FRAME_LENGTH.unpack(length)[0] if len(length) == FRAME_LENGTH.size else -1
+        frame = fileobj.read(frame_size) if frame_size >= 0 else b""
+        if frame_size < 0 or len(frame) < frame_size:
+            raise StreamFormatError("Сохраненный кадр обрезан")
+        yield frame
+
+class _FernetChunksDecoder:
+    """Расшифровка кадров-токенов Fernet (ключ по key_id из метаданных или подбором)"""
+    
+    def __init__(self, key_ring, kid):
+        self.key_ring = key_ring
+        self.kid = kid
+        self.cipher = None
+        self.key_agent_id = None
+    
+    def feed(self, frame):
+        if self.cipher is None:
+            if self.kid:
+                self.key_agent_id, self.cipher = self.key_ring.get_cipher(self.kid)
+                if self.cipher is None:
+                    raise StreamFormatError(f"Неизвестный ключ: {self.kid}")
+            else:
+                self.key_agent_id, plain = self.key_ring.trial_decrypt(frame)
+                if plain is None:
+                    raise StreamFormatError("Ключ не найден")
+                self.cipher = self.key_ring.get_agent_cipher(self.key_agent_id)
+                return plain
+        try:
+            return self.cipher.decrypt(frame)
+        except InvalidToken:
+            raise StreamFormatError("Кадр поврежден")
+    
+    def finish(self):
+        pass
+
+class _StreamContainerDecoder:
+    """Расшифровка контейнера stream_crypto (ключ выбирается по key_id из заголовка)"""
+    
+    def __init__(self, key_ring):
+        self.key_ring = key_ring
+        self.decryptor = StreamDecryptor(key_ring.get_key)
+        self.key_agent_id = None
+    
+    def feed(self, frame):
+        try:
+            return self.decryptor.feed(frame)
+        finally:
+            # Ключ известен, даже если дальше в этом же блоке данные повреждены
+            if self.key_agent_id is None and self.decryptor.header_info:
+                self.key_agent_id = self.key_ring.agent_for(self.decryptor.header_info['key_id'])
+    
+    def finish(self):
+        self.decryptor.finish()
+
+class _PlainDecoder:
+    key_agent_id = None
+    
+    def feed(self, frame):
+        return frame
+    
+    def finish(self):
+        pass
+
+def _make_decoder(metadata, key_ring):
+    if not metadata.get('encrypted', False):
+        return _PlainDecoder()
+    if metadata.get('encoding') == 'aesgcm-stream':
+        return _StreamContainerDecoder(key_ring)
+    return _FernetChunksDecoder(key_ring, metadata.get('key_id'))
+
+class _Digest:
+    """Хэши принятых и расшифрованных данных (расшифрованное можно сразу писать в файл)"""
+    
+    def __init__(self, metadata, key_ring, decrypted_file=None):
+        self.metadata = metadata
+        self.decoder = _make_decoder(metadata, key_ring)
+        self.decrypted_file = decrypted_file
+        
+        self.payload_hash = hashlib.sha256()
+        self.plain_hash = hashlib.sha256()
+        self.payload_size = 0
+        self.plain_size = 0
+        self.decrypt_failed = False
+    
+    def update(self, frame):
+        self.payload_hash.update(frame)
+        self.payload_size += len(frame)
+        
+        if self.decrypt_failed:
+            return
+        
+        # Расшифровка кадра (без ключа данные только сохраняются)
+        try:
+            plain = self.decoder.feed(frame)
+        except StreamFormatError:
+            self.decrypt_failed = True
+            return
+        
+        self.plain_hash.update(plain)
+        self.plain_size += len(plain)
+        if self.decrypted_file:
+            self.decrypted_file.write(plain)
+    
+    def result(self):
+        if not self.decrypt_failed:
+            try:
+                self.decoder.finish()
+            except StreamFormatError:
+                self.decrypt_failed = True
+        
+        decrypted = not self.decrypt_failed
+        verified = (
+            decrypted and
+            self.plain_hash.hexdigest() == self.metadata.get('hash') and
+            self.plain_size == self.metadata.get('original_size')
+        )
+        
+        return {
+            'payload_size': self.payload_size,
+            'payload_hash': self.payload_hash.hexdigest(),
+            'original_size': self.plain_size,
+            'decrypted': decrypted,
+            'verified': verified,
+            'key_agent_id': self.decoder.key_agent_id
+        }
+
+def _remove_files(*paths):
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+def receive_stream(sock, metadata, encrypted_path, decrypted_path=None, key_ring=None, upload_dir=None):
+    """
+    Прием кадров с записью на диск и проверкой хэша
+    
+    Данные сохраняются в encrypted_path: контейнер stream_crypto и открытые
+    данные - подряд (контейнер расшифровывается iter_decrypt), fernet-chunks -
+    кадрами с длинами. Если передан decrypted_path, расшифрованные данные
+    пишутся туда же потоково. Хэш исходного файла проверяется, если данные
+    удалось расшифровать. Файлы появляются под итоговыми именами только
+    после полного приема.
+    
+    Если в метаданных есть upload_id и передан upload_dir, загрузка
+    возобновляемая (см. описание модуля).
+    
+    Args:
+        sock: Сокет (или StreamSocket) после чтения метаданных
+        metadata (dict): Метаданные передачи
+        encrypted_path (str): Путь для сохранения полученных данных
+        decrypted_path (str): Путь для расшифрованного файла (None - не сохранять)
+        key_ring (KeyRing): Ключи агентов с индексом по key_id
+        upload_dir (str): Папка незавершенных загрузок
+    
+    Returns:
+        dict: payload_size, payload_hash, original_size, decrypted, verified, key_agent_id
+              (для возобновляемой загрузки еще resumed_from - с какого байта продолжен прием)
+    """
+    key_ring = key_ring or KeyRing()
+    if upload_dir and metadata.get('upload_id'):
+        return _receive_resumable(sock, metadata, upload_dir, encrypted_path, decrypted_path, key_ring)
+    
+    raw = _is_raw(metadata)
+    
+    encrypted_part = f"{encrypted_path}.part"
+    decrypted_part = f"{decrypted_path}.part" if decrypted_path else None
+    decrypted_file = None
+    
+    try:
+        with open(encrypted_part, 'wb') as encrypted_file:
+            if decrypted_part:
+                decrypted_file = open(decrypted_part, 'wb')
+            digest = _Digest(metadata, key_ring, decrypted_file)
+            
+            for frame in _read_frames(sock):
+                if not raw:
+                    encrypted_file.write(FRAME_LENGTH.pack(len(frame)))
+                encrypted_file.write(frame)
+                digest.update(frame)
+    except Exception:
+        # Незавершенная передача не оставляет файлов
+        if decrypted_file:
+            decrypted_file.close()
+        _remove_files(encrypted_part, decrypted_part)
+        raise
+    
+    if decrypted_file:
+        decrypted_file.close()
+    
+    result = digest.result()
+    
+    os.replace(encrypted_part, encrypted_path)
+    if decrypted_part:
+        if result['verified']:
+            os.replace(decrypted_part, decrypted_path)
+        else:
+            os.remove(decrypted_part)
+    
+    return result
+
+def _load_upload(state_path, part_path, metadata):
+    """Состояние начатой загрузки (None если его нет, файл другой или .part короче сохраненного)"""
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    if any(state.get('metadata', {}).get(field) != metadata.get(field) for field in RESUME_FIELDS):
+        return None
+    if not os.path.exists(part_path) or os.path.getsize(part_path) < state.get('offset', 0):
+        return None
+    return state
+
+def _save_upload(state_path, state):
+    """Атомарная запись состояния загрузки"""
+    state['updated'] = time.time()
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+def _receive_resumable(sock, metadata, upload_dir, encrypted_path, decrypted_path, key_ring):
+    """Возобновляемый прием: досылка кадров в uploads/<upload_id>.part, проверка, переименование"""
+    upload_id = str(metadata['upload_id'])
+    if not UPLOAD_ID_PATTERN.match(upload_id):
+        raise ValueError(f"Недопустимый upload_id: {upload_id}")
+    
+    with _active_lock:
+        if upload_id in _active_uploads:
+            send_reply(sock, {'status': 'busy', 'message': 'Загрузка уже принимается, повторите позже'})
+            raise ConnectionError(f"Загрузка {upload_id} уже принимается")
+        _active_uploads.add(upload_id)
+    
+    try:
+        return _receive_upload(sock, metadata, upload_dir, upload_id, encrypted_path, decrypted_path, key_ring)
+    finally:
+        with _active_lock:
+            _active_uploads.discard(upload_id)
+
+def _receive_upload(sock, metadata, upload_dir, upload_id, encrypted_path, decrypted_path, key_ring):
+    os.makedirs(upload_dir, exist_ok=True)
+    part_path = os.path.join(upload_dir, f"{upload_id}.part")
+    state_path = os.path.join(upload_dir, f"{upload_id}.json")
+    raw = _is_raw(metadata)
+    
+    state = _load_upload(state_path, part_path, metadata)
+    if state is None:
+        state = {'upload_id': upload_id, 'metadata': metadata, 'offset': 0, 'frames': 0, 'created': time.time()}
+        open(part_path, 'wb').close()
+        _save_upload(state_path, state)
+    resumed_from = state['offset']
+    
+    # Для продолжения контейнера агенту нужен stream_id из уже принятого заголовка
+    stream_id = None
+    if state['frames'] and metadata.get('encrypted', False) and metadata.get('encoding') == 'aesgcm-stream':
+        with open(part_path, 'rb') as f:
+            stream_id = read_header(f.read(HEADER_SIZE))['stream_id'].hex()
+    
+    send_reply(sock, {
+        'status': 'ready',
+        'upload_id': upload_id,
+        'offset': state['offset'],
+        'frames': state['frames'],
+        'stream_id': stream_id
+    })
+    
+    # Хвост недописанного кадра (обрыв посреди кадра) отбрасывается
+    with open(part_path, 'r+b') as part_file:
+        part_file.truncate(state['offset'])
+        part_file.seek(state['offset'])
+        
+        for frame in _read_frames(sock):
+            if not raw:
+                part_file.write(FRAME_LENGTH.pack(len(frame)))
+            part_file.write(frame)
+            part_file.flush()
+            
+            state['offset'] = part_file.tell()
+            state['frames'] += 1
+            _save_upload(state_path, state)
+    
+    # Полная проверка: повторное чтение .part с расшифровкой и хэшем исходного файла
+    decrypted_part = f"{decrypted_path}.part" if decrypted_path else None
+    with open(part_path, 'rb') as part_file:
+        decrypted_file = open(decrypted_part, 'wb') if decrypted_part else None
+        try:
+            digest = _Digest(metadata, key_ring, decrypted_file)
+            for frame in _iter_stored(part_file, raw):
+                digest.update(frame)
+        finally:
+            if decrypted_file:
+                decrypted_file.close()
+    
+    result = digest.result()
+    result['resumed_from'] = resumed_from
+    
+    # Без ключа сохраняется как есть. С ключом данные должны расшифроваться
+    # и совпасть по хэшу - иначе загрузка испорчена и начнется заново
+    if not result['verified'] and (result['decrypted'] or result['key_agent_id']):
+        _remove_files(part_path, state_path, decrypted_part)
+        reason = "хэш не совпал" if result['decrypted'] else "данные не расшифровываются"
+        raise StreamFormatError(f"Загрузка {upload_id} повреждена ({reason}), принятые данные удалены")
+    
+    os.replace(part_path, encrypted_path)
+    if decrypted_part:
+        if result['verified']:
+            os.replace(decrypted_part, decrypted_path)
+        else:
+            os.remove(decrypted_part)
+    os.remove(state_path)
+    
+    return result
+
+def cleanup_stale_uploads(upload_dir, max_age=UPLOAD_TTL):
+    """
+    Удаление брошенных загрузок (состояние не обновлялось дольше max_age секунд)
+    
+    Returns:
+        int: Количество удаленных загрузок
+    """
+    if not os.path.isdir(upload_dir):
+        return 0
+    
+    removed = 0
+    now = time.time()
+    for name in os.listdir(upload_dir):
+        if not name.endswith('.json'):
+            continue
+        
+        state_path = os.path.join(upload_dir, name)
+        if now - os.path.getmtime(state_path) < max_age:
+            continue
+        
+        upload_id = name[:-len('.json')]
+        with _active_lock:
+            if upload_id in _active_uploads:
+                continue
+        _remove_files(state_path, os.path.join(upload_dir, f"{upload_id}.part"))
+        removed += 1
+    
+    return removed
\ No newline at end of file
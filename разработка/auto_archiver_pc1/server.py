@@ -8,6 +8,8 @@ import os
 import time
 from datetime import datetime
 import threading
+from async_ingest import AsyncIngestServer, DEFAULT_BACKLOG, DEFAULT_MAX_CONCURRENCY
+from secure_transfer import STREAM_HEADER, read_stream_metadata, receive_stream, cleanup_stale_uploads
 
 class MasterServer:
     def __init__(self, host='0.0.0.0', port=9090):
@@ -27,6 +29,7 @@ class MasterServer:
         self.base_storage = "./storage"
         self.telegram_storage = f"{self.base_storage}/telegram"
         self.logs_path = f"{self.base_storage}/logs"
+        self.uploads_storage = f"{self.base_storage}/uploads"  # Незавершенные (возобновляемые) загрузки
         
         # Создаем структуру папок
         self._create_folders()
@@ -40,10 +43,14 @@ class MasterServer:
     
     def _create_folders(self):
         """Создание структуры папок"""
-        folders = [self.base_storage, self.telegram_storage, self.logs_path]
+        folders = [self.base_storage, self.telegram_storage, self.logs_path, self.uploads_storage]
         for folder in folders:
             os.makedirs(folder, exist_ok=True)
             print(f"📁 Создана папка: {folder}")
+        
+        removed = cleanup_stale_uploads(self.uploads_storage)
+        if removed:
+            print(f"🧹 Удалено брошенных загрузок: {removed}")
     
     def log_event(self, message, level="INFO"):
         """
@@ -88,6 +95,9 @@ class MasterServer:
             if header == "TELEGRAM":
                 self.log_event(f"📱 Принимаю Telegram архив от {client_ip}")
                 self._receive_telegram_archive(client_socket, client_ip)
+            elif header == STREAM_HEADER:
+                self.log_event(f"📱 Принимаю архив (возобновляемая загрузка) от {client_ip}")
+                self._receive_stream_archive(client_socket, client_ip)
             elif header == "METRICS":
                 self.log_event(f"📊 Принимаю метрики от {client_ip}")
                 self._receive_metrics(client_socket, client_ip)
@@ -130,9 +140,9 @@ class MasterServer:
             save_filename = f"{client_ip}_{timestamp}_{original_filename}"
             save_path = f"{self.telegram_storage}/{save_filename}"
             
-            # Получаем сами данные
+            # Получаем сами данные (под итоговым именем файл появляется только целиком)
             received = 0
-            with open(save_path, "wb") as f:
+            with open(f"{save_path}.part", "wb") as f:
                 while received < data_size:
                     chunk = client_socket.recv(min(4096, data_size - received))
                     if not chunk:
@@ -140,6 +150,11 @@ class MasterServer:
                     f.write(chunk)
                     received += len(chunk)
             
+            if received < data_size:
+                os.remove(f"{save_path}.part")
+                raise ConnectionError(f"Передача прервана: получено {received} из {data_size} байт")
+            os.replace(f"{save_path}.part", save_path)
+            
             self.log_event(f"✅ Архив сохранен: {save_filename} ({received} байт)")
             
             # Отправляем подтверждение
@@ -156,6 +171,51 @@ class MasterServer:
             self.log_event(error_msg, "ERROR")
             client_socket.send(json.dumps({"status": "error", "message": str(e)}).encode('utf-8'))
     
+    def _receive_stream_archive(self, client_socket, client_ip):
+        """
+        Прием архива кадрами SECURE_STM с докачкой после обрыва
+        
+        Ключей на этом сервере нет: зашифрованные архивы сохраняются как есть,
+        хэш проверяется только у незашифрованных.
+        
+        Args:
+            client_socket: Сокет клиента
+            client_ip: IP клиента
+        """
+        try:
+            metadata = read_stream_metadata(client_socket)
+            original_filename = os.path.basename(metadata.get('filename', 'unknown'))
+            
+            self.log_event(f"📦 Размер архива: {metadata.get('original_size', 0)} байт")
+            
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            save_filename = f"{client_ip}_{timestamp}_{original_filename}"
+            
+            result = receive_stream(client_socket, metadata, f"{self.telegram_storage}/{save_filename}",
+                                    upload_dir=self.uploads_storage)
+            
+            if result.get('resumed_from'):
+                self.log_event(f"↩️ Загрузка продолжена с {result['resumed_from']} байт")
+            self.log_event(f"✅ Архив сохранен: {save_filename} ({result['payload_size']} байт)")
+            
+            response = json.dumps({
+                "status": "success",
+                "message": f"Архив получен и сохранен как {save_filename}",
+                "size": result['payload_size'],
+                "verified": result['verified'],
+                "payload_hash": result['payload_hash'],
+                "timestamp": timestamp
+            })
+            client_socket.send(response.encode('utf-8'))
+            
+        except Exception as e:
+            error_msg = f"❌ Ошибка приема архива от {client_ip}: {e}"
+            self.log_event(error_msg, "ERROR")
+            try:
+                client_socket.send(json.dumps({"status": "error", "message": str(e)}).encode('utf-8'))
+            except:
+                pass
+    
     def _receive_metrics(self, client_socket, client_ip):
         """Прием метрик системы от агента"""
         try:
@@ -283,6 +343,27 @@ class MasterServer:
         # Запускаем панель управления в основном потоке
         self.show_dashboard()
     
+    def start_async(self, backlog=DEFAULT_BACKLOG, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """
+        Запуск сервера на asyncio вместо потока на каждое подключение
+        
+        Args:
+            backlog (int): Размер очереди входящих подключений
+            max_concurrency (int): Максимум одновременно обрабатываемых подключений
+        """
+        server_thread = threading.Thread(target=self._run_async_server, args=(backlog, max_concurrency))
+        server_thread.daemon = True
+        server_thread.start()
+        
+        # Запускаем панель управления в основном потоке
+        self.show_dashboard()
+    
+    def _run_async_server(self, backlog=DEFAULT_BACKLOG, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """Запуск асинхронного TCP сервера"""
+        ingest = AsyncIngestServer(self, self.host, self.port,
+                                   backlog=backlog, max_concurrency=max_concurrency)
+        ingest.serve_forever()
+    
     def _run_server(self):
         """Запуск TCP сервера"""
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -318,4 +399,4 @@ class MasterServer:
 if __name__ == "__main__":
     # Создаем и запускаем сервер
     server = MasterServer(port=9090)
-    server.start()
\ No newline at end of file
+    server.start_async()
\ No newline at end of file
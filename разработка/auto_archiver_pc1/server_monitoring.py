@@ -8,8 +8,88 @@ import base64
 import hashlib
 from datetime import datetime
 import threading
-from cryptography.fernet import Fernet, InvalidToken
+from cryptography.fernet import InvalidToken
 import sqlite3
+from async_ingest import AsyncIngestServer, DEFAULT_BACKLOG, DEFAULT_MAX_CONCURRENCY
+from db_writer import BatchedDBWriter
+from rollup import RollupJob, ROLLUP_SCHEMA, DEFAULT_RETENTION, get_series
+from secure_transfer import STREAM_HEADER, read_stream_metadata, receive_stream, cleanup_stale_uploads
+from key_ring import KeyRing, KEYED_PREFIX, LEGACY_PREFIX, split_keyed_packet
+
+# Миграции схемы БД: версия -> запросы (текущая версия хранится в PRAGMA user_version)
+SCHEMA_MIGRATIONS = {
+    # Индексы временных рядов для запросов дашборда
+    1: [
+        'CREATE INDEX IF NOT EXISTS idx_cpu_monitoring_agent_ts ON cpu_monitoring (agent_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_memory_monitoring_agent_ts ON memory_monitoring (agent_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_disk_monitoring_agent_ts ON disk_monitoring (agent_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_processes_agent_ts ON processes (agent_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_network_connections_agent_ts ON network_connections (agent_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_screenshots_agent_ts ON screenshots (agent_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_events_agent_ts ON events (agent_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_events_severity_ts ON events (severity, timestamp)',
+        # Запросы по всем агентам за период (сводка дашборда, последние события)
+        'CREATE INDEX IF NOT EXISTS idx_cpu_monitoring_ts ON cpu_monitoring (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_memory_monitoring_ts ON memory_monitoring (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_events_ts ON events (timestamp)',
+    ],
+    # Последние значения метрик агента, обновляемые при приеме данных
+    2: [
+        '''
+        CREATE TABLE IF NOT EXISTS agent_latest (
+            agent_id TEXT PRIMARY KEY,
+            last_cpu REAL,
+            last_ram REAL,
+            last_disk REAL,
+            process_count INTEGER,
+            updated_at TIMESTAMP,
+            last_error_time TIMESTAMP,
+            FOREIGN KEY (agent_id) REFERENCES agents (agent_id)
+        )
+        ''',
+        # Заполняем по накопленной истории (один раз, по индексам версии 1)
+        '''
+        INSERT OR REPLACE INTO agent_latest
+        (agent_id, last_cpu, last_ram, last_disk, process_count, updated_at, last_error_time)
+        SELECT
+            a.agent_id,
+            (SELECT cpu_percent FROM cpu_monitoring
+             WHERE agent_id = a.agent_id ORDER BY timestamp DESC LIMIT 1),
+            (SELECT ram_percent FROM memory_monitoring
+             WHERE agent_id = a.agent_id ORDER BY timestamp DESC LIMIT 1),
+            (SELECT disk_percent FROM disk_monitoring
+             WHERE agent_id = a.agent_id ORDER BY timestamp DESC LIMIT 1),
+            (SELECT COUNT(*) FROM processes
+             WHERE agent_id = a.agent_id
+             AND timestamp = (SELECT MAX(timestamp) FROM processes WHERE agent_id = a.agent_id)),
+            a.last_seen,
+            (SELECT MAX(timestamp) FROM events
+             WHERE agent_id = a.agent_id AND severity = 'ERROR')
+        FROM agents a
+        ''',
+    ],
+    # Таблицы свертки истории и индексы для очистки по сроку хранения
+    3: ROLLUP_SCHEMA + [
+        'CREATE INDEX IF NOT EXISTS idx_disk_monitoring_ts ON disk_monitoring (timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_processes_ts ON processes (timestamp)',
+    ],
+}
+
+# Обновление agent_latest: пустые (None) значения не затирают сохраненные.
+# Один запрос для метрик и ошибок - поток записи сохраняет порядок строк внутри запроса.
+# Число ошибок за сутки здесь не ведется - оно считается при чтении по events
+AGENT_LATEST_UPSERT = '''
+    INSERT INTO agent_latest
+    (agent_id, last_cpu, last_ram, last_disk, process_count, updated_at, last_error_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(agent_id) DO UPDATE SET
+        last_cpu = COALESCE(excluded.last_cpu, last_cpu),
+        last_ram = COALESCE(excluded.last_ram, last_ram),
+        last_disk = COALESCE(excluded.last_disk, last_disk),
+        process_count = COALESCE(excluded.process_count, process_count),
+        updated_at = COALESCE(excluded.updated_at, updated_at),
+        last_error_time = COALESCE(excluded.last_error_time, last_error_time)
+'''
 
 class MonitoringServer:
     def __init__(self, host='0.0.0.0', port=9090):
@@ -22,6 +102,16 @@ class MonitoringServer:
         self.agents_storage = f"{self.base_storage}/agents"
         self.db_path = f"{self.base_storage}/monitoring.db"
         self.logs_path = f"{self.base_storage}/logs"
+        self.uploads_storage = f"{self.base_storage}/uploads"  # Незавершенные (возобновляемые) загрузки
+        
+        # Пакетная запись в БД
+        self.db_batch_size = 500
+        self.db_flush_interval = 0.5
+        self.db_queue_size = 10000
+        
+        # Свертка и хранение истории (сроки по уровням: raw, 1m, 1h, 1d)
+        self.history_retention = dict(DEFAULT_RETENTION)
+        self.rollup_interval = 60
         
         # Создаем структуру папок
         self._create_folders()
@@ -29,8 +119,25 @@ class MonitoringServer:
         # Инициализируем базу данных
         self._init_database()
         
-        # Загружаем ключи шифрования
-        self.encryption_keys = self._load_encryption_keys()
+        # Запускаем поток записи в БД
+        self.db_writer = BatchedDBWriter(
+            self.db_path,
+            max_batch=self.db_batch_size,
+            flush_interval=self.db_flush_interval,
+            queue_size=self.db_queue_size,
+            stats_callback=self._log_ingest_stats
+        ).start()
+        
+        # Запускаем фоновую свертку истории
+        self.rollup_job = RollupJob(
+            self.db_path,
+            retention=self.history_retention,
+            interval=self.rollup_interval,
+            log_callback=self.log_event
+        ).start()
+        
+        # Загружаем ключи шифрования (индекс key_id -> ключ)
+        self.encryption_keys = KeyRing(self._load_encryption_keys())
         
         # Список активных агентов
         self.active_agents = {}
@@ -49,6 +156,7 @@ class MonitoringServer:
             self.base_storage,
             self.agents_storage,
             self.logs_path,
+            self.uploads_storage,
             f"{self.agents_storage}/screenshots",
             f"{self.agents_storage}/logs"
         ]
@@ -56,13 +164,21 @@ class MonitoringServer:
         for folder in folders:
             os.makedirs(folder, exist_ok=True)
             print(f"📁 Создана папка: {folder}")
+        
+        removed = cleanup_stale_uploads(self.uploads_storage)
+        if removed:
+            print(f"🧹 Удалено брошенных загрузок: {removed}")
     
     def _init_database(self):
         """Инициализация базы данных"""
         try:
-            self.db_conn = sqlite3.connect(self.db_path)
+            # Соединение используется для чтения, запись идет через db_writer
+            self.db_conn = sqlite3.connect(self.db_path, check_same_thread=False)
             self.db_cursor = self.db_conn.cursor()
             
+            # WAL: чтение не блокируется потоком записи
+            self.db_cursor.execute('PRAGMA journal_mode=WAL')
+            
             # Таблица агентов
             self.db_cursor.execute('''
                 CREATE TABLE IF NOT EXISTS agents (
@@ -177,11 +293,56 @@ class MonitoringServer:
             ''')
             
             self.db_conn.commit()
+            
+            # Применяем миграции схемы
+            self._migrate_database()
+            
             print("✅ База данных инициализирована")
             
         except Exception as e:
             print(f"❌ Ошибка инициализации базы данных: {e}")
     
+    def _migrate_database(self):
+        """Применение миграций схемы, которые еще не были применены"""
+        self.db_cursor.execute('PRAGMA user_version')
+        current_version = self.db_cursor.fetchone()[0]
+        
+        for version in sorted(SCHEMA_MIGRATIONS):
+            if version <= current_version:
+                continue
+            
+            print(f"🔧 Миграция схемы БД до версии {version}...")
+            for sql in SCHEMA_MIGRATIONS[version]:
+                self.db_cursor.execute(sql)
+            
+            self.db_cursor.execute(f'PRAGMA user_version = {version}')
+            self.db_conn.commit()
+            print(f"✅ Схема БД обновлена до версии {version}")
+    
+    def _record_event(self, agent_id, timestamp, event_type, message, severity='INFO'):
+        """Сохранение события агента (время последней ошибки - в agent_latest)"""
+        self.db_writer.submit('''
+            INSERT INTO events (agent_id, timestamp, event_type, event_message, severity)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (agent_id, timestamp, event_type, message, severity))
+        
+        if severity == 'ERROR':
+            self.db_writer.submit(AGENT_LATEST_UPSERT, (
+                agent_id, None, None, None, None, None, timestamp
+            ))
+    
+    def _update_agent_latest(self, agent_id, timestamp, current_stats, process_count):
+        """Обновление последних значений метрик агента"""
+        self.db_writer.submit(AGENT_LATEST_UPSERT, (
+            agent_id,
+            current_stats.get('cpu_percent'),
+            current_stats.get('memory_percent'),
+            current_stats.get('disk_percent'),
+            process_count,
+            timestamp,
+            None
+        ))
+    
     def _load_encryption_keys(self):
         """Загрузка ключей шифрования"""
         keys = {}
@@ -226,22 +387,34 @@ class MonitoringServer:
             # Пытаемся расшифровать данные
             decrypted_data = None
             
-            if data.startswith(b"ENCRYPTED::"):
-                # Пробуем все ключи
-                for key_agent_id, key_data in self.encryption_keys.items():
+            key_agent_id = None
+            decrypted = None
+            
+            if data.startswith(KEYED_PREFIX):
+                # Ключ находится по key_id из пакета
+                kid, token = split_keyed_packet(data)
+                key_agent_id, cipher = self.encryption_keys.get_cipher(kid)
+                if cipher:
                     try:
-                        cipher = Fernet(key_data)
-                        decrypted = cipher.decrypt(data[10:])
-                        decrypted_json = json.loads(decrypted.decode('utf-8'))
-                        
-                        # Проверяем agent_id в данных
-                        if 'summary' in decrypted_json and 'agent_id' in decrypted_json['summary']:
-                            if decrypted_json['summary']['agent_id'] == key_agent_id:
-                                decrypted_data = decrypted_json
-                                agent_id = key_agent_id
-                                break
-                    except (InvalidToken, json.JSONDecodeError):
-                        continue
+                        decrypted = cipher.decrypt(token)
+                    except InvalidToken:
+                        self.log_event(f"⚠️ Пакет от {client_ip} не расшифрован ключом {kid}", "WARNING")
+                else:
+                    self.log_event(f"⚠️ Неизвестный ключ {kid} от {client_ip}", "WARNING")
+            elif data.startswith(LEGACY_PREFIX):
+                # Старые агенты без key_id - подбор ключа
+                key_agent_id, decrypted = self.encryption_keys.trial_decrypt(data[len(LEGACY_PREFIX):])
+            
+            if decrypted is not None:
+                try:
+                    decrypted_json = json.loads(decrypted.decode('utf-8'))
+                    
+                    # Проверяем agent_id в данных
+                    if decrypted_json.get('summary', {}).get('agent_id') == key_agent_id:
+                        decrypted_data = decrypted_json
+                        agent_id = key_agent_id
+                except json.JSONDecodeError:
+                    pass
             
             if not decrypted_data:
                 # Пробуем как незашифрованные данные
@@ -293,23 +466,21 @@ class MonitoringServer:
             # Сохраняем текущие метрики
             timestamp = datetime.now()
             
+            cpu_rows = []
+            memory_rows = []
+            process_rows = []
+            
             # CPU данные
             if 'cpu_percent' in current_stats:
-                self.db_cursor.execute('''
-                    INSERT INTO cpu_monitoring (agent_id, timestamp, cpu_percent)
-                    VALUES (?, ?, ?)
-                ''', (agent_id, timestamp, current_stats['cpu_percent']))
+                cpu_rows.append((agent_id, timestamp, current_stats['cpu_percent'], None, None, None))
             
             # Memory данные
             if 'memory_percent' in current_stats:
-                self.db_cursor.execute('''
-                    INSERT INTO memory_monitoring (agent_id, timestamp, ram_percent)
-                    VALUES (?, ?, ?)
-                ''', (agent_id, timestamp, current_stats['memory_percent']))
+                memory_rows.append((agent_id, timestamp, current_stats['memory_percent'], None, None, None))
             
             # Disk данные
             if 'disk_percent' in current_stats:
-                self.db_cursor.execute('''
+                self.db_writer.submit('''
                     INSERT INTO disk_monitoring (agent_id, timestamp, mountpoint, disk_percent)
                     VALUES (?, ?, ?, ?)
                 ''', (agent_id, timestamp, '/', current_stats['disk_percent']))
@@ -318,11 +489,7 @@ class MonitoringServer:
             if 'cpu_history' in data:
                 for cpu_data in data['cpu_history'][-10:]:  # Последние 10 записей
                     try:
-                        self.db_cursor.execute('''
-                            INSERT INTO cpu_monitoring 
-                            (agent_id, timestamp, cpu_percent, cpu_freq, user_percent, system_percent)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        ''', (
+                        cpu_rows.append((
                             agent_id,
                             datetime.fromisoformat(cpu_data.get('timestamp', '')),
                             cpu_data.get('percent_total', 0),
@@ -337,11 +504,7 @@ class MonitoringServer:
                 for mem_data in data['memory_history'][-10:]:
                     try:
                         ram = mem_data.get('ram', {})
-                        self.db_cursor.execute('''
-                            INSERT INTO memory_monitoring 
-                            (agent_id, timestamp, ram_percent, ram_used_gb, ram_total_gb, swap_percent)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        ''', (
+                        memory_rows.append((
                             agent_id,
                             datetime.fromisoformat(mem_data.get('timestamp', '')),
                             ram.get('percent', 0),
@@ -355,11 +518,7 @@ class MonitoringServer:
             if 'processes' in data:
                 for proc in data['processes'][:20]:  # Первые 20 процессов
                     try:
-                        self.db_cursor.execute('''
-                            INSERT INTO processes 
-                            (agent_id, timestamp, process_name, pid, cpu_percent, memory_percent, username, status)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', (
+                        process_rows.append((
                             agent_id,
                             timestamp,
                             proc.get('name', ''),
@@ -372,61 +531,69 @@ class MonitoringServer:
                     except:
                         continue
             
-            self.db_conn.commit()
+            # Строки уходят в очередь, поток записи объединяет их с данными других агентов
+            self.db_writer.submit_many('''
+                INSERT INTO cpu_monitoring
+                (agent_id, timestamp, cpu_percent, cpu_freq, user_percent, system_percent)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', cpu_rows)
+            
+            self.db_writer.submit_many('''
+                INSERT INTO memory_monitoring
+                (agent_id, timestamp, ram_percent, ram_used_gb, ram_total_gb, swap_percent)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', memory_rows)
+            
+            self.db_writer.submit_many('''
+                INSERT INTO processes
+                (agent_id, timestamp, process_name, pid, cpu_percent, memory_percent, username, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', process_rows)
+            
+            # Последние значения для списка агентов на дашборде
+            process_count = len(data['processes']) if isinstance(data.get('processes'), list) else None
+            self._update_agent_latest(agent_id, timestamp, current_stats, process_count)
             
             # Добавляем событие
-            self.db_cursor.execute('''
-                INSERT INTO events (agent_id, timestamp, event_type, event_message, severity)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
+            self._record_event(
                 agent_id,
                 timestamp,
                 'MONITORING_DATA',
-                f'Received monitoring data: CPU {current_stats.get("cpu_percent", 0):.1f}%, RAM {current_stats.get("memory_percent", 0):.1f}%',
-                'INFO'
-            ))
-            
-            self.db_conn.commit()
-            
+                f'Received monitoring data: CPU {current_stats.get("cpu_percent", 0):.1f}%, RAM {current_stats.get("memory_percent", 0):.1f}%'
+            )
+        
         except Exception as e:
             self.log_event(f"❌ Ошибка обработки данных: {e}", "ERROR", agent_id)
+            self._record_event(agent_id, datetime.now(), 'PROCESSING_ERROR', f'Monitoring data processing failed: {e}', 'ERROR')
     
     def _update_agent_info(self, agent_id, client_ip, system_info, monitoring_status):
         """Обновление информации об агенте"""
         try:
             timestamp = datetime.now()
             
-            # Проверяем существует ли агент
-            self.db_cursor.execute('SELECT agent_id FROM agents WHERE agent_id = ?', (agent_id,))
-            agent_exists = self.db_cursor.fetchone()
-            
-            if agent_exists:
-                # Обновляем существующего агента
-                self.db_cursor.execute('''
-                    UPDATE agents 
-                    SET last_seen = ?, status = ?, ip_address = ?
-                    WHERE agent_id = ?
-                ''', (timestamp, 'ONLINE', client_ip, agent_id))
-            else:
-                # Добавляем нового агента
-                cpu_info = system_info.get('cpu', {}).get('brand_raw', 'Unknown')
-                memory_gb = system_info.get('memory', {}).get('total_gb', 0)
-                
-                self.db_cursor.execute('''
-                    INSERT INTO agents 
-                    (agent_id, hostname, os, cpu_info, memory_gb, first_seen, last_seen, status, ip_address)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    agent_id,
-                    system_info.get('hostname', 'Unknown'),
-                    f"{system_info.get('os', 'Unknown')} {system_info.get('platform', '')}",
-                    cpu_info,
-                    memory_gb,
-                    timestamp,
-                    timestamp,
-                    'ONLINE',
-                    client_ip
-                ))
+            cpu_info = system_info.get('cpu', {}).get('brand_raw', 'Unknown')
+            memory_gb = system_info.get('memory', {}).get('total_gb', 0)
+            
+            # Добавляем нового агента или обновляем существующего одним запросом
+            self.db_writer.submit('''
+                INSERT INTO agents
+                (agent_id, hostname, os, cpu_info, memory_gb, first_seen, last_seen, status, ip_address)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(agent_id) DO UPDATE SET
+                    last_seen = excluded.last_seen,
+                    status = excluded.status,
+                    ip_address = excluded.ip_address
+            ''', (
+                agent_id,
+                system_info.get('hostname', 'Unknown'),
+                f"{system_info.get('os', 'Unknown')} {system_info.get('platform', '')}",
+                cpu_info,
+                memory_gb,
+                timestamp,
+                timestamp,
+                'ONLINE',
+                client_ip
+            ))
             
             # Обновляем список активных агентов
             self.active_agents[agent_id] = {
@@ -435,30 +602,51 @@ class MonitoringServer:
                 'status': 'ONLINE',
                 'monitoring_active': monitoring_status.get('active', False)
             }
-            
+        
         except Exception as e:
             self.log_event(f"❌ Ошибка обновления информации об агенте: {e}", "ERROR", agent_id)
     
+    def get_ingest_stats(self):
+        """Счетчики очереди записи в БД (глубина очереди, задержка пакетов)"""
+        return self.db_writer.get_stats()
+    
+    def get_key_stats(self):
+        """Счетчики поиска ключей (промахи по key_id, пакеты с подбором ключа)"""
+        return self.encryption_keys.get_stats()
+    
+    def _log_ingest_stats(self, stats):
+        """Периодический вывод счетчиков записи в лог"""
+        self.log_event(
+            f"🗄️  Очередь БД: {stats['queue_depth']}/{stats['queue_capacity']}, "
+            f"пакетов: {stats['batches']}, строк: {stats['rows_written']}, "
+            f"задержка пакета: {stats['avg_batch_ms']:.1f} мс (макс. {stats['max_batch_ms']:.1f} мс), "
+            f"отброшено: {stats['rows_dropped']}"
+        )
+        
+        key_stats = self.get_key_stats()
+        self.log_event(
+            f"🔑 Ключи: {key_stats['keys']}, поисков: {key_stats['lookups']}, "
+            f"не найдено: {key_stats['failed_lookups']}, "
+            f"пакетов без key_id: {key_stats['legacy_packets']} (попыток: {key_stats['legacy_attempts']})"
+        )
+    
     def get_agents_summary(self):
         """Получение сводки по агентам"""
         try:
-            # Получаем список агентов из БД
+            # Получаем список агентов из БД (последние метрики - из agent_latest)
             self.db_cursor.execute('''
                 SELECT 
-                    agent_id,
-                    hostname,
-                    os,
-                    status,
-                    ip_address,
-                    last_seen,
-                    (SELECT cpu_percent FROM cpu_monitoring 
-                     WHERE agent_id = agents.agent_id 
-                     ORDER BY timestamp DESC LIMIT 1) as last_cpu,
-                    (SELECT ram_percent FROM memory_monitoring 
-                     WHERE agent_id = agents.agent_id 
-                     ORDER BY timestamp DESC LIMIT 1) as last_ram
-                FROM agents
-                ORDER BY last_seen DESC
+                    a.agent_id,
+                    a.hostname,
+                    a.os,
+                    a.status,
+                    a.ip_address,
+                    a.last_seen,
+                    l.last_cpu,
+                    l.last_ram
+                FROM agents a
+                LEFT JOIN agent_latest l ON l.agent_id = a.agent_id
+                ORDER BY a.last_seen DESC
             ''')
             
             agents = []
@@ -505,8 +693,14 @@ class MonitoringServer:
             self.log_event(f"❌ Ошибка получения сводки: {e}", "ERROR")
             return {}
     
-    def get_agent_details(self, agent_id):
-        """Получение детальной информации об агенте"""
+    def get_agent_details(self, agent_id, hours=24):
+        """
+        Получение детальной информации об агенте
+        
+        Args:
+            agent_id (str): ID агента
+            hours (int): Период истории метрик (для длинных периодов берутся агрегаты)
+        """
         try:
             # Информация об агенте
             self.db_cursor.execute('SELECT * FROM agents WHERE agent_id = ?', (agent_id,))
@@ -521,40 +715,22 @@ class MonitoringServer:
             
             agent_info = dict(zip(columns, agent_row))
             
-            # Последние метрики CPU (24 часа)
-            self.db_cursor.execute('''
-                SELECT timestamp, cpu_percent, cpu_freq 
-                FROM cpu_monitoring 
-                WHERE agent_id = ? AND timestamp > datetime('now', '-1 day')
-                ORDER BY timestamp DESC
-                LIMIT 100
-            ''', (agent_id,))
-            
-            cpu_history = []
-            for row in self.db_cursor.fetchall():
-                cpu_history.append({
-                    'timestamp': row[0],
-                    'cpu_percent': row[1],
-                    'cpu_freq': row[2]
-                })
-            
-            # Последние метрики памяти
-            self.db_cursor.execute('''
-                SELECT timestamp, ram_percent, ram_used_gb, ram_total_gb
-                FROM memory_monitoring 
-                WHERE agent_id = ? AND timestamp > datetime('now', '-1 day')
-                ORDER BY timestamp DESC
-                LIMIT 100
-            ''', (agent_id,))
-            
-            memory_history = []
-            for row in self.db_cursor.fetchall():
-                memory_history.append({
-                    'timestamp': row[0],
-                    'ram_percent': row[1],
-                    'ram_used_gb': row[2],
-                    'ram_total_gb': row[3]
-                })
+            # История CPU и памяти: сырые замеры или самый крупный подходящий уровень свертки
+            tier, cpu_series = get_series(self.db_cursor, agent_id, 'cpu', hours, self.history_retention)
+            cpu_history = [{
+                'timestamp': point['timestamp'],
+                'cpu_percent': point['avg'],
+                'cpu_max': point['max'],
+                'cpu_p95': point['p95']
+            } for point in cpu_series]
+            
+            _, memory_series = get_series(self.db_cursor, agent_id, 'ram', hours, self.history_retention)
+            memory_history = [{
+                'timestamp': point['timestamp'],
+                'ram_percent': point['avg'],
+                'ram_max': point['max'],
+                'ram_p95': point['p95']
+            } for point in memory_series]
             
             # Последние процессы
             self.db_cursor.execute('''
@@ -599,6 +775,7 @@ class MonitoringServer:
                 'agent_info': agent_info,
                 'cpu_history': cpu_history,
                 'memory_history': memory_history,
+                'history_tier': tier,
                 'processes': processes,
                 'events': events,
                 'timestamp': datetime.now().isoformat()
@@ -616,6 +793,10 @@ class MonitoringServer:
             # Получаем заголовок (первые 10 байт)
             header = client_socket.recv(10).decode('utf-8').strip()
             
+            # "SECURE_FILE" длиннее 10 байт - дочитываем последний символ
+            if header == "SECURE_FIL":
+                header += client_socket.recv(1).decode('utf-8')
+            
             if header == "MONITORING":
                 # Получаем размер данных
                 size_data = client_socket.recv(20).decode('utf-8').strip()
@@ -636,6 +817,8 @@ class MonitoringServer:
                     
             elif header == "SECURE_FILE":
                 self._handle_secure_file(client_socket, client_ip)
+            elif header == STREAM_HEADER:
+                self._handle_secure_stream(client_socket, client_ip)
             elif header == "TELEGRAM":
                 self._handle_legacy_telegram(client_socket, client_ip)
             else:
@@ -696,6 +879,42 @@ class MonitoringServer:
             self.log_event(error_msg, "ERROR", client_ip)
             client_socket.send(json.dumps({"status": "error", "message": str(e)}).encode('utf-8'))
     
+    def _handle_secure_stream(self, client_socket, client_ip):
+        """Потоковый прием файла агента (сохраняется как получен, хэш проверяется по ключам)"""
+        try:
+            metadata = read_stream_metadata(client_socket)
+            
+            agent_id = metadata.get('agent_id', client_ip)
+            filename = os.path.basename(metadata.get('filename', 'unknown'))
+            
+            # Создаем папку для агента
+            agent_folder = f"{self.agents_storage}/{agent_id}"
+            os.makedirs(agent_folder, exist_ok=True)
+            
+            result = receive_stream(client_socket, metadata, f"{agent_folder}/{filename}",
+                                    key_ring=self.encryption_keys, upload_dir=self.uploads_storage)
+            
+            if result.get('resumed_from'):
+                self.log_event(f"↩️ Загрузка {filename} продолжена с {result['resumed_from']} байт", agent_id=agent_id)
+            self.log_event(f"💾 Получен файл от {agent_id}: {filename} ({result['payload_size']} байт)", agent_id=agent_id)
+            
+            response = {
+                "status": "success",
+                "message": f"File received: {filename}",
+                "verified": result['verified'],
+                "payload_hash": result['payload_hash']
+            }
+            
+            client_socket.send(json.dumps(response).encode('utf-8'))
+            
+        except Exception as e:
+            error_msg = f"❌ Ошибка потокового приема файла: {e}"
+            self.log_event(error_msg, "ERROR", client_ip)
+            try:
+                client_socket.send(json.dumps({"status": "error", "message": str(e)}).encode('utf-8'))
+            except:
+                pass
+    
     def _handle_legacy_telegram(self, client_socket, client_ip):
         """Обработка старых файлов"""
         try:
@@ -712,6 +931,9 @@ class MonitoringServer:
                     break
                 data += chunk
             
+            if len(data) < data_size:
+                raise ConnectionError(f"Передача прервана: получено {len(data)} из {data_size} байт")
+            
             # Сохраняем
             legacy_path = f"{self.base_storage}/legacy"
             os.makedirs(legacy_path, exist_ok=True)
@@ -764,9 +986,30 @@ class MonitoringServer:
             self.log_event(f"❌ Критическая ошибка сервера: {e}", "ERROR")
         finally:
             server_socket.close()
+            self.rollup_job.stop()
+            self.db_writer.close()
+            self._log_ingest_stats(self.get_ingest_stats())
             self.db_conn.close()
             self.log_event("🔴 Сервер остановлен")
+    
+    def start_async(self, backlog=DEFAULT_BACKLOG, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """
+        Запуск сервера на asyncio вместо потока на каждое подключение
+        
+        Args:
+            backlog (int): Размер очереди входящих подключений
+            max_concurrency (int): Максимум одновременно обрабатываемых подключений
+        """
+        ingest = AsyncIngestServer(self, self.host, self.port,
+                                   backlog=backlog, max_concurrency=max_concurrency)
+        try:
+            ingest.serve_forever()
+        finally:
+            self.rollup_job.stop()
+            self.db_writer.close()
+            self._log_ingest_stats(self.get_ingest_stats())
+            self.db_conn.close()
 
 if __name__ == "__main__":
     server = MonitoringServer(port=9090)
-    server.start()
\ No newline at end of file
+    server.start_async()
\ No newline at end of file
@@ -9,7 +9,13 @@ import hashlib
 import hashlib
 from datetime import datetime
 import threading
-from cryptography.fernet import Fernet, InvalidToken
+import zipfile
+from cryptography.fernet import InvalidToken
+from async_ingest import AsyncIngestServer, DEFAULT_BACKLOG, DEFAULT_MAX_CONCURRENCY
+from secure_transfer import STREAM_HEADER, read_stream_metadata, receive_stream, cleanup_stale_uploads
+from key_ring import KeyRing, KEYED_PREFIX, LEGACY_PREFIX, split_keyed_packet
+from chunk_store import ChunkStore, MANIFEST_SUFFIX, format_report
+from search_index import SearchIndex
 
 class SecureMasterServer:
     def __init__(self, host='0.0.0.0', port=9090):
@@ -24,12 +30,22 @@ class SecureMasterServer:
         self.decrypted_storage = f"{self.base_storage}/decrypted"
         self.logs_path = f"{self.base_storage}/logs"
         self.keys_path = f"{self.base_storage}/keys"
+        self.uploads_storage = f"{self.base_storage}/uploads"  # Незавершенные (возобновляемые) загрузки
         
         # Создаем структуру папок
         self._create_folders()
         
-        # Загружаем ключи шифрования
-        self.encryption_keys = self._load_encryption_keys()
+        # Расшифрованные архивы хранятся частями без повторов (secure_storage/chunks),
+        # в decrypted остаются манифесты <имя>.manifest
+        self.chunk_store = ChunkStore(self.base_storage)
+        # Зашифрованная копия проверенного архива не нужна - данные уже в хранилище частей
+        self.keep_encrypted_copies = False
+        
+        # Полнотекстовый индекс сообщений (пополняется по мере поступления архивов)
+        self.search_index = SearchIndex(f"{self.base_storage}/search_index.db")
+        
+        # Загружаем ключи шифрования (индекс key_id -> ключ)
+        self.encryption_keys = KeyRing(self._load_encryption_keys())
         
         print("=" * 60)
         print("🚀 АВТОНОМНАЯ СИСТЕМА УПРАВЛЕНИЯ - ЗАЩИЩЕННЫЙ СЕРВЕР")
@@ -37,6 +53,7 @@ class SecureMasterServer:
         print(f"📡 Сервер запускается на {self.host}:{self.port}")
         print(f"🔐 Загружено ключей: {len(self.encryption_keys)}")
         print(f"💾 Хранилище: {os.path.abspath(self.base_storage)}")
+        print(format_report(self.get_dedup_stats()))
         print("=" * 60)
     
     def _create_folders(self):
@@ -47,6 +64,7 @@ class SecureMasterServer:
             self.decrypted_storage,
             self.logs_path,
             self.keys_path,
+            self.uploads_storage,
             f"{self.logs_path}/decrypted",
             f"{self.logs_path}/encrypted"
         ]
@@ -54,6 +72,10 @@ class SecureMasterServer:
         for folder in folders:
             os.makedirs(folder, exist_ok=True)
             print(f"📁 Создана папка: {folder}")
+        
+        removed = cleanup_stale_uploads(self.uploads_storage)
+        if removed:
+            print(f"🧹 Удалено брошенных загрузок: {removed}")
     
     def _load_encryption_keys(self):
         """Загрузка ключей шифрования из файлов"""
@@ -80,7 +102,7 @@ class SecureMasterServer:
             with open(key_file, 'wb') as f:
                 f.write(key_data)
             
-            self.encryption_keys[agent_id] = key_data
+            self.encryption_keys.add(agent_id, key_data)
             print(f"💾 Сохранен ключ для агента: {agent_id}")
             return True
         except Exception as e:
@@ -151,29 +173,35 @@ class SecureMasterServer:
             decryption_success = False
             
             if is_encrypted:
-                # Пробуем расшифровать
-                for key_agent_id, key_data in self.encryption_keys.items():
-                    try:
-                        cipher = Fernet(key_data)
-                        
-                        if encrypted_data.startswith(b"ENCRYPTED::"):
-                            decrypted = cipher.decrypt(encrypted_data[10:])
-                        else:
-                            decrypted = cipher.decrypt(encrypted_data)
-                        
-                        # Проверяем хэш
-                        computed_hash = hashlib.sha256(decrypted).hexdigest()
-                        if computed_hash == original_hash:
-                            decrypted_data = decrypted
-                            decryption_success = True
-                            self.log_event(f"✅ Успешно расшифровано ключом от {key_agent_id}", agent_id=agent_id)
-                            break
-                        else:
-                            self.log_event(f"⚠️  Хэши не совпадают для ключа {key_agent_id}", "WARNING", agent_id)
-                    except InvalidToken:
-                        continue
-                    except Exception as e:
-                        self.log_event(f"⚠️  Ошибка расшифровки ключом {key_agent_id}: {e}", "WARNING", agent_id)
+                # Ключ по key_id (из метки пакета или метаданных), без него - подбор
+                token = encrypted_data
+                kid = metadata.get('key_id')
+                if token.startswith(KEYED_PREFIX):
+                    kid, token = split_keyed_packet(token)
+                elif token.startswith(LEGACY_PREFIX):
+                    token = token[len(LEGACY_PREFIX):]
+                
+                decrypted = None
+                if kid:
+                    key_agent_id, cipher = self.encryption_keys.get_cipher(kid)
+                    if cipher:
+                        try:
+                            decrypted = cipher.decrypt(token)
+                        except InvalidToken:
+                            self.log_event(f"⚠️  Файл не расшифрован ключом {kid}", "WARNING", agent_id)
+                    else:
+                        self.log_event(f"⚠️  Неизвестный ключ {kid}", "WARNING", agent_id)
+                else:
+                    key_agent_id, decrypted = self.encryption_keys.trial_decrypt(token)
+                
+                # Проверяем хэш
+                if decrypted is not None:
+                    if hashlib.sha256(decrypted).hexdigest() == original_hash:
+                        decrypted_data = decrypted
+                        decryption_success = True
+                        self.log_event(f"✅ Успешно расшифровано ключом от {key_agent_id}", agent_id=agent_id)
+                    else:
+                        self.log_event(f"⚠️  Хэши не совпадают для ключа {key_agent_id}", "WARNING", agent_id)
                 
                 if not decryption_success:
                     self.log_event("❌ Не удалось расшифровать файл", "ERROR", agent_id)
@@ -203,6 +231,10 @@ class SecureMasterServer:
                     self.log_event("✅ Целостность данных проверена", agent_id=agent_id)
                 else:
                     self.log_event("⚠️  Размеры не совпадают!", "WARNING", agent_id)
+                
+                self._store_deduplicated(decrypted_path, agent_id)
+                if not self.keep_encrypted_copies:
+                    os.remove(encrypted_path)
             
             # Отправляем ответ
             response = {
@@ -224,6 +256,111 @@ class SecureMasterServer:
             except:
                 pass
     
+    def handle_secure_stream(self, client_socket, client_ip):
+        """Потоковый прием защищенного файла (данные пишутся на диск по мере получения)"""
+        try:
+            metadata = read_stream_metadata(client_socket)
+            
+            agent_id = metadata.get('agent_id', client_ip)
+            filename = os.path.basename(metadata.get('filename', 'unknown'))
+            is_encrypted = metadata.get('encrypted', False)
+            
+            self.log_event(f"📁 Получаю файл: {filename} ({metadata.get('original_size', 0)} байт)", agent_id=agent_id)
+            self.log_event(f"🔐 Зашифрован: {'✅ ДА' if is_encrypted else '❌ НЕТ'}", agent_id=agent_id)
+            
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            encrypted_filename = f"{agent_id}_{stamp}_{filename}.enc"
+            decrypted_filename = f"{agent_id}_{stamp}_{filename}"
+            
+            encrypted_path = f"{self.telegram_storage}/{encrypted_filename}"
+            decrypted_path = f"{self.decrypted_storage}/{decrypted_filename}"
+            
+            result = receive_stream(
+                client_socket,
+                metadata,
+                encrypted_path,
+                decrypted_path,
+                key_ring=self.encryption_keys,
+                upload_dir=self.uploads_storage
+            )
+            
+            if result.get('resumed_from'):
+                self.log_event(f"↩️ Загрузка продолжена с {result['resumed_from']} байт", agent_id=agent_id)
+            self.log_event(f"💾 Сохранен зашифрованный файл: {encrypted_filename} ({result['payload_size']} байт)", agent_id=agent_id)
+            
+            if result['verified']:
+                if result['key_agent_id']:
+                    self.log_event(f"✅ Успешно расшифровано ключом от {result['key_agent_id']}", agent_id=agent_id)
+                self.log_event(f"💾 Сохранен расшифрованный файл: {decrypted_filename}", agent_id=agent_id)
+                self.log_event("✅ Целостность данных проверена", agent_id=agent_id)
+                
+                self._store_deduplicated(decrypted_path, agent_id)
+                if not self.keep_encrypted_copies:
+                    os.remove(encrypted_path)
+            elif not result['decrypted']:
+                self.log_event("❌ Не удалось расшифровать файл", "ERROR", agent_id)
+            else:
+                self.log_event(f"⚠️  Хэш или размер не совпадают! ({result['original_size']} байт, "
+                               f"ожидалось: {metadata.get('original_size', 0)})", "WARNING", agent_id)
+            
+            response = {
+                "status": "success",
+                "message": f"Файл получен: {encrypted_filename}",
+                "encrypted_file": encrypted_filename,
+                "decrypted": result['decrypted'],
+                "verified": result['verified'],
+                "payload_hash": result['payload_hash']
+            }
+            
+            client_socket.send(json.dumps(response).encode('utf-8'))
+            
+        except Exception as e:
+            self.log_event(f"❌ Ошибка потокового приема файла: {e}", "ERROR", client_ip)
+            
+            try:
+                client_socket.send(json.dumps({"status": "error", "message": str(e)}).encode('utf-8'))
+            except:
+                pass
+    
+    def _store_deduplicated(self, decrypted_path, agent_id):
+        """
+        Перенос расшифрованного архива в хранилище частей
+        
+        На месте файла остается манифест <имя>.manifest, повторяющиеся
+        части прошлых загрузок повторно не записываются.
+        
+        Returns:
+            str: Путь к манифесту
+        """
+        manifest_path = f"{decrypted_path}{MANIFEST_SUFFIX}"
+        result = self.chunk_store.store_file(decrypted_path, manifest_path, {'agent_id': agent_id})
+        os.remove(decrypted_path)
+        
+        self.log_event(
+            f"🧩 Частей: {result['chunks']} (новых: {result['new_chunks']}), "
+            f"записано {result['new_bytes']} из {result['size']} байт",
+            agent_id=agent_id
+        )
+        
+        # Индексация для поиска - в фоне, ответ агенту не задерживается
+        threading.Thread(target=self._index_for_search, args=(manifest_path, agent_id), daemon=True).start()
+        return manifest_path
+    
+    def _index_for_search(self, archive_path, agent_id):
+        """Загрузка сообщений архива в поисковый индекс (архивы без сообщений пропускаются)"""
+        try:
+            added = self.search_index.index_archive(archive_path)
+            if added:
+                self.log_event(f"🔎 В поисковый индекс добавлено сообщений: {added}", agent_id=agent_id)
+        except zipfile.BadZipFile:
+            pass  # Не zip - искать нечего
+        except Exception as e:
+            self.log_event(f"⚠️ Ошибка индексации {os.path.basename(archive_path)}: {e}", "WARNING", agent_id)
+    
+    def get_dedup_stats(self):
+        """Отчет о дедупликации (данных в архивах, занято на диске, коэффициент)"""
+        return self.chunk_store.get_stats([self.decrypted_storage])
+    
     def handle_client(self, client_socket, address):
         """Обработка подключения от агента"""
         client_ip = address[0]
@@ -232,9 +369,16 @@ class SecureMasterServer:
             # Получаем заголовок (первые 10 байт)
             header = client_socket.recv(10).decode('utf-8').strip()
             
+            # "SECURE_FILE" длиннее 10 байт - дочитываем последний символ
+            if header == "SECURE_FIL":
+                header += client_socket.recv(1).decode('utf-8')
+            
             if header == "SECURE_FILE":
                 self.log_event(f"🔐 Принимаю защищенный файл от {client_ip}")
                 self.handle_secure_file(client_socket, client_ip)
+            elif header == STREAM_HEADER:
+                self.log_event(f"🔐 Принимаю защищенный файл (поток) от {client_ip}")
+                self.handle_secure_stream(client_socket, client_ip)
             elif header == "TELEGRAM":
                 self._handle_legacy_telegram(client_socket, client_ip)
             elif header == "METRICS":
@@ -264,8 +408,9 @@ class SecureMasterServer:
             save_filename = f"legacy_{client_ip}_{timestamp}_{filename_data}"
             save_path = f"{legacy_path}/{save_filename}"
             
+            # Файл появляется под итоговым именем только если принят целиком
             received = 0
-            with open(save_path, "wb") as f:
+            with open(f"{save_path}.part", "wb") as f:
                 while received < data_size:
                     chunk = client_socket.recv(min(4096, data_size - received))
                     if not chunk:
@@ -273,6 +418,11 @@ class SecureMasterServer:
                     f.write(chunk)
                     received += len(chunk)
             
+            if received < data_size:
+                os.remove(f"{save_path}.part")
+                raise ConnectionError(f"Передача прервана: получено {received} из {data_size} байт")
+            os.replace(f"{save_path}.part", save_path)
+            
             self.log_event(f"📝 Получен legacy файл: {save_filename} ({received} байт)", agent_id=client_ip)
             
             response = json.dumps({
@@ -336,8 +486,36 @@ class SecureMasterServer:
             self.log_event(f"❌ Критическая ошибка сервера: {e}", "ERROR")
         finally:
             server_socket.close()
+            self._log_key_stats()
             self.log_event("🔴 Сервер остановлен")
+    
+    def start_async(self, backlog=DEFAULT_BACKLOG, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """
+        Запуск сервера на asyncio вместо потока на каждое подключение
+        
+        Args:
+            backlog (int): Размер очереди входящих подключений
+            max_concurrency (int): Максимум одновременно обрабатываемых подключений
+        """
+        ingest = AsyncIngestServer(self, self.host, self.port,
+                                   backlog=backlog, max_concurrency=max_concurrency)
+        try:
+            ingest.serve_forever()
+        finally:
+            self._log_key_stats()
+    
+    def get_key_stats(self):
+        """Счетчики поиска ключей (промахи по key_id, пакеты с подбором ключа)"""
+        return self.encryption_keys.get_stats()
+    
+    def _log_key_stats(self):
+        stats = self.get_key_stats()
+        self.log_event(
+            f"🔑 Ключи: {stats['keys']}, поисков: {stats['lookups']}, "
+            f"не найдено: {stats['failed_lookups']}, "
+            f"пакетов без key_id: {stats['legacy_packets']} (попыток: {stats['legacy_attempts']})"
+        )
 
 if __name__ == "__main__":
     server = SecureMasterServer(port=9090)
-    server.start()
\ No newline at end of file
+    server.start_async()
\ No newline at end of file
@@ -0,0 +1,219 @@
+"""
+Каталог файлов хранилища для веб-интерфейсов
+Списки файлов папок (архивы, отчеты, статистика) держатся в памяти и
+обновляются опросом времени изменения (mtime) папки: пока папка не
+менялась, запрос обходится одним stat вместо listdir и stat каждого файла.
+
+Добавление, удаление и переименование файла меняют mtime папки. Файлы,
+измененные недавно, дополнительно проверяются при каждом запросе, пока не
+перестанут меняться, а раз в rescan_interval папка пересматривается целиком -
+так замечается и перезапись файла на месте.
+
+Производные данные файла (размер архива по манифесту, сводка JSON,
+начало отчета) считаются один раз и пересчитываются только при изменении
+файла; производные данные папки - через index(), один раз на версию папки.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from functools import cached_property
+
+RESCAN_INTERVAL = 30  # Секунд между полными пересмотрами папки
+HOT_WINDOW = 10  # Секунд: файл, измененный недавно, проверяется при каждом запросе
+HOT_LIMIT = 64  # Таких файлов не больше (остальные - при полном пересмотре)
+
+_NOT_LOADED = object()
+
+class CatalogEntry:
+    """Файл в каталоге"""
+    
+    def __init__(self, folder, name, path, stat):
+        self.folder = folder
+        self.name = name
+        self.path = path
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.mtime = stat.st_mtime
+        self._data = _NOT_LOADED
+    
+    @cached_property
+    def modified(self):
+        """Время изменения (ISO)"""
+        return datetime.fromtimestamp(self.mtime).isoformat()
+    
+    @cached_property
+    def modified_text(self):
+        """Время изменения в формате 2024-01-31 12:00:00"""
+        return datetime.fromtimestamp(self.mtime).strftime('%Y-%m-%d %H:%M:%S')
+    
+    @property
+    def data(self):
+        """Производные данные файла: loader(path) папки, считается при первом обращении"""
+        if self._data is _NOT_LOADED:
+            loader = self.folder.loader
+            self._data = loader(self.path) if loader else None
+        return self._data
+    
+    def same_file(self, stat):
+        return self.mtime_ns == stat.st_mtime_ns and self.size == stat.st_size
+
+class CatalogFolder:
+    """Отслеживаемая папка"""
+    
+    def __init__(self, path, match=None, loader=None):
+        self.path = path
+        self.match = match
+        self.loader = loader
+        self.entries = {}
+        self.ordered = ()
+        self.hot = []
+        self.generation = 0
+        self.dir_mtime_ns = None
+        self.scanned_at = 0.0
+        self.indexes = {}
+
+class StorageCatalog:
+    def __init__(self, rescan_interval=RESCAN_INTERVAL):
+        """
+        Каталог папок хранилища
+        
+        Args:
+            rescan_interval (float): Секунд между полными пересмотрами папки
+                (ловят перезапись файлов на месте; 0 - пересмотр при каждом запросе)
+        """
+        self.rescan_interval = rescan_interval
+        self.folders = {}
+        self.lock = threading.Lock()
+        self.stats = {'checks': 0, 'scans': 0}
+    
+    def watch(self, name, path, match=None, loader=None):
+        """
+        Добавление папки в каталог
+        
+        Args:
+            name (str): Имя папки в каталоге
+            path (str): Путь к папке
+            match: match(имя файла) -> bool, какие файлы учитывать (по умолчанию все)
+            loader: loader(путь) -> производные данные файла (entry.data)
+        """
+        with self.lock:
+            self.folders[name] = CatalogFolder(path, match, loader)
+    
+    def list(self, name):
+        """Файлы папки, новые первыми (кортеж CatalogEntry)"""
+        with self.lock:
+            return self._refresh(self.folders[name]).ordered
+    
+    def get(self, name, filename):
+        """Файл папки по имени (None если нет)"""
+        with self.lock:
+            return self._refresh(self.folders[name]).entries.get(filename)
+    
+    def generation(self, name):
+        """Версия папки: меняется при любом изменении ее файлов"""
+        with self.lock:
+            return self._refresh(self.folders[name]).generation
+    
+    def index(self, name, build):
+        """
+        Производные данные папки: build(entries), пересчитываются только при изменении папки
+        
+        Args:
+            name (str): Имя папки в каталоге
+            build: build(кортеж CatalogEntry, новые первыми) -> результат
+        """
+        with self.lock:
+            folder = self._refresh(self.folders[name])
+            cached = folder.indexes.get(build)
+            if cached is not None and cached[0] == folder.generation:
+                return cached[1]
+            generation, entries = folder.generation, folder.ordered
+        
+        # Строится без блокировки: build может читать файлы (entry.data)
+        result = build(entries)
+        with self.lock:
+            folder.indexes[build] = (generation, result)
+        return result
+    
+    def _refresh(self, folder):
+        """Проверка папки; при изменении - пересмотр ее файлов"""
+        self.stats['checks'] += 1
+        now = time.time()
+        try:
+            dir_mtime_ns = os.stat(folder.path).st_mtime_ns
+        except FileNotFoundError:
+            if folder.entries:
+                self._replace(folder, {})
+            folder.dir_mtime_ns = None
+            return folder
+        
+        if (dir_mtime_ns != folder.dir_mtime_ns
+                or now - folder.scanned_at >= self.rescan_interval
+                # Папка изменилась в ту же секунду, что и прошлый пересмотр, - могли быть еще изменения
+                or dir_mtime_ns / 1e9 >= folder.scanned_at - 1):
+            self._scan(folder, dir_mtime_ns, now)
+        elif folder.hot:
+            self._check_hot(folder, now)
+        return folder
+    
+    def _scan(self, folder, dir_mtime_ns, now):
+        self.stats['scans'] += 1
+        entries = {}
+        changed = False
+        try:
+            with os.scandir(folder.path) as items:
+                for item in items:
+                    if folder.match and not folder.match(item.name):
+                        continue
+                    try:
+                        if not item.is_file():
+                            continue
+                        stat = item.stat()
+                    except FileNotFoundError:
+                        continue
+                    
+                    entry = folder.entries.get(item.name)
+                    if entry is None or not entry.same_file(stat):
+                        entry = CatalogEntry(folder, item.name, item.path, stat)
+                        changed = True
+                    entries[item.name] = entry
+        except FileNotFoundError:
+            entries = {}
+        
+        folder.dir_mtime_ns = dir_mtime_ns
+        folder.scanned_at = now
+        if changed or len(entries) != len(folder.entries):
+            self._replace(folder, entries)
+        # Записи идут от новых к старым - недавно измененные в начале
+        hot = []
+        for entry in folder.ordered[:HOT_LIMIT]:
+            if now - entry.mtime >= HOT_WINDOW:
+                break
+            hot.append(entry.name)
+        folder.hot = hot
+    
+    def _check_hot(self, folder, now):
+        """Недавно измененные файлы: перезапись на месте не меняет mtime папки"""
+        entries = None
+        hot = []
+        for name in folder.hot:
+            entry = folder.entries.get(name)
+            try:
+                stat = os.stat(entry.path)
+            except FileNotFoundError:
+                continue
+            if not entry.same_file(stat):
+                entries = entries if entries is not None else dict(folder.entries)
+                entry = entries[name] = CatalogEntry(folder, name, entry.path, stat)
+            if now - entry.mtime < HOT_WINDOW:
+                hot.append(name)
+        folder.hot = hot
+        if entries is not None:
+            self._replace(folder, entries)
+    
+    @staticmethod
+    def _replace(folder, entries):
+        folder.entries = entries
+        folder.ordered = tuple(sorted(entries.values(), key=lambda entry: entry.mtime, reverse=True))
+        folder.generation += 1
\ No newline at end of file
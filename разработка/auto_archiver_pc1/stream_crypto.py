@@ -0,0 +1,216 @@
+"""
+Потоковое шифрование больших файлов (контейнер AES-GCM по частям)
+Используется агентом (ПК2) и серверами (ПК1) - копии модуля должны совпадать.
+
+Формат:
+    заголовок: MAGIC (6) | версия (1) | key_id (8) | размер части (4) | stream_id (16)
+    часть:     флаг (1) | длина открытых данных (4) | nonce (12) | шифротекст + тег (длина + 16)
+
+Ключ потока выводится через HKDF из ключа агента (Fernet) и stream_id.
+Заголовок, номер части и флаг последней части входят в AAD - перестановка,
+подмена заголовка и обрезка потока обнаруживаются при расшифровке.
+"""
+import base64
+import hashlib
+import os
+import struct
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+MAGIC = b"AASTRM"
+VERSION = 1
+DEFAULT_CHUNK_SIZE = 1024 * 1024  # 1 MB
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+HEADER = struct.Struct('>6sB8sI16s')
+CHUNK_HEADER = struct.Struct('>BI12s')
+TAG_SIZE = 16
+
+FLAG_FINAL = 1
+
+HEADER_SIZE = HEADER.size
+CHUNK_OVERHEAD = CHUNK_HEADER.size + TAG_SIZE
+
+class StreamFormatError(Exception):
+    """Поврежденный, обрезанный или чужой поток"""
+
+def key_id(key):
+    """Идентификатор ключа (первые 8 байт SHA-256, hex; пробелы и перевод строки в файле ключа не учитываются)"""
+    return hashlib.sha256(key.strip()).hexdigest()[:16]
+
+def _stream_key(key, stream_id):
+    """Ключ AES-256 для одного потока"""
+    master = base64.urlsafe_b64decode(key)
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=stream_id, info=b"auto_archiver stream v1")
+    return hkdf.derive(master)
+
+def _aad(header, index, flag):
+    return header + struct.pack('>QB', index, flag)
+
+def encrypted_size(plain_size, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Размер контейнера для файла заданного размера (известен до шифрования)"""
+    chunks = max(1, -(-plain_size // chunk_size))
+    return HEADER_SIZE + chunks * CHUNK_OVERHEAD + plain_size
+
+def read_header(data):
+    """
+    Разбор заголовка контейнера
+    
+    Returns:
+        dict: key_id, chunk_size, stream_id
+    """
+    if len(data) < HEADER_SIZE:
+        raise StreamFormatError("Неполный заголовок потока")
+    
+    magic, version, raw_key_id, chunk_size, stream_id = HEADER.unpack(data[:HEADER_SIZE])
+    if magic != MAGIC:
+        raise StreamFormatError("Неизвестный формат потока")
+    if version != VERSION:
+        raise StreamFormatError(f"Неподдерживаемая версия потока: {version}")
+    if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+        raise StreamFormatError(f"Недопустимый размер части: {chunk_size}")
+    
+    return {'key_id': raw_key_id.hex(), 'chunk_size': chunk_size, 'stream_id': stream_id}
+
+class StreamEncryptor:
+    """
+    Шифрование потока по частям
+    
+    Для продолжения прерванной передачи передаются stream_id уже начатого
+    потока и номер следующей части (start_index) - заголовок повторно не нужен.
+    start_index == 0 при продолжении означает, что получен только заголовок.
+    """
+    
+    def __init__(self, key, chunk_size=DEFAULT_CHUNK_SIZE, stream_id=None, start_index=0):
+        self.chunk_size = chunk_size
+        self.stream_id = stream_id or os.urandom(16)
+        self.header = HEADER.pack(MAGIC, VERSION, bytes.fromhex(key_id(key)), chunk_size, self.stream_id)
+        self._aesgcm = AESGCM(_stream_key(key, self.stream_id))
+        self._index = start_index
+        self._finished = False
+    
+    def encrypt_chunk(self, data, final=False):
+        """Шифрование одной части (не больше chunk_size байт)"""
+        if self._finished:
+            raise StreamFormatError("Поток уже завершен")
+        if len(data) > self.chunk_size:
+            raise ValueError(f"Часть больше {self.chunk_size} байт")
+        
+        flag = FLAG_FINAL if final else 0
+        nonce = os.urandom(12)
+        ciphertext = self._aesgcm.encrypt(nonce, data, _aad(self.header, self._index, flag))
+        
+        self._index += 1
+        self._finished = final
+        return CHUNK_HEADER.pack(flag, len(data), nonce) + ciphertext
+
+class StreamDecryptor:
+    """
+    Расшифровка потока, поданного произвольными кусками
+    
+    Ключ выбирается по key_id из заголовка: key_lookup - функция key_id -> ключ
+    (или None, если ключ неизвестен).
+    """
+    
+    def __init__(self, key_lookup):
+        self.key_lookup = key_lookup
+        self.header_info = None
+        self._buffer = bytearray()
+        self._header = None
+        self._aesgcm = None
+        self._index = 0
+        self.finished = False
+    
+    def feed(self, data):
+        """Добавление данных потока, возвращает расшифрованные байты"""
+        self._buffer += data
+        output = bytearray()
+        
+        if self._header is None:
+            if len(self._buffer) < HEADER_SIZE:
+                return b""
+            self.header_info = read_header(self._buffer)
+            key = self.key_lookup(self.header_info['key_id'])
+            if key is None:
+                raise StreamFormatError(f"Неизвестный ключ: {self.header_info['key_id']}")
+            self._header = bytes(self._buffer[:HEADER_SIZE])
+            self._aesgcm = AESGCM(_stream_key(key, self.header_info['stream_id']))
+            del self._buffer[:HEADER_SIZE]
+        
+        while len(self._buffer) >= CHUNK_HEADER.size:
+            if self.finished:
+                raise StreamFormatError("Данные после последней части")
+            
+            flag, length, nonce = CHUNK_HEADER.unpack(self._buffer[:CHUNK_HEADER.size])
+            if length > self.header_info['chunk_size']:
+                raise StreamFormatError(f"Недопустимая длина части: {length}")
+            
+            frame_size = CHUNK_HEADER.size + length + TAG_SIZE
+            if len(self._buffer) < frame_size:
+                break
+            
+            ciphertext = bytes(self._buffer[CHUNK_HEADER.size:frame_size])
+            try:
+                output += self._aesgcm.decrypt(nonce, ciphertext, _aad(self._header, self._index, flag))
+            except InvalidTag:
+                raise StreamFormatError(f"Часть {self._index} повреждена или подменена")
+            
+            del self._buffer[:frame_size]
+            self._index += 1
+            self.finished = bool(flag & FLAG_FINAL)
+        
+        return bytes(output)
+    
+    def finish(self):
+        """Проверка, что поток дочитан до последней части"""
+        if not self.finished or self._buffer:
+            raise StreamFormatError("Поток обрезан")
+
+def iter_encrypt(fileobj, key, chunk_size=DEFAULT_CHUNK_SIZE, stream_id=None, start_index=0, resume=False):
+    """
+    Генератор контейнера: заголовок, затем зашифрованные части файла
+    
+    С resume=True продолжает поток stream_id с части start_index (0 - у
+    получателя только заголовок): fileobj должен стоять на позиции
+    start_index * chunk_size, заголовок не выдается.
+    """
+    if resume and stream_id is None:
+        raise ValueError("Для продолжения потока нужен stream_id")
+    
+    encryptor = StreamEncryptor(key, chunk_size, stream_id, start_index)
+    if not resume:
+        yield encryptor.header
+    
+    chunk = fileobj.read(chunk_size)
+    # Все части уже переданы - продолжать нечего
+    if start_index and not chunk:
+        return
+    while True:
+        next_chunk = fileobj.read(chunk_size)
+        yield encryptor.encrypt_chunk(chunk, final=not next_chunk)
+        if not next_chunk:
+            return
+        chunk = next_chunk
+
+def iter_decrypt(fileobj, key_lookup, read_size=DEFAULT_CHUNK_SIZE):
+    """Генератор расшифрованных данных контейнера из файла"""
+    decryptor = StreamDecryptor(key_lookup)
+    for data in iter(lambda: fileobj.read(read_size), b""):
+        plain = decryptor.feed(data)
+        if plain:
+            yield plain
+    decryptor.finish()
+
+def encrypt_file(src_path, dst_path, key, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Шифрование файла в контейнер"""
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        for block in iter_encrypt(src, key, chunk_size):
+            dst.write(block)
+
+def decrypt_file(src_path, dst_path, key_lookup):
+    """Расшифровка контейнера в файл"""
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        for block in iter_decrypt(src, key_lookup):
+            dst.write(block)
\ No newline at end of file
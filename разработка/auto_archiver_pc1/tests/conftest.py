@@ -0,0 +1,10 @@
+"""
+Тесты модулей сервера ПК1
+Модули лежат плоско и импортируют друг друга по имени - как при запуске
+из папки сервера, поэтому она добавляется в sys.path.
+Запуск: python -m pytest tests (из папки auto_archiver_pc1)
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
\ No newline at end of file
@@ -0,0 +1,148 @@
+import json
+import os
+import zipfile
+
+import pytest
+
+import ai_analyzer
+from ai_analyzer import AIAnalyzer, AnalysisCache, MessageStream, is_message_member, message_total
+
+MESSAGES = [{'id': i, 'text': f"сообщение {i}", 'sender_id': i % 3} for i in range(5)]
+
+def write_archive(path, messages):
+    with zipfile.ZipFile(path, 'w') as zip_ref:
+        zip_ref.writestr("chat/header.json", json.dumps({'total_messages': len(messages)}))
+        zip_ref.writestr("chat/messages.ndjson", "".join(json.dumps(msg) + "\n" for msg in messages))
+    return str(path)
+
+def chat(first, count):
+    return [{'id': i, 'text': f"хорошо сообщение {i}", 'sender_id': i % 4,
+             'date': f"2024-03-01T12:{i % 60:02d}:00"} for i in range(first, first + count)]
+
+@pytest.fixture
+def archive(tmp_path):
+    path = str(tmp_path / "chat.zip")
+    with zipfile.ZipFile(path, 'w') as zip_ref:
+        zip_ref.writestr("chat/header.json", json.dumps({'total_messages': len(MESSAGES)}))
+        zip_ref.writestr("chat/messages.ndjson", "".join(json.dumps(msg) + "\n" for msg in MESSAGES))
+        # Документ application/json из канала - медиа, а не сообщения
+        zip_ref.writestr("chat/media/media_chat_7.json", json.dumps({'messages': [{'id': 100}]}))
+        zip_ref.writestr("chat/media/media_chat_8.jpg", b"\xff\xd8")
+        zip_ref.writestr("chat/settings.json", json.dumps({'messages': [{'id': 200}]}))
+    return path
+
+def members(path):
+    with zipfile.ZipFile(path) as zip_ref:
+        return [name for name in zip_ref.namelist() if is_message_member(name)]
+
+@pytest.mark.parametrize('name, expected', [
+    ("chat/messages.ndjson", True),
+    ("chat/metadata.json", True),
+    ("metadata.json", True),
+    ("media/messages.ndjson", True),  # канал с именем media
+    ("chat/header.json", False),
+    ("chat/media/media_chat_7.json", False),
+    ("chat/media/metadata.json", False),
+    ("chat/media/media_chat_9.ndjson", False),
+    ("chat/export.json", False),
+])
+def test_is_message_member(name, expected):
+    assert is_message_member(name) == expected
+
+def test_media_json_is_not_read_as_messages(archive):
+    assert members(archive) == ["chat/messages.ndjson"]
+    assert [msg['id'] for msg in MessageStream(archive, members(archive))] == [msg['id'] for msg in MESSAGES]
+
+def test_message_total(archive, tmp_path):
+    with zipfile.ZipFile(archive) as zip_ref:
+        assert message_total(zip_ref, members(archive)) == len(MESSAGES)
+    
+    # У metadata.json старого формата заголовка нет - число сообщений неизвестно
+    legacy = str(tmp_path / "legacy.zip")
+    with zipfile.ZipFile(legacy, 'w') as zip_ref:
+        zip_ref.writestr("chat/metadata.json", json.dumps({'messages': MESSAGES}))
+    with zipfile.ZipFile(legacy) as zip_ref:
+        assert message_total(zip_ref, members(legacy)) is None
+    assert len(MessageStream(legacy, members(legacy))) == len(MESSAGES)
+
+class Run:
+    """Анализ всех архивов хранилища: какие архивы разбирались и общие итоги"""
+    
+    def __init__(self, storage, monkeypatch, **kwargs):
+        analyzer = AIAnalyzer(storage, analysis_workers=1)
+        analyze = analyzer._analyze_archive
+        self.analyzed = []
+        
+        def spy(path, progress=None):
+            self.analyzed.append(os.path.basename(path))
+            return analyze(path, progress)
+        
+        def global_report(results, total=None):
+            self.total = total.results()
+        
+        monkeypatch.setattr(analyzer, '_analyze_archive', spy)
+        monkeypatch.setattr(analyzer, '_create_global_report', global_report)
+        self.results = analyzer.analyze_all_archives(**kwargs)
+        self.cache = analyzer.cache
+
+@pytest.fixture
+def storage(tmp_path):
+    os.makedirs(tmp_path / "decrypted")
+    for n in range(3):
+        write_archive(tmp_path / "decrypted" / f"chat_{n}.zip", chat(n * 100, 50))
+    return str(tmp_path)
+
+def test_cache_reanalyzes_only_changed_archive(storage, monkeypatch):
+    first = Run(storage, monkeypatch)
+    assert sorted(first.analyzed) == ["chat_0.zip", "chat_1.zip", "chat_2.zip"]
+    assert first.total['basic_stats']['total_messages'] == 150
+    
+    # Новый процесс: хэши и результаты берутся с диска
+    again = Run(storage, monkeypatch)
+    assert again.analyzed == []
+    assert again.cache.stats == {'hits': 3, 'misses': 0}
+    assert again.total == first.total
+    
+    # Архив заменен - разбирается только он, итоги как при полном анализе
+    write_archive(os.path.join(storage, "decrypted", "chat_1.zip"), chat(1000, 80))
+    changed = Run(storage, monkeypatch)
+    assert changed.analyzed == ["chat_1.zip"]
+    assert changed.cache.stats == {'hits': 2, 'misses': 1}
+    assert changed.total['basic_stats']['total_messages'] == 180
+    
+    fresh = Run(storage, monkeypatch, use_cache=False)
+    assert len(fresh.analyzed) == 3
+    assert changed.total == fresh.total
+
+def test_archive_hash_uses_size_and_mtime(tmp_path):
+    path = write_archive(tmp_path / "chat.zip", MESSAGES)
+    cache = AnalysisCache(str(tmp_path / "cache"))
+    digest = cache.archive_hash(path)
+    cache.save()
+    
+    # Тот же размер и время изменения - файл не перечитывается
+    stat = os.stat(path)
+    with open(path, 'r+b') as f:
+        f.write(b"X")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    cache = AnalysisCache(str(tmp_path / "cache"))
+    assert cache.archive_hash(path) == digest
+    
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert cache.archive_hash(path) != digest
+
+def test_cache_key_depends_on_version_and_dictionaries(tmp_path, monkeypatch, storage):
+    cache = AnalysisCache(str(tmp_path / "cache"), tag="a")
+    cache.put("digest", {'summary': ""}, None)
+    assert cache.get("digest") is not None
+    assert AnalysisCache(str(tmp_path / "cache"), tag="b").get("digest") is None
+    monkeypatch.setattr(ai_analyzer, 'ANALYZER_VERSION', "other")
+    assert cache.get("digest") is None
+    monkeypatch.undo()
+    
+    assert len(Run(storage, monkeypatch).analyzed) == 3
+    assert Run(storage, monkeypatch).analyzed == []
+    # Словари пользователя изменились - отпечаток другой, архивы разбираются заново
+    with open(os.path.join(storage, "ai_results", "dictionaries.json"), 'w', encoding='utf-8') as f:
+        json.dump({'positive': ["отлично"]}, f)
+    assert len(Run(storage, monkeypatch).analyzed) == 3
\ No newline at end of file
@@ -0,0 +1,125 @@
+import io
+import os
+import random
+import zipfile
+
+import pytest
+
+from chunk_store import (GC_MIN_AGE, MANIFEST_SUFFIX, MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, ChunkStore, archive_size,
+                         iter_chunks, open_archive, read_manifest)
+
+DATA = random.Random(1).randbytes(6 * 1024 * 1024)
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkStore(str(tmp_path / "store"))
+
+def store_data(store, tmp_path, name, data):
+    src = tmp_path / name
+    src.write_bytes(data)
+    manifest_path = str(tmp_path / f"{name}{MANIFEST_SUFFIX}")
+    stats = store.store_file(str(src), manifest_path)
+    return manifest_path, stats
+
+def test_chunk_sizes():
+    chunks = list(iter_chunks(io.BytesIO(DATA)))
+    assert b"".join(chunks) == DATA
+    assert all(MIN_CHUNK_SIZE <= len(chunk) <= MAX_CHUNK_SIZE for chunk in chunks[:-1])
+    assert len(chunks) > 2
+
+def test_same_file_is_stored_once(store, tmp_path):
+    _, first = store_data(store, tmp_path, "a.zip", DATA)
+    _, second = store_data(store, tmp_path, "b.zip", DATA)
+    
+    assert first['new_chunks'] == first['chunks']
+    assert second['new_chunks'] == 0
+    assert second['new_bytes'] == 0
+    assert store.get_stats([str(tmp_path)])['stored_bytes'] == len(DATA)
+
+def test_insertion_changes_only_nearby_chunks(store, tmp_path):
+    store_data(store, tmp_path, "a.zip", DATA)
+    changed = DATA[:1000] + b"inserted" + DATA[1000:]
+    manifest_path, second = store_data(store, tmp_path, "b.zip", changed)
+    
+    assert second['new_chunks'] == 1
+    assert second['new_bytes'] < MAX_CHUNK_SIZE + len(b"inserted")
+    
+    store.restore(manifest_path, str(tmp_path / "restored.zip"))
+    assert (tmp_path / "restored.zip").read_bytes() == changed
+
+def test_corrupted_chunk_is_detected(store, tmp_path):
+    manifest_path, _ = store_data(store, tmp_path, "a.zip", DATA)
+    digest = read_manifest(manifest_path)['chunks'][0][0]
+    with open(store._chunk_path(digest), 'r+b') as f:
+        f.write(b"x")
+    
+    with pytest.raises(ValueError):
+        store.restore(manifest_path, str(tmp_path / "restored.zip"))
+    assert not os.path.exists(tmp_path / "restored.zip")
+
+def test_collect_garbage_keeps_referenced_chunks(store, tmp_path):
+    manifest_path, _ = store_data(store, tmp_path, "a.zip", DATA)
+    other_path, other = store_data(store, tmp_path, "b.zip", random.Random(2).randbytes(MIN_CHUNK_SIZE))
+    os.remove(other_path)
+    
+    removed, freed = store.collect_garbage([str(tmp_path)])
+    assert (removed, freed) == (other['chunks'], other['size'])
+    
+    store.restore(manifest_path, str(tmp_path / "restored.zip"))
+    assert (tmp_path / "restored.zip").read_bytes() == DATA
+
+def test_collect_garbage_skips_recent_chunks(store, tmp_path):
+    data = random.Random(2).randbytes(MIN_CHUNK_SIZE)
+    manifest_path, stats = store_data(store, tmp_path, "a.zip", data)
+    chunk_path = store._chunk_path(read_manifest(manifest_path)['chunks'][0][0])
+    os.remove(manifest_path)
+    
+    def age():
+        stale = os.path.getmtime(chunk_path) - 2 * GC_MIN_AGE
+        os.utime(chunk_path, (stale, stale))
+    
+    # Свежая часть без манифеста - возможно, загрузка еще идет
+    assert store.collect_garbage([str(tmp_path)], min_age=GC_MIN_AGE) == (0, 0)
+    # Старая часть, повторно записанная новой загрузкой, снова свежая
+    age()
+    store.put_chunk(data)
+    assert store.collect_garbage([str(tmp_path)], min_age=GC_MIN_AGE) == (0, 0)
+    
+    age()
+    assert store.collect_garbage([str(tmp_path)], min_age=GC_MIN_AGE) == (stats['chunks'], stats['size'])
+
+def test_manifest_reader_seek(store, tmp_path):
+    manifest_path, _ = store_data(store, tmp_path, "a.zip", DATA)
+    offsets = [0]
+    for _, length in read_manifest(manifest_path)['chunks']:
+        offsets.append(offsets[-1] + length)
+    
+    assert archive_size(manifest_path) == len(DATA)
+    with open_archive(manifest_path) as f:
+        # Чтение через границы частей в произвольном порядке
+        for position in [offsets[2] - 10, 5, offsets[1] - 1, len(DATA) - 3]:
+            f.seek(position)
+            assert f.read(100) == DATA[position:position + 100]
+        
+        f.seek(-50, io.SEEK_END)
+        assert f.read() == DATA[-50:]
+        assert f.read(10) == b""
+        
+        f.seek(offsets[1] - 20)
+        f.seek(40, io.SEEK_CUR)
+        assert f.tell() == offsets[1] + 20
+        assert f.read(8) == DATA[offsets[1] + 20:offsets[1] + 28]
+        
+        with pytest.raises(ValueError):
+            f.seek(-1)
+
+def test_zip_opens_through_manifest(store, tmp_path):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr("chat/messages.ndjson", DATA[:MAX_CHUNK_SIZE].hex())
+        archive.writestr("chat/header.json", '{"count": 1}')
+    manifest_path, _ = store_data(store, tmp_path, "chat.zip", buffer.getvalue())
+    
+    with zipfile.ZipFile(open_archive(manifest_path)) as archive:
+        assert archive.read("chat/header.json") == b'{"count": 1}'
+        assert archive.read("chat/messages.ndjson") == DATA[:MAX_CHUNK_SIZE].hex().encode()
\ No newline at end of file
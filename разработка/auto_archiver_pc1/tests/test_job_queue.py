@@ -0,0 +1,144 @@
+import threading
+import time
+
+import pytest
+
+import job_queue
+from job_queue import CANCELLED, DONE, FAILED, PENDING, RUNNING, JobQueue
+
+TIMEOUT = 5
+
+def wait_for(queue, job_id, *statuses):
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Задача #{job_id}: {queue.get(job_id)['status']}, ожидалось {statuses}")
+
+class Handlers(dict):
+    """Обработчики задач теста: echo - сразу, block - до release или отмены, fail - ошибка"""
+    
+    def __init__(self):
+        super().__init__(echo=self.echo, block=self.block, fail=self.fail)
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.calls = []
+    
+    def echo(self, job):
+        self.calls.append(job.id)
+        job.progress(3, 3)
+        return {'params': job.params}
+    
+    def block(self, job):
+        self.calls.append(job.id)
+        self.started.set()
+        done = 0
+        while not self.release.wait(0.01):
+            if job.cancelled:
+                raise RuntimeError("остановлено")
+            done += 1
+            job.progress(done)
+        return 'released'
+    
+    def fail(self, job):
+        raise ValueError("сломано")
+
+@pytest.fixture
+def handlers():
+    return Handlers()
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+@pytest.fixture
+def queue(db_path, handlers, monkeypatch):
+    monkeypatch.setattr(job_queue, 'POLL_INTERVAL', 0.05)
+    queue = JobQueue(db_path, handlers, workers=1)
+    yield queue
+    handlers.release.set()
+    queue.close()
+
+def test_run_and_result(queue, handlers):
+    queue.start()
+    job, created = queue.submit('echo', {'x': 1})
+    assert created
+    
+    job = wait_for(queue, job['id'], DONE)
+    assert job['result'] == {'params': {'x': 1}}
+    assert job['progress'] == {'done': 3, 'total': 3, 'percent': 100.0}
+    
+    failed = wait_for(queue, queue.submit('fail')[0]['id'], FAILED)
+    assert failed['error'] == "сломано"
+    with pytest.raises(ValueError):
+        queue.submit('unknown')
+
+def test_dedup(queue, handlers):
+    first, created = queue.submit('echo', {'a': 1, 'b': 2})
+    again, created_again = queue.submit('echo', {'b': 2, 'a': 1})
+    other, created_other = queue.submit('echo', {'a': 2})
+    assert created and not created_again and created_other
+    assert again['id'] == first['id'] != other['id']
+    
+    # Ключ dedup: параметры выполнения второй задачи не создают
+    single, _ = queue.submit('block', {'workers': 1}, dedup="")
+    same, created = queue.submit('block', {'workers': 4, 'use_cache': False}, dedup="")
+    assert not created and same['id'] == single['id']
+    assert same['params'] == {'workers': 1}
+    
+    # Завершенная задача повторной постановке не мешает
+    queue.start()
+    wait_for(queue, first['id'], DONE)
+    assert queue.submit('echo', {'a': 1, 'b': 2})[1]
+
+def test_cancel_pending(queue, handlers):
+    blocker, _ = queue.submit('block')
+    waiting, _ = queue.submit('echo')
+    queue.start()
+    handlers.started.wait(TIMEOUT)
+    
+    assert queue.cancel(waiting['id'])['status'] == CANCELLED
+    assert queue.cancel(12345) is None
+    handlers.release.set()
+    wait_for(queue, blocker['id'], DONE)
+    assert waiting['id'] not in handlers.calls
+    # Отмененная задача больше не активна - такую же можно поставить снова
+    assert queue.submit('echo')[1]
+
+def test_cancel_running(queue, handlers):
+    queue.start()
+    job, _ = queue.submit('block')
+    handlers.started.wait(TIMEOUT)
+    while not queue.get(job['id'])['progress']['done']:
+        time.sleep(0.01)
+    
+    running = queue.cancel(job['id'])
+    assert running['cancel_requested']
+    job = wait_for(queue, job['id'], CANCELLED)
+    assert job['progress']['done'] > 0
+    assert job['error'] is None
+
+def test_interrupted_jobs_are_requeued(db_path, handlers, monkeypatch):
+    monkeypatch.setattr(job_queue, 'POLL_INTERVAL', 0.05)
+    
+    # Сервер остановлен посреди задач: обе остались в статусе running
+    first = JobQueue(db_path, handlers)
+    resumed, _ = first.submit('echo', {'n': 1})
+    dropped, _ = first.submit('echo', {'n': 2})
+    first.conn.execute('UPDATE jobs SET status = ?, progress_done = 7', (RUNNING,))
+    first.conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ?', (dropped['id'],))
+    first.conn.commit()
+    first.close()
+    
+    second = JobQueue(db_path, handlers)
+    try:
+        assert second.get(resumed['id'])['status'] == RUNNING
+        second.start()
+        assert wait_for(second, resumed['id'], DONE)['progress']['done'] == 3
+        assert second.get(dropped['id'])['status'] == CANCELLED
+        assert handlers.calls == [resumed['id']]
+        assert second.get_stats()[PENDING] == 0
+    finally:
+        second.close()
\ No newline at end of file
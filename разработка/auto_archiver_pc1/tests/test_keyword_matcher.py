@@ -0,0 +1,92 @@
+import pickle
+import random
+
+import pytest
+
+import keyword_matcher
+from keyword_matcher import KeywordMatcher, stem, tokenize
+
+DICTIONARIES = {
+    'positive': ["хорошо", "люблю", "очень хорошо"],
+    'negative': ["не люблю", "плохо", "плохой"],
+    'topic:погода': ["дождь", "прогноз погоды", "сильный ветер"]
+}
+
+@pytest.fixture
+def matcher():
+    return KeywordMatcher(DICTIONARIES)
+
+def reference_count(dictionaries, words, normalize=stem):
+    """Перебор: категория засчитывается один раз на слово, на котором кончается ее термин"""
+    tokens = [normalize(word) for word in words]
+    counts = {}
+    for category, terms in dictionaries.items():
+        phrases = {tuple(normalize(word) for word in tokenize(term)) for term in terms}
+        for end in range(1, len(tokens) + 1):
+            if any(phrase and tuple(tokens[end - len(phrase):end]) == phrase for phrase in phrases):
+                counts[category] = counts.get(category, 0) + 1
+    return counts
+
+@pytest.mark.parametrize('word, expected', [
+    ("хороший", "хорош"),
+    ("хорошая", "хорош"),
+    ("хорошо", "хорош"),
+    ("учиться", "учи"),
+    ("ёлками", "елк"),
+    ("дом", "дом"),
+    ("мой", "мой"),  # короче MIN_STEM не обрезается
+])
+def test_stem(word, expected):
+    assert stem(word) == expected
+
+def test_word_forms_match_by_stem(matcher):
+    assert matcher.count_text("Хороший день, хорошая погода") == {'positive': 2}
+    assert matcher.count_text("Прогноз: дожди") == {'topic:погода': 1}
+
+def test_phrases(matcher):
+    # Фраза засчитывается, только если слова идут подряд
+    assert matcher.count_text("прогноз на завтра: погоды не будет") == {}
+    assert matcher.count_text("Прогнозы погоды обещают сильный ветер") == {'topic:погода': 2}
+    # «не люблю» - негатив, «люблю» внутри него - позитив (разные категории)
+    assert matcher.count_text("я не люблю дождь") == {'negative': 1, 'positive': 1, 'topic:погода': 1}
+    # «очень хорошо» и «хорошо» одной категории кончаются на одном слове - одно вхождение
+    assert matcher.count_text("очень хорошо") == {'positive': 1}
+
+def test_overlapping_phrases_use_suffix_links():
+    matcher = KeywordMatcher({'a': ["красный синий зеленый"], 'b': ["синий зеленый желтый"]})
+    assert matcher.count_text("красный синий зеленый желтый") == {'a': 1, 'b': 1}
+    assert matcher.count_text("красный красный синий зеленый") == {'a': 1}
+
+def test_duplicate_terms_counted_once():
+    matcher = KeywordMatcher({'a': ["дождь", "дожди", "Дождь"]})
+    assert matcher.terms == 1
+    assert matcher.count_text("дождь и дожди") == {'a': 2}
+
+def test_without_stemming():
+    matcher = KeywordMatcher({'a': ["хорошо"]}, stemming=False)
+    assert matcher.count_text("хорошо, хороший") == {'a': 1}
+
+def test_matches_reference():
+    rng = random.Random(7)
+    vocabulary = ["хорошо", "хороший", "не", "люблю", "любят", "плохо", "очень", "дождь", "дожди",
+                  "прогноз", "погоды", "сильный", "ветер", "кот", "и"]
+    matcher = KeywordMatcher(DICTIONARIES)
+    for _ in range(300):
+        words = [rng.choice(vocabulary) for _ in range(rng.randint(0, 12))]
+        assert matcher.count(words) == reference_count(DICTIONARIES, words)
+
+def test_memo_is_bounded_and_not_pickled(matcher, monkeypatch):
+    monkeypatch.setattr(keyword_matcher, 'MEMO_LIMIT', 3)
+    for text in ["хорошо", "плохо", "дождь", "кот", "хорошо плохо"]:
+        assert matcher.count_text(text) == reference_count(DICTIONARIES, tokenize(text))
+        assert len(matcher._memo) <= 3
+    
+    copy = pickle.loads(pickle.dumps(matcher))
+    assert copy._memo == {}
+    assert copy.count_text("не люблю") == matcher.count_text("не люблю")
+
+def test_fingerprint():
+    reordered = {category: list(reversed(terms)) for category, terms in reversed(list(DICTIONARIES.items()))}
+    assert KeywordMatcher(reordered).fingerprint == KeywordMatcher(DICTIONARIES).fingerprint
+    assert KeywordMatcher({**DICTIONARIES, 'positive': ["отлично"]}).fingerprint != KeywordMatcher(DICTIONARIES).fingerprint
+    assert KeywordMatcher(DICTIONARIES, stemming=False).fingerprint != KeywordMatcher(DICTIONARIES).fingerprint
\ No newline at end of file
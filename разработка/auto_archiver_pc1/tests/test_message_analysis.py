@@ -0,0 +1,79 @@
+import pickle
+import random
+
+import pytest
+
+import message_analysis
+from message_analysis import (Anomalies, ColumnarAnomalies, ColumnarUsers, MessageAnalysis, Users,
+                              SPAM_MIN_MESSAGES, LONG_MESSAGE)
+
+np = pytest.importorskip("numpy")
+
+ROW = (Users, Anomalies)
+COLUMNAR = (ColumnarUsers, ColumnarAnomalies)
+
+def burst(sender, start, count, step, suffix=""):
+    """count сообщений отправителя через step секунд начиная с start (секунды от 12:00)"""
+    return [{'id': start + i, 'sender_id': sender, 'text': "всплеск",
+             'date': f"2024-03-01T{12 + (start + i * step) // 3600:02d}:"
+                     f"{(start + i * step) // 60 % 60:02d}:{(start + i * step) % 60:02d}{suffix}"}
+            for i in range(count)]
+
+def messages():
+    rng = random.Random(3)
+    result = []
+    result += burst(1, 0, SPAM_MIN_MESSAGES + 5, 10)               # всплеск
+    result += burst("1", 100, SPAM_MIN_MESSAGES + 5, 10)           # тот же id строкой - другой отправитель
+    result += burst("spammer", 200, SPAM_MIN_MESSAGES + 1, 60, "+03:00")
+    result += burst(2, 0, SPAM_MIN_MESSAGES + 5, 120)              # растянуто дольше SPAM_MAX_SPAN
+    result += burst(3, 0, SPAM_MIN_MESSAGES + 5, 1)
+    result[-1]['date'] = "2024-03-01T12:00:00Z"                    # даты с поясом и без - не сравниваются
+    result += burst(4, 0, SPAM_MIN_MESSAGES + 5, 1)
+    result[-1]['date'] = "вчера"                                   # неразобранная дата
+    result += burst(None, 0, SPAM_MIN_MESSAGES + 2, 1)
+    # Постоянный участник: пишет несколько часов, но однажды - всплеск
+    result += burst(9, 0, 30, 900) + burst(9, 30000, SPAM_MIN_MESSAGES + 1, 10)
+    # Ровно SPAM_MIN_MESSAGES сообщений подряд - еще не всплеск
+    result += burst(11, 0, 30, 900) + burst(11, 30000, SPAM_MIN_MESSAGES, 10)
+    for i in range(500):
+        msg = {'id': 1000 + i, 'text': "слово " * rng.randint(0, 300)}
+        if rng.random() < 0.9:
+            msg['sender_id'] = rng.choice([5, 6, "7", "5", 8])
+        if rng.random() < 0.8:
+            msg['date'] = f"2024-03-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00"
+        if rng.random() < 0.05:
+            msg['date'] = "2024-03-05 10:15:30.250000"
+        result.append(msg)
+    rng.shuffle(result)
+    return result
+
+def analyze(accumulators, data, parts=1):
+    partials = [MessageAnalysis(accumulators).feed(data[i::parts]) for i in range(parts)]
+    total = partials[0]
+    for partial in partials[1:]:
+        # Частичные итоги передаются между процессами
+        total.merge(pickle.loads(pickle.dumps(partial)))
+    return total.results()
+
+@pytest.mark.parametrize('batch', [7, 100_000])
+@pytest.mark.parametrize('parts', [1, 3])
+def test_columnar_matches_rows(monkeypatch, batch, parts):
+    monkeypatch.setattr(message_analysis, 'COLUMN_BATCH', batch)
+    data = messages()
+    
+    expected = analyze(ROW, data, parts)
+    assert analyze(COLUMNAR, data, parts) == expected
+    
+    # Сравнение имеет смысл, только если аномалии действительно найдены
+    spam = {(type(a['user_id']), a['user_id']) for a in expected['anomalies'] if a['type'] == 'possible_spam'}
+    assert spam == {(int, 1), (str, "1"), (str, "spammer"), (type(None), None), (int, 9)}
+    regular = next(a for a in expected['anomalies'] if a.get('user_id') == 9)
+    assert regular['messages_count'] == 30 + SPAM_MIN_MESSAGES + 1
+    assert regular['time_span_seconds'] == SPAM_MIN_MESSAGES * 10
+    assert any(a['type'] == 'very_long_message' and a['length'] > LONG_MESSAGE for a in expected['anomalies'])
+
+def test_integer_senders_stay_integer():
+    data = burst(10**12, 0, SPAM_MIN_MESSAGES + 1, 1)
+    anomalies = analyze(COLUMNAR, data)['anomalies']
+    assert anomalies == analyze(ROW, data)['anomalies']
+    assert anomalies[0]['user_id'] == 10**12
\ No newline at end of file
@@ -0,0 +1,82 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import rollup
+from rollup import ROLLUP_SCHEMA, RollupJob, choose_tier, get_series, get_window_stats
+
+NOW = datetime(2024, 3, 10, 12, 0, 0)
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+@pytest.mark.parametrize('hours, tier', [
+    (0.5, 'raw'),              # 30 минутных точек мало, сырые данные еще хранятся
+    (1, '1m'),
+    (24 * 30, '1h'),
+    (24 * 365, '1d'),
+    (24 * 365 * 2, '1d'),
+    (24 * 365 * 5, '1d'),      # длиннее хранения всех уровней - самый долгий, не raw
+])
+def test_choose_tier(hours, tier):
+    assert choose_tier(hours) == tier
+
+def test_choose_tier_prefers_covering_tier_over_expired_raw():
+    retention = dict(rollup.DEFAULT_RETENTION, raw=timedelta(hours=1))
+    # 3 часа: 1h дает 3 точки, 1m - 180, но 1m хранится неделю - он и выбирается
+    assert choose_tier(3, retention) == '1m'
+    retention['1m'] = timedelta(hours=2)
+    assert choose_tier(3, retention) == '1h'
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """База с замерами CPU агента каждые 10 секунд за последние 3 часа, свернутая по уровням"""
+    monkeypatch.setattr(rollup, 'datetime', FrozenDatetime)
+    path = str(tmp_path / 'monitoring.db')
+    conn = sqlite3.connect(path)
+    for table, column in rollup.METRICS.values():
+        conn.execute(f'CREATE TABLE {table} (agent_id TEXT, timestamp TIMESTAMP, {column} REAL)')
+    for sql in ROLLUP_SCHEMA:
+        conn.execute(sql)
+    
+    moment = NOW - timedelta(hours=3)
+    rows = []
+    while moment < NOW:
+        rows.append(('agent', str(moment), moment.second + moment.minute))
+        moment += timedelta(seconds=10)
+    conn.executemany('INSERT INTO cpu_monitoring VALUES (?, ?, ?)', rows)
+    conn.commit()
+    
+    RollupJob(path, late_margin=0).run_once(now=NOW, with_retention=False)
+    yield conn
+    conn.close()
+
+def raw_window(conn, start):
+    return conn.execute('SELECT AVG(cpu_percent), MAX(cpu_percent), COUNT(*) FROM cpu_monitoring '
+                        'WHERE timestamp >= ?', (str(start),)).fetchone()
+
+@pytest.mark.parametrize('hours', [1, 1.505, 2.25])
+def test_window_stats_match_raw_samples(db, hours):
+    """Первая корзина не захватывает замеры до начала периода"""
+    stats = get_window_stats(db.cursor(), 'agent', 'cpu', hours)
+    avg, maximum, samples = raw_window(db, NOW - timedelta(hours=hours))
+    
+    assert stats['tier'] == '1m'
+    assert stats['samples'] == samples
+    assert stats['max'] == maximum
+    assert stats['avg'] == pytest.approx(avg)
+
+def test_series_starts_inside_window(db):
+    start = NOW - timedelta(hours=1.505)
+    tier, series = get_series(db.cursor(), 'agent', 'cpu', 1.505)
+    
+    assert tier == '1m'
+    timestamps = [str(point['timestamp']) for point in series]
+    assert min(timestamps) >= str(start)
+    assert timestamps == sorted(timestamps, reverse=True)
+    # Между началом периода и первой целой корзиной - сырые замеры
+    assert any(len(value) > 19 or not value.endswith(':00') for value in timestamps
+               if value < str(rollup.ceil_time(start, '1m')))
\ No newline at end of file
@@ -0,0 +1,177 @@
+import json
+import sqlite3
+import threading
+import zipfile
+
+import pytest
+
+import search_index
+from search_index import SearchIndex
+
+def message(i, text, day=1):
+    return {'id': i, 'date': f"2024-03-{day:02d}T12:{i % 60:02d}:00", 'sender_id': i % 3, 'text': text}
+
+def write_archive(path, channels):
+    with zipfile.ZipFile(path, 'w') as zip_ref:
+        for channel, messages in channels.items():
+            zip_ref.writestr(f"{channel}/header.json", json.dumps({'total_messages': len(messages)}))
+            zip_ref.writestr(f"{channel}/messages.ndjson", "".join(json.dumps(msg) + "\n" for msg in messages))
+    return str(path)
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / "search_index.db"))
+    yield index
+    index.close()
+
+@pytest.fixture
+def archive(tmp_path):
+    return write_archive(tmp_path / "chat.zip", {
+        'news': [message(i, f"погода отличная {i}", day=1 + i % 5) for i in range(30)],
+        'talk': [message(i, f"погода плохая {i}", day=3) for i in range(10)] + [message(10, "обед")]
+    })
+
+def ids(found):
+    return [(result['channel'], result['message_id']) for result in found['results']]
+
+def test_index_once_and_skip_repeats(index, archive, tmp_path):
+    assert index.index_archive(archive) == 41
+    assert index.index_archive(archive) is None
+    
+    # Инкрементальный архив: прежние сообщения канала не дублируются
+    newer = write_archive(tmp_path / "chat_2.zip", {'talk': [message(10, "обед"), message(11, "ужин")]})
+    assert index.index_archive(newer) == 1
+    assert index.get_stats() == {'archives': 2, 'messages': 42, 'channels': ['news', 'talk']}
+
+def test_filters(index, archive):
+    index.index_archive(archive)
+    
+    assert len(index.search("погода", per_page=100)['results']) == 40
+    assert {channel for channel, _ in ids(index.search("погода", channel='talk', per_page=100))} == {'talk'}
+    assert len(index.search("погода плохая", per_page=100)['results']) == 10
+    assert len(index.search("пог*", per_page=100)['results']) == 40
+    assert index.search('погода" OR "обед')['results'] == []
+    assert index.search("   ")['results'] == []
+    
+    # День целиком и дата-время включительно
+    news = index.search("погода", channel='news', date_from="2024-03-02", date_to="2024-03-03", per_page=100)
+    assert sorted(i for _, i in ids(news)) == [i for i in range(30) if 1 + i % 5 in (2, 3)]
+    until = index.search("погода", channel='news', date_to="2024-03-01T12:05:00", per_page=100)
+    assert sorted(i for _, i in ids(until)) == [0, 5]
+    since = index.search("погода", date_from="2024-03-05", per_page=100)
+    assert sorted(ids(since)) == [('news', i) for i in range(30) if i % 5 == 4]
+
+def test_paging(index, archive):
+    index.index_archive(archive)
+    
+    pages = [index.search("погода", page=page, per_page=15) for page in (1, 2, 3)]
+    assert [len(found['results']) for found in pages] == [15, 15, 10]
+    assert [found['has_more'] for found in pages] == [True, True, False]
+    
+    found = [item for page in pages for item in ids(page)]
+    assert len(set(found)) == 40
+    assert index.search("погода", per_page=1000)['per_page'] == search_index.MAX_PAGE_SIZE
+
+def test_interrupted_indexing_is_resumed(index, archive, monkeypatch):
+    monkeypatch.setattr(search_index, 'INSERT_BATCH', 10)
+    insert = index._insert
+    calls = []
+    
+    def failing_insert(name, rows):
+        calls.append(len(rows))
+        if len(calls) == 3:
+            raise sqlite3.OperationalError("disk I/O error")
+        return insert(name, rows)
+    
+    monkeypatch.setattr(index, '_insert', failing_insert)
+    with pytest.raises(sqlite3.OperationalError):
+        index.index_archive(archive)
+    
+    # Записанные пакеты остались, но архив не отмечен загруженным
+    assert not index.is_indexed(archive)
+    assert index.get_stats()['archives'] == 0
+    assert len(index.search("погода", per_page=100)['results']) == 20
+    
+    monkeypatch.setattr(index, '_insert', insert)
+    assert index.index_archive(archive) == 21
+    assert index.is_indexed(archive)
+    assert index.read_conn.execute('SELECT messages FROM archives').fetchone()[0] == 41
+
+def test_search_does_not_wait_for_indexing(index, archive):
+    index.index_archive(archive)
+    with index.lock:
+        assert len(index.search("погода", per_page=100)['results']) == 40
+        assert index.get_stats()['archives'] == 1
+
+def test_locked_database_is_retried(index, archive, tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, 'LOCK_RETRY_DELAY', 0.05)
+    index.conn.execute('PRAGMA busy_timeout = 10')
+    
+    # Другой процесс держит транзакцию записи
+    other = sqlite3.connect(str(tmp_path / "search_index.db"), check_same_thread=False)
+    other.execute('BEGIN IMMEDIATE')
+    release = threading.Timer(0.2, other.commit)
+    release.start()
+    try:
+        assert index.index_archive(archive) == 41
+    finally:
+        release.join()
+        other.close()
+    assert index.is_indexed(archive)
+
+def test_sync_requeues_failed_archives(index, archive, tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, 'LOCK_RETRY_DELAY', 0)
+    (tmp_path / "broken.zip").write_bytes(b"not a zip")
+    index_archive = index.index_archive
+    failures = []
+    
+    def flaky(path):
+        if path == archive and not failures:
+            failures.append(path)
+            raise sqlite3.OperationalError("database is locked")
+        return index_archive(path)
+    
+    monkeypatch.setattr(index, 'index_archive', flaky)
+    assert index.sync(str(tmp_path)) == (1, 41)
+    assert failures == [archive]
+
+def test_dates_with_time_zones(index, tmp_path):
+    dates = ["2024-03-01T12:00:00+00:00", "2024-03-01T15:00:00+03:00", "2024-03-01T12:00:00Z",
+             "2024-03-01T12:00:01", "2024-03-02T01:30:00+03:00", "2024-03-01 11:59:59.500000"]
+    index.index_archive(write_archive(tmp_path / "zones.zip", {
+        'news': [{'id': i, 'date': value, 'text': f"погода {i}"} for i, value in enumerate(dates)]
+    }))
+    
+    def found(**bounds):
+        return sorted(i for _, i in ids(index.search("погода", per_page=100, **bounds)))
+    
+    # 12:00 UTC в любой записи - ровно на включительной границе
+    assert found(date_to="2024-03-01T12:00:00") == [0, 1, 2, 5]
+    assert found(date_to="2024-03-01T15:00:00+03:00") == [0, 1, 2, 5]
+    assert found(date_from="2024-03-01T12:00:00Z") == [0, 1, 2, 3, 4]
+    # 01:30 по Москве 2 марта - еще 1 марта по UTC
+    assert found(date_from="2024-03-01", date_to="2024-03-01") == [0, 1, 2, 3, 4, 5]
+    assert found(date_from="2024-03-02") == []
+
+def test_old_index_gets_utc_dates(tmp_path, archive):
+    db_path = str(tmp_path / "search_index.db")
+    index = SearchIndex(db_path)
+    index.index_archive(archive)
+    index.close()
+    
+    # Индекс прежней версии: без date_utc и с индексами по date
+    conn = sqlite3.connect(db_path)
+    conn.execute('DROP INDEX idx_messages_date_utc')
+    conn.execute('DROP INDEX idx_messages_channel_date_utc')
+    conn.execute('ALTER TABLE messages DROP COLUMN date_utc')
+    conn.execute('CREATE INDEX idx_messages_date ON messages(date)')
+    conn.commit()
+    conn.close()
+    
+    index = SearchIndex(db_path)
+    try:
+        assert not index.read_conn.execute('SELECT COUNT(*) FROM messages WHERE date_utc IS NULL').fetchone()[0]
+        until = index.search("погода", channel='news', date_to="2024-03-01T12:05:00", per_page=100)
+        assert sorted(i for _, i in ids(until)) == [0, 5]
+    finally:
+        index.close()
\ No newline at end of file
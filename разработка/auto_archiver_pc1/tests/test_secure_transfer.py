@@ -0,0 +1,118 @@
+import hashlib
+import io
+import json
+import os
+from itertools import islice
+
+import pytest
+from cryptography.fernet import Fernet
+
+from key_ring import KeyRing
+from secure_transfer import FRAME_LENGTH, receive_stream
+from stream_crypto import StreamFormatError, iter_encrypt, key_id
+
+CHUNK = 64
+DATA = os.urandom(CHUNK * 4 + 10)  # заголовок и 5 частей - 6 кадров
+TOTAL_FRAMES = 6
+
+class FakeSocket:
+    """Сокет сервера: ответ о сохраненных кадрах передается агенту, его кадры читаются через recv"""
+    
+    def __init__(self, agent):
+        self.agent = agent
+        self.buffer = b""
+        self.replies = []
+    
+    def sendall(self, data):
+        size = int(data[:20].decode('utf-8').strip())
+        reply = json.loads(data[20:20 + size].decode('utf-8'))
+        self.replies.append(reply)
+        self.buffer += self.agent(reply)
+    
+    def recv(self, size):
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+def agent(key, limit=None, resume=True):
+    """Агент как в _upload_attempt; limit - сколько кадров отправить до обрыва связи"""
+    def respond(reply):
+        frames_done = reply['frames']
+        start_index = max(frames_done - 1, 0)
+        stream_id = bytes.fromhex(reply['stream_id']) if frames_done else None
+        f = io.BytesIO(DATA)
+        f.seek(start_index * CHUNK)
+        if resume:
+            frames = iter_encrypt(f, key, CHUNK, stream_id, start_index, resume=bool(frames_done))
+        else:
+            # Прежнее поведение: при start_index == 0 заголовок отправлялся повторно
+            frames = iter_encrypt(f, key, CHUNK, stream_id, start_index, resume=bool(start_index))
+        data = b"".join(FRAME_LENGTH.pack(len(frame)) + frame for frame in islice(frames, limit))
+        return data if limit is not None else data + FRAME_LENGTH.pack(0)
+    return respond
+
+@pytest.fixture
+def key():
+    return Fernet.generate_key()
+
+@pytest.fixture
+def paths(tmp_path):
+    return {
+        'encrypted': str(tmp_path / "file.enc"),
+        'decrypted': str(tmp_path / "file.zip"),
+        'uploads': str(tmp_path / "uploads")
+    }
+
+def metadata(key):
+    return {
+        'upload_id': "0123456789abcdef",
+        'agent_id': "agent",
+        'filename': "file.zip",
+        'original_size': len(DATA),
+        'hash': hashlib.sha256(DATA).hexdigest(),
+        'encrypted': True,
+        'encoding': 'aesgcm-stream',
+        'chunk_size': CHUNK,
+        'key_id': key_id(key)
+    }
+
+def upload(sock, key, paths, keys):
+    return receive_stream(sock, metadata(key), paths['encrypted'], paths['decrypted'],
+                          key_ring=KeyRing(keys), upload_dir=paths['uploads'])
+
+def interrupted_upload(key, paths, frames):
+    with pytest.raises(ConnectionError):
+        upload(FakeSocket(agent(key, limit=frames)), key, paths, {'agent': key})
+
+@pytest.mark.parametrize('frames_done', [0, 1, 2, TOTAL_FRAMES])
+def test_resume_after_interruption(key, paths, frames_done):
+    interrupted_upload(key, paths, frames_done)
+    
+    sock = FakeSocket(agent(key))
+    result = upload(sock, key, paths, {'agent': key})
+    
+    assert sock.replies[0]['frames'] == frames_done
+    assert result['verified']
+    with open(paths['decrypted'], 'rb') as f:
+        assert f.read() == DATA
+    assert os.listdir(paths['uploads']) == []
+
+def test_repeated_header_is_discarded(key, paths):
+    interrupted_upload(key, paths, 1)
+    
+    with pytest.raises(StreamFormatError):
+        upload(FakeSocket(agent(key, resume=False)), key, paths, {'agent': key})
+    
+    # Испорченная загрузка не сохраняется и начинается заново
+    assert not os.path.exists(paths['encrypted'])
+    assert os.listdir(paths['uploads']) == []
+    
+    sock = FakeSocket(agent(key))
+    assert upload(sock, key, paths, {'agent': key})['verified']
+    assert sock.replies[0]['frames'] == 0
+
+def test_unknown_key_keeps_encrypted_file(key, paths):
+    result = upload(FakeSocket(agent(key)), key, paths, {})
+    
+    assert not result['decrypted']
+    assert os.path.exists(paths['encrypted'])
+    assert not os.path.exists(paths['decrypted'])
\ No newline at end of file
@@ -0,0 +1,121 @@
+import importlib
+import os
+import time
+
+import pytest
+
+from storage_catalog import HOT_WINDOW, StorageCatalog
+
+OLD = time.time() - 3600
+
+@pytest.fixture
+def folder(tmp_path):
+    path = tmp_path / "reports"
+    path.mkdir()
+    return path
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+@pytest.fixture
+def catalog(folder):
+    catalog = StorageCatalog(rescan_interval=1000)
+    catalog.watch('reports', str(folder), match=lambda name: name.endswith('.txt'), loader=read)
+    return catalog
+
+def write(folder, name, text, age=None):
+    """Файл с текстом; age - сколько секунд назад он изменен (None - только что)"""
+    path = folder / name
+    path.write_text(text)
+    if age is not None:
+        os.utime(path, (OLD, time.time() - age))
+    return path
+
+def settle(folder):
+    # Папка изменена давно - следующий запрос пересматривает ее только по изменению mtime
+    os.utime(folder, (OLD, OLD))
+
+def names(catalog):
+    return [entry.name for entry in catalog.list('reports')]
+
+def test_add_and_delete(catalog, folder):
+    write(folder, "a.txt", "a", age=300)
+    write(folder, "skip.json", "{}", age=300)
+    settle(folder)
+    assert names(catalog) == ["a.txt"]
+    generation = catalog.generation('reports')
+    
+    # Папка не менялась - без пересмотра
+    assert names(catalog) == ["a.txt"]
+    assert catalog.stats['scans'] == 1
+    
+    write(folder, "b.txt", "b", age=200)
+    assert names(catalog) == ["b.txt", "a.txt"]  # Новые первыми
+    assert catalog.generation('reports') == generation + 1
+    
+    (folder / "a.txt").unlink()
+    assert names(catalog) == ["b.txt"]
+    assert catalog.get('reports', "a.txt") is None
+    assert catalog.get('reports', "b.txt").data == "b"
+    assert catalog.generation('reports') == generation + 2
+
+def test_hot_file_rewritten_in_place(catalog, folder):
+    hot = write(folder, "hot.txt", "v1")
+    write(folder, "cold.txt", "v1", age=300)
+    settle(folder)
+    assert catalog.get('reports', "hot.txt").data == "v1"
+    assert catalog.get('reports', "cold.txt").data == "v1"
+    generation = catalog.generation('reports')
+    
+    # Перезапись на месте не меняет mtime папки: недавно измененный файл проверяется сам
+    hot.write_text("version 2")
+    os.utime(hot, (OLD, time.time() - HOT_WINDOW / 2))
+    assert catalog.get('reports', "hot.txt").data == "version 2"
+    assert catalog.generation('reports') == generation + 1
+    assert catalog.stats['scans'] == 1
+    
+    # Давно не менявшийся файл - только при полном пересмотре
+    write(folder, "cold.txt", "version 2", age=200)
+    assert catalog.get('reports', "cold.txt").size == 2
+    catalog.rescan_interval = 0
+    cold = catalog.get('reports', "cold.txt")
+    assert (cold.size, cold.data) == (9, "version 2")
+    assert catalog.stats['scans'] == 2
+
+def test_index_is_rebuilt_only_after_changes(catalog, folder):
+    write(folder, "a.txt", "a", age=300)
+    settle(folder)
+    builds = []
+    
+    def build(entries):
+        builds.append(len(entries))
+        return [entry.data for entry in entries]
+    
+    assert catalog.index('reports', build) == ["a"]
+    assert catalog.index('reports', build) == ["a"]
+    assert builds == [1]
+    
+    write(folder, "b.txt", "b", age=200)
+    assert catalog.index('reports', build) == ["b", "a"]
+    assert catalog.index('reports', build) == ["b", "a"]
+    assert builds == [1, 2]
+
+@pytest.fixture
+def dashboard(tmp_path, monkeypatch):
+    # Веб-интерфейс при импорте создает хранилище в текущей папке
+    monkeypatch.chdir(tmp_path)
+    return importlib.import_module('web_ai_dashboard')
+
+def test_reports_by_archive(dashboard, catalog, folder):
+    write(folder, "chat_20240301_120000_report.txt", "", age=300)
+    write(folder, "chat_20240302_120000_report.txt", "", age=200)
+    write(folder, "my_chat_20240301_120000_report.txt", "", age=100)
+    write(folder, "GLOBAL_REPORT_20240302_120000.txt", "", age=50)
+    write(folder, "notes_report.txt", "", age=50)
+    
+    # Последний отчет по каждому архиву; имя архива может содержать _
+    assert catalog.index('reports', dashboard.reports_by_archive) == {
+        'chat': "chat_20240302_120000_report.txt",
+        'my_chat': "my_chat_20240301_120000_report.txt"
+    }
\ No newline at end of file
@@ -0,0 +1,77 @@
+import io
+import os
+
+import pytest
+from cryptography.fernet import Fernet
+
+from stream_crypto import (CHUNK_OVERHEAD, HEADER_SIZE, StreamDecryptor, StreamFormatError,
+                           encrypted_size, iter_decrypt, iter_encrypt, key_id)
+
+CHUNK = 64
+
+@pytest.fixture
+def key():
+    return Fernet.generate_key()
+
+def encrypt(data, key, chunk_size=CHUNK):
+    return b"".join(iter_encrypt(io.BytesIO(data), key, chunk_size))
+
+def decrypt(blob, key):
+    return b"".join(iter_decrypt(io.BytesIO(blob), {key_id(key): key}.get, read_size=7))
+
+def frames(blob, chunk_size=CHUNK):
+    """Контейнер -> заголовок и список частей (части полные, кроме последней)"""
+    body = blob[HEADER_SIZE:]
+    full = CHUNK_OVERHEAD + chunk_size
+    return blob[:HEADER_SIZE], [body[i:i + full] for i in range(0, len(body), full)]
+
+@pytest.mark.parametrize('size', [0, 1, CHUNK - 1, CHUNK, CHUNK + 1, CHUNK * 5])
+def test_round_trip(key, size):
+    data = os.urandom(size)
+    blob = encrypt(data, key)
+    assert len(blob) == encrypted_size(size, CHUNK)
+    assert decrypt(blob, key) == data
+
+def test_decryptor_accepts_arbitrary_pieces(key):
+    data = os.urandom(CHUNK * 3 + 5)
+    blob = encrypt(data, key)
+    decryptor = StreamDecryptor({key_id(key): key}.get)
+    plain = b"".join(decryptor.feed(blob[i:i + 1]) for i in range(len(blob)))
+    decryptor.finish()
+    assert plain == data
+
+def test_unknown_key(key):
+    blob = encrypt(b"data", key)
+    with pytest.raises(StreamFormatError, match="Неизвестный ключ"):
+        decrypt(blob, Fernet.generate_key())
+
+def test_flipped_byte_is_detected(key):
+    blob = bytearray(encrypt(os.urandom(CHUNK * 2), key))
+    blob[HEADER_SIZE + CHUNK_OVERHEAD + CHUNK + 20] ^= 1
+    with pytest.raises(StreamFormatError, match="Часть 1"):
+        decrypt(bytes(blob), key)
+
+def test_swapped_chunks_are_detected(key):
+    header, parts = frames(encrypt(os.urandom(CHUNK * 3), key))
+    with pytest.raises(StreamFormatError, match="Часть 0"):
+        decrypt(header + parts[1] + parts[0] + parts[2], key)
+
+def test_truncated_stream_is_detected(key):
+    header, parts = frames(encrypt(os.urandom(CHUNK * 3), key))
+    with pytest.raises(StreamFormatError, match="обрезан"):
+        decrypt(header + parts[0] + parts[1], key)
+    with pytest.raises(StreamFormatError, match="обрезан"):
+        decrypt(header + parts[0] + parts[1] + parts[2][:-1], key)
+
+def test_header_from_another_stream_is_detected(key):
+    data = os.urandom(CHUNK * 2)
+    header, parts = frames(encrypt(data, key))
+    other_header, _ = frames(encrypt(data, key))
+    with pytest.raises(StreamFormatError):
+        decrypt(other_header + b"".join(parts), key)
+
+def test_data_after_final_chunk_is_rejected(key):
+    blob = encrypt(os.urandom(CHUNK), key)
+    _, parts = frames(blob)
+    with pytest.raises(StreamFormatError, match="после последней"):
+        decrypt(blob + parts[0], key)
\ No newline at end of file
@@ -6,10 +6,14 @@ import os
 import json
 from datetime import datetime
 import threading
+from chunk_store import archive_size, is_archive_name, MANIFEST_SUFFIX
+from search_index import SearchIndex
+from job_queue import JobQueue
+from storage_catalog import StorageCatalog
 
 # Импортируем AI модуль
 try:
-    from ai_analyzer import AIAnalyzer, ArchiveManager
+    from ai_analyzer import AIAnalyzer, ArchiveManager, AnalysisCancelled
     AI_ENABLED = True
 except ImportError:
     AI_ENABLED = False
@@ -21,6 +25,7 @@ TELEGRAM_STORAGE = f"{BASE_STORAGE}/telegram"
 DECRYPTED_STORAGE = f"{BASE_STORAGE}/decrypted"
 AI_RESULTS_PATH = f"{BASE_STORAGE}/ai_results"
 LOGS_PATH = f"{BASE_STORAGE}/logs"
+JOB_WORKERS = 2  # Фоновых задач, выполняемых одновременно
 
 # Создаем папки
 os.makedirs(DECRYPTED_STORAGE, exist_ok=True)
@@ -32,11 +37,132 @@ app = Flask(__name__,
             static_folder='static',
             template_folder='templates')
 
+REPORT_SUFFIX = "_report.txt"
+REPORT_PREVIEW = 500  # Символов начала отчета для предпросмотра
+
+def read_report_preview(filepath):
+    """Начало отчета для списка отчетов"""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return f.read(REPORT_PREVIEW)
+    except:
+        return "Не удалось прочитать отчет"
+
+def read_stats_summary(filepath):
+    """Сводка файла результатов анализа (None, если файл не читается)"""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return {
+            'archive': data.get('archive_name', os.path.basename(filepath)),
+            'messages': data.get('basic_stats', {}).get('total_messages', 0),
+            'users': data.get('basic_stats', {}).get('unique_users', 0),
+            'sentiment': data.get('sentiment_analysis', {}).get('sentiment_score', 0),
+            'anomalies': len(data.get('anomalies', [])),
+            'date': data.get('analysis_date', '')
+        }
+    except:
+        return None
+
+def archives_total_size(entries):
+    return sum(entry.data for entry in entries)
+
+def reports_by_archive(entries):
+    """Имя архива -> последний отчет по нему (отчеты называются {архив}_{дата}_{время}_report.txt)"""
+    reports = {}
+    for entry in entries:
+        if entry.name.endswith(REPORT_SUFFIX):
+            parts = entry.name[:-len(REPORT_SUFFIX)].rsplit('_', 2)
+            if len(parts) == 3:
+                # Записи идут от новых к старым
+                reports.setdefault(parts[0], entry.name)
+    return reports
+
+def report_list(entries):
+    """Ответ /api/ai/reports"""
+    reports = []
+    for entry in entries:
+        # Начало отчета читается один раз и хранится в каталоге
+        preview = entry.data
+        reports.append({
+            'name': entry.name,
+            'size': entry.size,
+            'size_kb': entry.size // 1024,
+            'modified': entry.modified_text,
+            'preview': preview[:200] + "..." if len(preview) > 200 else preview
+        })
+    return reports
+
+def ai_stats_summary(entries):
+    """Общая статистика по файлам результатов анализа"""
+    stats_files = [entry.data for entry in entries if entry.data is not None]
+    
+    total_analyzed = len(stats_files)
+    total_messages = sum(s['messages'] for s in stats_files)
+    total_users = sum(s['users'] for s in stats_files)
+    avg_sentiment = sum(s['sentiment'] for s in stats_files) / total_analyzed if total_analyzed > 0 else 0
+    
+    # Распределение по тональности
+    sentiment_dist = {
+        'positive': sum(1 for s in stats_files if s['sentiment'] > 0.1),
+        'neutral': sum(1 for s in stats_files if -0.1 <= s['sentiment'] <= 0.1),
+        'negative': sum(1 for s in stats_files if s['sentiment'] < -0.1)
+    }
+    
+    return {
+        'total_analyzed': total_analyzed,
+        'total_messages': total_messages,
+        'total_users': total_users,
+        'avg_sentiment': avg_sentiment,
+        'sentiment_distribution': sentiment_dist,
+        'recent_analyses': stats_files[:10]  # Последние 10 анализов
+    }
+
+# Каталог файлов хранилища: списки папок в памяти, обновляются по mtime
+catalog = StorageCatalog()
+catalog.watch('archives', DECRYPTED_STORAGE, match=is_archive_name, loader=archive_size)
+catalog.watch('reports', f"{AI_RESULTS_PATH}/reports", match=lambda name: name.endswith('.txt'),
+              loader=read_report_preview)
+catalog.watch('stats', f"{AI_RESULTS_PATH}/stats", match=lambda name: name.endswith('.json'),
+              loader=read_stats_summary)
+
 # Инициализация AI анализатора
 if AI_ENABLED:
     analyzer = AIAnalyzer()
     archive_manager = ArchiveManager()
 
+# Поисковый индекс (архивы, пришедшие до запуска сервера, догружаются при старте)
+search_index = SearchIndex(f"{BASE_STORAGE}/search_index.db")
+
+def job_progress(job):
+    """progress для анализатора: прогресс - в задачу, отмена задачи прерывает анализ"""
+    def progress(done, total):
+        job.progress(done, total)
+        if job.cancelled:
+            raise AnalysisCancelled()
+    return progress
+
+def run_analyze_archive(job):
+    """Задача analyze_archive: анализ одного архива"""
+    name = job.params['archive']
+    result = analyzer.analyze_telegram_archive(os.path.join(DECRYPTED_STORAGE, name), job_progress(job))
+    log_web_event(f"AI анализ завершен: {name}")
+    return {'archive': name, 'summary': result.get('summary')}
+
+def run_analyze_all(job):
+    """Задача analyze_all: анализ всех архивов"""
+    results = analyzer.analyze_all_archives(job.params.get('workers'), job.params.get('use_cache', True),
+                                            job_progress(job))
+    log_web_event(f"AI анализ всех архивов завершен: {len(results)} архивов")
+    return {'archives': len(results)}
+
+# Очередь фоновых задач (хранится в базе, переживает перезапуск сервера)
+job_handlers = {}
+if AI_ENABLED:
+    job_handlers['analyze_archive'] = run_analyze_archive
+    job_handlers['analyze_all'] = run_analyze_all
+job_queue = JobQueue(f"{BASE_STORAGE}/jobs.db", job_handlers, workers=JOB_WORKERS)
+
 def log_web_event(message, agent_id=None):
     """Логирование событий веб-интерфейса"""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -60,30 +186,11 @@ def get_status():
     """Получение статуса системы"""
     try:
         # Список архивов
-        archives = []
-        if os.path.exists(DECRYPTED_STORAGE):
-            for file in os.listdir(DECRYPTED_STORAGE):
-                if file.endswith('.zip'):
-                    filepath = os.path.join(DECRYPTED_STORAGE, file)
-                    archives.append({
-                        'name': file,
-                        'size': os.path.getsize(filepath),
-                        'modified': datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat()
-                    })
+        archives = catalog.list('archives')
+        total_size = catalog.index('archives', archives_total_size)
         
-        # Список отчетов AI
-        ai_reports = []
-        if AI_ENABLED and os.path.exists(f"{AI_RESULTS_PATH}/reports"):
-            for file in os.listdir(f"{AI_RESULTS_PATH}/reports"):
-                if file.endswith('.txt'):
-                    filepath = os.path.join(f"{AI_RESULTS_PATH}/reports", file)
-                    ai_reports.append({
-                        'name': file,
-                        'size': os.path.getsize(filepath),
-                        'modified': datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat()
-                    })
-        
-        total_size = sum(a['size'] for a in archives)
+        # Отчеты AI
+        ai_reports = catalog.list('reports') if AI_ENABLED else ()
         
         status = {
             'status': 'running',
@@ -106,36 +213,24 @@ def get_status():
 def list_archives():
     """Список архивов с AI информацией"""
     try:
-        archives = []
-        if os.path.exists(DECRYPTED_STORAGE):
-            for file in os.listdir(DECRYPTED_STORAGE):
-                if file.endswith('.zip'):
-                    filepath = os.path.join(DECRYPTED_STORAGE, file)
-                    
-                    # Проверяем есть ли AI анализ для этого архива
-                    ai_report = None
-                    if AI_ENABLED:
-                        report_name = file.replace('.zip', '') + '_report.txt'
-                        report_path = f"{AI_RESULTS_PATH}/reports/{report_name}"
-                        if os.path.exists(report_path):
-                            # Ищем актуальный отчет
-                            for r_file in os.listdir(f"{AI_RESULTS_PATH}/reports"):
-                                if r_file.startswith(file.replace('.zip', '')) and r_file.endswith('_report.txt'):
-                                    report_path = f"{AI_RESULTS_PATH}/reports/{r_file}"
-                                    ai_report = r_file
-                                    break
-                    
-                    archives.append({
-                        'name': file,
-                        'path': filepath,
-                        'size': os.path.getsize(filepath),
-                        'size_mb': os.path.getsize(filepath) / (1024 * 1024),
-                        'modified': datetime.fromtimestamp(os.path.getmtime(filepath)).strftime('%Y-%m-%d %H:%M:%S'),
-                        'has_ai_analysis': ai_report is not None,
-                        'ai_report': ai_report
-                    })
+        # Последний AI отчет по каждому архиву
+        reports = catalog.index('reports', reports_by_archive) if AI_ENABLED else {}
         
-        return jsonify({'archives': sorted(archives, key=lambda x: x['modified'], reverse=True)})
+        archives = []
+        for entry in catalog.list('archives'):
+            base_name = entry.name.replace(MANIFEST_SUFFIX, '').replace('.zip', '')
+            ai_report = reports.get(base_name)
+            archives.append({
+                'name': entry.name,
+                'path': entry.path,
+                'size': entry.data,
+                'size_mb': entry.data / (1024 * 1024),
+                'modified': entry.modified_text,
+                'has_ai_analysis': ai_report is not None,
+                'ai_report': ai_report
+            })
+        
+        return jsonify({'archives': archives})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -153,28 +248,20 @@ def analyze_archive(archive_name):
         if not os.path.exists(archive_path):
             return jsonify({'error': 'Архив не найден'}), 404
         
-        log_web_event(f"Запуск AI анализа: {safe_name}")
-        
-        # Запускаем анализ в отдельном потоке
-        def analyze_in_background():
-            try:
-                result = analyzer.analyze_telegram_archive(archive_path)
-                log_web_event(f"AI анализ завершен: {safe_name}")
-            except Exception as e:
-                log_web_event(f"Ошибка AI анализа: {e}", "ERROR")
-        
-        thread = threading.Thread(target=analyze_in_background)
-        thread.daemon = True
-        thread.start()
+        # Анализ выполняется в очереди задач; такой же еще не завершенный не дублируется
+        job, created = job_queue.submit('analyze_archive', {'archive': safe_name})
+        log_web_event(f"{'Запуск' if created else 'Уже в очереди'} AI анализа: {safe_name} (задача #{job['id']})")
         
         return jsonify({
             'success': True,
-            'message': f'AI анализ запущен для {safe_name}',
-            'archive': safe_name
+            'message': f"AI анализ {'поставлен в очередь' if created else 'уже в очереди'} для {safe_name}",
+            'archive': safe_name,
+            'created': created,
+            'job': job
         })
         
     except Exception as e:
-        log_web_event(f"Ошибка запуска AI анализа: {e}", "ERROR")
+        log_web_event(f"Ошибка запуска AI анализа: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/ai/analyze_all')
@@ -184,22 +271,20 @@ def analyze_all_archives():
         return jsonify({'error': 'AI модуль не загружен'}), 500
     
     try:
-        log_web_event("Запуск AI анализа всех архивов")
-        
-        def analyze_all_in_background():
-            try:
-                results = analyzer.analyze_all_archives()
-                log_web_event(f"AI анализ всех архивов завершен: {len(results)} архивов")
-            except Exception as e:
-                log_web_event(f"Ошибка AI анализа всех архивов: {e}", "ERROR")
-        
-        thread = threading.Thread(target=analyze_all_in_background)
-        thread.daemon = True
-        thread.start()
+        # ?workers=N - число процессов анализа (по умолчанию по числу ядер),
+        # ?force=1 - заново, без кэша результатов
+        workers = request.args.get('workers', type=int)
+        use_cache = request.args.get('force') != '1'
+        # Одна задача analyze_all на все параметры: два анализа всех архивов
+        # одновременно работали бы с одним кэшем анализатора
+        job, created = job_queue.submit('analyze_all', {'workers': workers, 'use_cache': use_cache}, dedup="")
+        log_web_event(f"{'Запуск' if created else 'Уже в очереди'} AI анализа всех архивов (задача #{job['id']})")
         
         return jsonify({
             'success': True,
-            'message': 'AI анализ всех архивов запущен'
+            'message': f"AI анализ всех архивов {'поставлен в очередь' if created else 'уже в очереди'}",
+            'created': created,
+            'job': job
         })
         
     except Exception as e:
@@ -209,29 +294,8 @@ def analyze_all_archives():
 def list_ai_reports():
     """Список AI отчетов"""
     try:
-        reports = []
-        if os.path.exists(f"{AI_RESULTS_PATH}/reports"):
-            for file in os.listdir(f"{AI_RESULTS_PATH}/reports"):
-                if file.endswith('.txt'):
-                    filepath = os.path.join(f"{AI_RESULTS_PATH}/reports", file)
-                    
-                    # Читаем первую строку для предпросмотра
-                    preview = ""
-                    try:
-                        with open(filepath, 'r', encoding='utf-8') as f:
-                            preview = f.read(500)  # Первые 500 символов
-                    except:
-                        preview = "Не удалось прочитать отчет"
-                    
-                    reports.append({
-                        'name': file,
-                        'size': os.path.getsize(filepath),
-                        'size_kb': os.path.getsize(filepath) // 1024,
-                        'modified': datetime.fromtimestamp(os.path.getmtime(filepath)).strftime('%Y-%m-%d %H:%M:%S'),
-                        'preview': preview[:200] + "..." if len(preview) > 200 else preview
-                    })
-        
-        return jsonify({'reports': sorted(reports, key=lambda x: x['modified'], reverse=True)})
+        # Список строится заново только при изменении папки отчетов
+        return jsonify({'reports': catalog.index('reports', report_list)})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -258,6 +322,74 @@ def get_ai_report(report_name):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/search')
+def search_messages():
+    """
+    Полнотекстовый поиск по сообщениям всех архивов
+    
+    Параметры: q, channel, from, to (YYYY-MM-DD), page, per_page,
+    order=recent|relevance
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Пустой запрос (параметр q)'}), 400
+    
+    try:
+        found = search_index.search(
+            query,
+            channel=request.args.get('channel') or None,
+            date_from=request.args.get('from') or None,
+            date_to=request.args.get('to') or None,
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', 20, type=int),
+            order=request.args.get('order', 'recent')
+        )
+        found['query'] = query
+        return jsonify(found)
+        
+    except ValueError as e:
+        return jsonify({'error': f'Неверный параметр: {e}'}), 400
+    except Exception as e:
+        log_web_event(f"Ошибка поиска: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/search/stats')
+def search_stats():
+    """Размер поискового индекса"""
+    try:
+        return jsonify(search_index.get_stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs')
+def list_jobs():
+    """Фоновые задачи: ?status=pending|running|done|failed|cancelled, ?limit=N"""
+    try:
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        return jsonify({
+            'jobs': job_queue.list(request.args.get('status'), limit),
+            'stats': job_queue.get_stats()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<int:job_id>')
+def get_job(job_id):
+    """Состояние и прогресс задачи"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Отмена задачи (выполняемая останавливается при следующем отчете о прогрессе)"""
+    job = job_queue.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Задача не найдена'}), 404
+    log_web_event(f"Отмена задачи #{job_id}")
+    return jsonify({'success': True, 'job': job})
+
 @app.route('/api/ai/stats')
 def get_ai_stats():
     """Статистика AI анализа"""
@@ -265,48 +397,8 @@ def get_ai_stats():
         return jsonify({'error': 'AI модуль не загружен'}), 500
     
     try:
-        # Собираем статистику из JSON файлов
-        stats_files = []
-        if os.path.exists(f"{AI_RESULTS_PATH}/stats"):
-            for file in os.listdir(f"{AI_RESULTS_PATH}/stats"):
-                if file.endswith('.json'):
-                    filepath = os.path.join(f"{AI_RESULTS_PATH}/stats", file)
-                    try:
-                        with open(filepath, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                            
-                            stats_files.append({
-                                'archive': data.get('archive_name', file),
-                                'messages': data.get('basic_stats', {}).get('total_messages', 0),
-                                'users': data.get('basic_stats', {}).get('unique_users', 0),
-                                'sentiment': data.get('sentiment_analysis', {}).get('sentiment_score', 0),
-                                'anomalies': len(data.get('anomalies', [])),
-                                'date': data.get('analysis_date', '')
-                            })
-                    except:
-                        continue
-        
-        # Общая статистика
-        total_analyzed = len(stats_files)
-        total_messages = sum(s['messages'] for s in stats_files)
-        total_users = sum(s['users'] for s in stats_files)
-        avg_sentiment = sum(s['sentiment'] for s in stats_files) / total_analyzed if total_analyzed > 0 else 0
-        
-        # Распределение по тональности
-        sentiment_dist = {
-            'positive': sum(1 for s in stats_files if s['sentiment'] > 0.1),
-            'neutral': sum(1 for s in stats_files if -0.1 <= s['sentiment'] <= 0.1),
-            'negative': sum(1 for s in stats_files if s['sentiment'] < -0.1)
-        }
-        
-        return jsonify({
-            'total_analyzed': total_analyzed,
-            'total_messages': total_messages,
-            'total_users': total_users,
-            'avg_sentiment': avg_sentiment,
-            'sentiment_distribution': sentiment_dist,
-            'recent_analyses': stats_files[:10]  # Последние 10 анализов
-        })
+        # Сводки файлов результатов и общая статистика считаются заново только при их изменении
+        return jsonify(catalog.index('stats', ai_stats_summary))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -358,13 +450,15 @@ def cleanup_old_files():
             return jsonify({'error': 'AI модуль не загружен'}), 500
         
         days = request.json.get('days', 30)
-        cleaned = archive_manager.cleanup_old_archives(days_old=days)
+        cleaned, freed = archive_manager.cleanup_old_archives(days_old=days)
         
-        log_web_event(f"Очистка старых файлов (старше {days} дней): удалено {cleaned}")
+        log_web_event(f"Очистка старых файлов (старше {days} дней): удалено {cleaned}, "
+                      f"освобождено {freed / (1024 * 1024):.1f} MB")
         
         return jsonify({
             'success': True,
             'cleaned': cleaned,
+            'freed_bytes': freed,
             'days': days
         })
         
@@ -384,6 +478,12 @@ def run_ai_dashboard():
     # Создаем папки для шаблонов
     os.makedirs('templates', exist_ok=True)
     
+    # Догружаем в поисковый индекс архивы, которых в нем еще нет
+    threading.Thread(target=search_index.sync, args=(DECRYPTED_STORAGE,), daemon=True).start()
+    
+    # Фоновые задачи, в том числе оставшиеся в очереди с прошлого запуска
+    job_queue.start()
+    
     app.run(host='0.0.0.0', port=8081, debug=False)
 
 if __name__ == '__main__':
@@ -6,6 +6,7 @@ import os
 import json
 from datetime import datetime
 import threading
+from storage_catalog import StorageCatalog
 
 # Конфигурация
 BASE_STORAGE = "./storage"
@@ -16,6 +17,10 @@ LOGS_PATH = f"{BASE_STORAGE}/logs"
 os.makedirs(TELEGRAM_STORAGE, exist_ok=True)
 os.makedirs(LOGS_PATH, exist_ok=True)
 
+# Каталог файлов хранилища: список в памяти, обновляется по mtime папки
+catalog = StorageCatalog()
+catalog.watch('telegram', TELEGRAM_STORAGE)
+
 app = Flask(__name__, 
             static_folder='static',
             template_folder='templates')
@@ -43,20 +48,11 @@ def index():
 def get_status():
     """Получение статуса системы"""
     try:
-        # Получаем список файлов
-        files = []
-        if os.path.exists(TELEGRAM_STORAGE):
-            for file in os.listdir(TELEGRAM_STORAGE):
-                filepath = os.path.join(TELEGRAM_STORAGE, file)
-                if os.path.isfile(filepath):
-                    files.append({
-                        'name': file,
-                        'size': os.path.getsize(filepath),
-                        'modified': datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat()
-                    })
+        # Список файлов (новые первыми)
+        files = catalog.list('telegram')
         
         # Считаем статистику
-        total_size = sum(f['size'] for f in files)
+        total_size = sum(entry.size for entry in files)
         
         status = {
             'status': 'running',
@@ -64,7 +60,11 @@ def get_status():
             'telegram_files': len(files),
             'total_size': total_size,
             'total_size_mb': total_size / (1024 * 1024),
-            'files': sorted(files, key=lambda x: x['modified'], reverse=True)[:10]  # последние 10
+            'files': [{  # последние 10
+                'name': entry.name,
+                'size': entry.size,
+                'modified': entry.modified
+            } for entry in files[:10]]
         }
         
         log_web_event("Запрос статуса системы")
@@ -79,19 +79,16 @@ def list_files():
     """Список файлов в хранилище"""
     try:
         files = []
-        if os.path.exists(TELEGRAM_STORAGE):
-            for file in os.listdir(TELEGRAM_STORAGE):
-                filepath = os.path.join(TELEGRAM_STORAGE, file)
-                if os.path.isfile(filepath):
-                    files.append({
-                        'name': file,
-                        'size': os.path.getsize(filepath),
-                        'size_mb': os.path.getsize(filepath) / (1024 * 1024),
-                        'modified': datetime.fromtimestamp(os.path.getmtime(filepath)).strftime('%Y-%m-%d %H:%M:%S'),
-                        'type': 'zip' if file.endswith('.zip') else 'other'
-                    })
+        for entry in catalog.list('telegram'):
+            files.append({
+                'name': entry.name,
+                'size': entry.size,
+                'size_mb': entry.size / (1024 * 1024),
+                'modified': entry.modified_text,
+                'type': 'zip' if entry.name.endswith('.zip') else 'other'
+            })
         
-        return jsonify({'files': sorted(files, key=lambda x: x['modified'], reverse=True)})
+        return jsonify({'files': files})
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -7,6 +7,7 @@ import json
 import sqlite3
 from datetime import datetime, timedelta
 import threading
+from rollup import get_window_stats
 
 # Конфигурация
 MONITORING_STORAGE = "./monitoring_storage"
@@ -38,6 +39,9 @@ def get_agents():
         cursor = conn.cursor()
         
         # Получаем список агентов с последними метриками
+        # (agent_latest обновляется сервером при приеме данных - история не сканируется).
+        # Ошибки за сутки считаются при чтении: диапазон по индексу (severity, timestamp)
+        # проходит только ошибки последних 24 часов
         cursor.execute('''
             SELECT 
                 a.agent_id,
@@ -46,18 +50,21 @@ def get_agents():
                 a.status,
                 a.ip_address,
                 a.last_seen,
-                (SELECT cpu_percent FROM cpu_monitoring 
-                 WHERE agent_id = a.agent_id 
-                 ORDER BY timestamp DESC LIMIT 1) as last_cpu,
-                (SELECT ram_percent FROM memory_monitoring 
-                 WHERE agent_id = a.agent_id 
-                 ORDER BY timestamp DESC LIMIT 1) as last_ram,
-                (SELECT COUNT(*) FROM events 
-                 WHERE agent_id = a.agent_id AND severity = 'ERROR' 
-                 AND timestamp > datetime('now', '-1 day')) as errors_last_24h
+                l.last_cpu,
+                l.last_ram,
+                l.last_disk,
+                l.process_count,
+                l.last_error_time,
+                COALESCE(e.errors, 0) as errors_last_24h
             FROM agents a
+            LEFT JOIN agent_latest l ON l.agent_id = a.agent_id
+            LEFT JOIN (
+                SELECT agent_id, COUNT(*) as errors FROM events
+                WHERE severity = 'ERROR' AND timestamp > ?
+                GROUP BY agent_id
+            ) e ON e.agent_id = a.agent_id
             ORDER BY a.last_seen DESC
-        ''')
+        ''', (datetime.now() - timedelta(days=1),))
         
         agents = []
         for row in cursor.fetchall():
@@ -200,27 +207,22 @@ def get_agent_stats(agent_id):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Средняя загрузка за последние 24 часа
-        cursor.execute('''
-            SELECT 
-                AVG(cpu_percent) as avg_cpu,
-                AVG(ram_percent) as avg_ram,
-                MAX(cpu_percent) as max_cpu,
-                MAX(ram_percent) as max_ram,
-                COUNT(*) as samples
-            FROM (
-                SELECT 
-                    (SELECT cpu_percent FROM cpu_monitoring 
-                     WHERE agent_id = ? AND timestamp > datetime('now', '-1 day')
-                     ORDER BY timestamp DESC LIMIT 1) as cpu_percent,
-                    (SELECT ram_percent FROM memory_monitoring 
-                     WHERE agent_id = ? AND timestamp > datetime('now', '-1 day')
-                     ORDER BY timestamp DESC LIMIT 1) as ram_percent
-            )
-        ''', (agent_id, agent_id))
-        
-        stats_row = cursor.fetchone()
-        stats = dict(stats_row) if stats_row else {}
+        # Средняя и максимальная загрузка за период (?hours=, по умолчанию сутки).
+        # Длинные периоды считаются по самому крупному подходящему уровню свертки
+        hours = request.args.get('hours', 24, type=float)
+        
+        cpu = get_window_stats(cursor, agent_id, 'cpu', hours)
+        ram = get_window_stats(cursor, agent_id, 'ram', hours)
+        
+        stats = {
+            'avg_cpu': cpu['avg'],
+            'max_cpu': cpu['max'],
+            'samples': cpu['samples'],
+            'avg_ram': ram['avg'],
+            'max_ram': ram['max'],
+            'hours': hours,
+            'tier': cpu['tier']
+        }
         
         # Количество процессов
         cursor.execute('SELECT COUNT(*) FROM processes WHERE agent_id = ?', (agent_id,))
@@ -294,21 +296,15 @@ def get_dashboard_stats():
         cursor.execute('SELECT COUNT(*) FROM agents WHERE status = "ONLINE"')
         online_agents = cursor.fetchone()[0]
         
-        # Загрузка за последний час
+        # Загрузка за последний час (диапазон по индексу timestamp; время в базе - местное)
+        hour_ago = datetime.now() - timedelta(hours=1)
         cursor.execute('''
             SELECT 
-                AVG(cpu_percent) as avg_cpu,
-                AVG(ram_percent) as avg_ram
-            FROM (
-                SELECT 
-                    (SELECT cpu_percent FROM cpu_monitoring 
-                     WHERE timestamp > datetime('now', '-1 hour')
-                     ORDER BY timestamp DESC LIMIT 1) as cpu_percent,
-                    (SELECT ram_percent FROM memory_monitoring 
-                     WHERE timestamp > datetime('now', '-1 hour')
-                     ORDER BY timestamp DESC LIMIT 1) as ram_percent
-            )
-        ''')
+                (SELECT AVG(cpu_percent) FROM cpu_monitoring 
+                 WHERE timestamp > ?) as avg_cpu,
+                (SELECT AVG(ram_percent) FROM memory_monitoring 
+                 WHERE timestamp > ?) as avg_ram
+        ''', (hour_ago, hour_ago))
         
         load_row = cursor.fetchone()
         
@@ -348,9 +344,9 @@ def get_alerts():
             SELECT agent_id, timestamp, event_type, event_message, severity
             FROM events 
             WHERE severity IN ('ERROR', 'WARNING') 
-            AND timestamp > datetime('now', '-1 day')
+            AND timestamp > ?
             ORDER BY timestamp DESC
-        ''')
+        ''', (datetime.now() - timedelta(days=1),))
         
         alerts = [dict(row) for row in cursor.fetchall()]
         
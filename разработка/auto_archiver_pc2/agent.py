@@ -8,16 +8,19 @@ import os
 import time
 import hashlib
 import base64
+import struct
 import psutil
 import platform
 import cpuinfo
 import GPUtil
 import screeninfo
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from stream_crypto import iter_encrypt, encrypted_size, key_id
 
 class SystemAgent:
     def __init__(self, server_ip='192.168.1.100', server_port=9090):
@@ -47,6 +50,14 @@ class SystemAgent:
         os.makedirs(self.secure_temp_dir, exist_ok=True)
         os.makedirs(self.logs_dir, exist_ok=True)
         
+        # Размер части файла при потоковой отправке
+        self.stream_chunk_size = 1024 * 1024  # 1 MB
+        
+        # Повторы отправки после обрыва связи (пауза удваивается)
+        self.upload_retries = 5
+        self.upload_backoff = 2  # секунды
+        self.upload_max_backoff = 60
+        
         # Конфигурация мониторинга
         self.monitoring_config = {
             'cpu_interval': 5,
@@ -579,13 +590,8 @@ class SystemAgent:
                     'processes': self.monitoring_data['processes'][:50]  # Первые 50 процессов
                 })
             
-            # Шифруем данные
-            if self.encryption_key:
-                cipher = Fernet(self.encryption_key)
-                json_data = json.dumps(data_to_send).encode('utf-8')
-                encrypted_data = b"ENCRYPTED::" + cipher.encrypt(json_data)
-            else:
-                encrypted_data = json.dumps(data_to_send).encode('utf-8')
+            # Шифруем данные (метка с key_id - сервер находит ключ без перебора)
+            encrypted_data, _ = self.encrypt_data(json.dumps(data_to_send).encode('utf-8'))
             
             # Отправляем на сервер
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -630,8 +636,8 @@ class SystemAgent:
             cipher = Fernet(self.encryption_key)
             encrypted = cipher.encrypt(data)
             
-            # Добавляем метку что данные зашифрованы
-            header = b"ENCRYPTED::"
+            # Добавляем метку что данные зашифрованы и идентификатор ключа
+            header = b"ENCKEYID::" + key_id(self.encryption_key).encode('ascii') + b"::"
             result = header + encrypted
             
             return result, self.encryption_key
@@ -645,7 +651,11 @@ class SystemAgent:
             return encrypted_data
         
         try:
-            if encrypted_data.startswith(b"ENCRYPTED::"):
+            if encrypted_data.startswith(b"ENCKEYID::"):
+                cipher = Fernet(self.encryption_key)
+                token = encrypted_data[len(b"ENCKEYID::"):].partition(b"::")[2]  # Убираем заголовок и key_id
+                return cipher.decrypt(token)
+            elif encrypted_data.startswith(b"ENCRYPTED::"):
                 cipher = Fernet(self.encryption_key)
                 decrypted = cipher.decrypt(encrypted_data[10:])  # Убираем заголовок
                 return decrypted
@@ -655,90 +665,183 @@ class SystemAgent:
             print(f"❌ Ошибка расшифровки: {e}")
             return encrypted_data
     
-    def secure_send_file(self, file_path, file_type="TELEGRAM"):
+    def _recv_exact(self, sock, size):
+        """Чтение ровно size байт из сокета"""
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(min(65536, size - len(data)))
+            if not chunk:
+                raise ConnectionError(f"Соединение закрыто: получено {len(data)} из {size} байт")
+            data += chunk
+        return bytes(data)
+    
+    def _upload_file(self, file_path, file_type, encrypt):
         """
-        Безопасная отправка файла с шифрованием
+        Возобновляемая потоковая отправка файла (SECURE_STM с upload_id)
+        
+        upload_id зависит только от агента и содержимого файла, поэтому после
+        обрыва сервер узнает загрузку и сообщает, сколько кадров уже сохранено -
+        агент досылает остальное. Попытки повторяются с растущей паузой.
         
         Args:
             file_path (str): Путь к файлу
             file_type (str): Тип файла
+            encrypt (bool): Шифровать контейнером stream_crypto
+        
+        Returns:
+            tuple: (ответ сервера, данные дошли без искажений) или (None, False)
         """
-        if not os.path.exists(file_path):
-            print(f"❌ Файл не найден: {file_path}")
-            return False
+        # Первый проход: хэш и размер исходного файла
+        file_hash = hashlib.sha256()
+        original_size = 0
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.stream_chunk_size), b""):
+                file_hash.update(chunk)
+                original_size += len(chunk)
         
+        encoding = 'aesgcm-stream' if encrypt else 'plain-chunks'
+        filename = os.path.basename(file_path)
+        upload_id = hashlib.sha256(
+            f"{self.agent_id}|{filename}|{original_size}|{file_hash.hexdigest()}|{encoding}|{self.stream_chunk_size}".encode('utf-8')
+        ).hexdigest()[:32]
+        
+        # Метаданные уходят перед данными
+        metadata = {
+            'filename': filename,
+            'file_type': file_type,
+            'original_size': original_size,
+            'encrypted': encrypt,
+            'encoding': encoding,
+            'chunk_size': self.stream_chunk_size,
+            'payload_size': encrypted_size(original_size, self.stream_chunk_size) if encrypt else original_size,
+            'key_id': key_id(self.encryption_key) if encrypt else None,
+            'hash': file_hash.hexdigest(),
+            'upload_id': upload_id,
+            'timestamp': datetime.now().isoformat(),
+            'agent_id': self.agent_id
+        }
+        
+        print(f"{'🔒 Шифрую и отправляю' if encrypt else '📤 Отправляю'} файл: {filename}")
+        print(f"   📁 Исходный размер: {original_size} байт")
+        
+        for attempt in range(1, self.upload_retries + 1):
+            try:
+                return self._upload_attempt(file_path, metadata)
+            except (OSError, ValueError) as e:
+                print()
+                print(f"⚠️ Передача прервана (попытка {attempt}/{self.upload_retries}): {e}")
+                if attempt == self.upload_retries:
+                    break
+                
+                delay = min(self.upload_backoff * 2 ** (attempt - 1), self.upload_max_backoff)
+                print(f"   ⏳ Повтор через {delay} сек")
+                time.sleep(delay)
+        
+        return None, False
+    
+    def _upload_attempt(self, file_path, metadata):
+        """Одно подключение: запрос сохраненного сервером смещения и досылка кадров"""
+        metadata_json = json.dumps(metadata).encode('utf-8')
+        original_size = metadata['original_size']
+        chunk_size = metadata['chunk_size']
+        
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            # Читаем файл
-            with open(file_path, 'rb') as f:
-                file_data = f.read()
-            
-            print(f"🔒 Шифрую файл: {os.path.basename(file_path)}")
-            
-            # Шифруем данные
-            encrypted_data, key = self.encrypt_data(file_data)
-            
-            # Готовим метаданные
-            metadata = {
-                'filename': os.path.basename(file_path),
-                'original_size': len(file_data),
-                'encrypted_size': len(encrypted_data),
-                'encrypted': key is not None,
-                'hash': hashlib.sha256(file_data).hexdigest(),
-                'timestamp': datetime.now().isoformat(),
-                'agent_id': self.agent_id
-            }
-            
-            # Создаем пакет: метаданные + данные
-            packet = {
-                'metadata': metadata,
-                'data': base64.b64encode(encrypted_data).decode('utf-8')
-            }
-            
-            packet_json = json.dumps(packet)
-            packet_size = len(packet_json)
-            
-            print(f"📦 Подготовлен пакет: {packet_size} байт")
-            print(f"   📁 Исходный размер: {len(file_data)} байт")
-            print(f"   🔐 Зашифрованный: {len(encrypted_data)} байт")
-            
-            # Подключаемся к серверу
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.settimeout(30)
             sock.connect((self.server_ip, self.server_port))
             
-            # Отправляем заголовок
-            sock.send("SECURE_FILE".ljust(10).encode('utf-8'))
+            # Заголовок, длина метаданных и метаданные
+            sock.sendall("SECURE_STM".encode('utf-8'))
+            sock.sendall(f"{len(metadata_json):<20}".encode('utf-8'))
+            sock.sendall(metadata_json)
             
-            # Отправляем размер пакета
-            sock.send(f"{packet_size:<20}".encode('utf-8'))
+            # Сервер отвечает, сколько кадров этой загрузки у него уже есть
+            reply_size = int(self._recv_exact(sock, 20).decode('utf-8').strip())
+            reply = json.loads(self._recv_exact(sock, reply_size).decode('utf-8'))
+            if reply.get('status') != 'ready':
+                raise ConnectionError(reply.get('message', 'сервер не готов принять файл'))
             
-            # Отправляем сам пакет
-            total_sent = 0
-            chunk_size = 4096
+            frames_done = reply.get('frames', 0)
             
-            while total_sent < packet_size:
-                chunk = packet_json[total_sent:total_sent + chunk_size].encode('utf-8')
-                sock.send(chunk)
-                total_sent += len(chunk)
+            # Кадры: [длина 4 байта][заголовок контейнера или часть файла]
+            payload_hash = hashlib.sha256()
+            payload_size = 0
+            
+            with open(file_path, 'rb') as f:
+                if metadata['encrypted']:
+                    # Первый кадр контейнера - заголовок, дальше по кадру на часть
+                    start_index = max(frames_done - 1, 0)
+                    stream_id = bytes.fromhex(reply['stream_id']) if frames_done else None
+                    f.seek(start_index * chunk_size)
+                    frames = iter_encrypt(f, self.encryption_key, chunk_size, stream_id, start_index,
+                                          resume=bool(frames_done))
+                else:
+                    f.seek(frames_done * chunk_size)
+                    frames = iter(lambda: f.read(chunk_size), b"")
                 
-                percent = (total_sent / packet_size) * 100
-                print(f"  📤 Отправлено: {percent:.1f}% ({total_sent}/{packet_size})", end='\r')
+                if frames_done:
+                    print(f"   ↩️ Сервер уже получил {min(f.tell(), original_size)} байт, продолжаю")
+                
+                for frame in frames:
+                    sock.sendall(struct.pack('>I', len(frame)) + frame)
+                    
+                    payload_hash.update(frame)
+                    payload_size += len(frame)
+                    
+                    total_read = min(f.tell(), original_size)
+                    percent = (total_read / original_size) * 100 if original_size else 100
+                    print(f"  📤 Отправлено: {percent:.1f}% ({total_read}/{original_size})", end='\r')
             
+            # Пустой кадр - конец передачи
+            sock.sendall(struct.pack('>I', 0))
             print()
+            print(f"   🔐 Передано: {payload_size} байт")
             
-            # Получаем ответ
-            sock.settimeout(5)
+            # Получаем ответ (сервер перечитывает файл целиком и проверяет хэш)
+            sock.settimeout(60 + original_size // (20 * 1024 * 1024))
             response = sock.recv(4096).decode('utf-8')
             response_data = json.loads(response)
-            
+        finally:
             sock.close()
+        
+        # Сервер получил ровно то, что было отправлено (после докачки хэш
+        # всего потока агенту неизвестен - полагаемся на проверку сервера)
+        received_intact = bool(frames_done) or response_data.get('payload_hash') == payload_hash.hexdigest()
+        return response_data, received_intact
+    
+    def secure_send_file(self, file_path, file_type="TELEGRAM"):
+        """
+        Безопасная отправка файла с шифрованием (потоковая передача SECURE_STM)
+        
+        Файл шифруется контейнером stream_crypto (AES-GCM по частям
+        stream_chunk_size), каждая часть уходит отдельным кадром -
+        память не зависит от размера файла. После обрыва связи передача
+        продолжается с последней сохраненной сервером части.
+        
+        Args:
+            file_path (str): Путь к файлу
+            file_type (str): Тип файла
+        """
+        if not os.path.exists(file_path):
+            print(f"❌ Файл не найден: {file_path}")
+            return False
+        
+        try:
+            response_data, received_intact = self._upload_file(file_path, file_type, bool(self.encryption_key))
+            
+            if response_data is None:
+                print("❌ Не удалось отправить файл")
+                return False
             
             if response_data.get('status') == 'success':
                 print(f"✅ Файл отправлен успешно!")
                 print(f"   📝 {response_data.get('message')}")
                 
+                if not received_intact:
+                    print("⚠️ Хэш полученных сервером данных не совпадает")
+                
                 # Безопасное удаление исходного файла
-                if response_data.get('verified', False):
+                if response_data.get('verified', False) and received_intact:
                     self.secure_delete(file_path)
                     print(f"🗑️ Исходный файл безопасно удален")
                 
@@ -1003,7 +1106,8 @@ class SystemAgent:
     def telegram_menu(self):
         """Меню управления Telegram архиватором"""
         try:
-            from telegram_archiver import get_telegram_credentials, sync_download_channel
+            from telegram_archiver import (get_telegram_credentials, sync_download_channel,
+                                           sync_download_channels, load_channel_list)
         except ImportError:
             print("❌ Модуль telegram_archiver не найден")
             print("👉 Убедись что файл telegram_archiver.py в той же папке")
@@ -1028,6 +1132,7 @@ class SystemAgent:
             print("  [2] 📤 Отправить архив на сервер (с шифрованием)")
             print("  [3] 📤 Отправить архив БЕЗ шифрования")
             print("  [4] 🔐 Показать/сменить ключ шифрования")
+            print("  [5] 📚 Скачать несколько каналов")
             print("  [B] ↩️ Назад")
             
             choice = input("> ").lower()
@@ -1038,10 +1143,11 @@ class SystemAgent:
                 channel = input("Введите ссылку на канал (например @durov): ").strip()
                 limit = input("Сколько сообщений скачать? (по умолчанию 100): ").strip()
                 limit = int(limit) if limit.isdigit() else 100
+                incremental = input("Только новые сообщения с прошлого скачивания? (Y/n): ").strip().lower() != 'n'
                 
                 if channel:
                     print(f"🚀 Начинаю скачивание: {channel}")
-                    archive_path = sync_download_channel(api_id, api_hash, channel, limit)
+                    archive_path = sync_download_channel(api_id, api_hash, channel, limit, incremental)
                     
                     if archive_path:
                         print(f"✅ Архив создан: {archive_path}")
@@ -1119,47 +1225,51 @@ class SystemAgent:
                     print("✅ Новый ключ сгенерирован и сохранен")
                 
                 input("\nНажми Enter чтобы продолжить...")
+                
+            elif choice == '5':
+                print("Каналы через пробел или запятую, либо путь к файлу со списком (по ссылке на строку):")
+                source = input("> ").strip()
+                if os.path.isfile(source):
+                    channels = load_channel_list(source)
+                else:
+                    channels = [item for item in source.replace(',', ' ').split() if item]
+                
+                if channels:
+                    limit = input("Сколько сообщений скачать с каждого? (по умолчанию 100): ").strip()
+                    limit = int(limit) if limit.isdigit() else 100
+                    parallel = input("Сколько каналов качать одновременно? (по умолчанию 3): ").strip()
+                    parallel = int(parallel) if parallel.isdigit() else 3
+                    incremental = input("Только новые сообщения с прошлого скачивания? (Y/n): ").strip().lower() != 'n'
+                    send = input("Отправлять архивы на сервер ПК1 (с шифрованием) по мере готовности? (y/n): ").lower() == 'y'
+                    
+                    # Отправка идет в отдельном потоке, пока скачиваются следующие каналы
+                    uploader = ThreadPoolExecutor(max_workers=1) if send else None
+                    uploads = []
+                    on_archive = None
+                    if uploader:
+                        on_archive = lambda archive_path: uploads.append(
+                            uploader.submit(self.secure_send_file, archive_path, "TELEGRAM"))
+                    
+                    print(f"🚀 Пакетное скачивание: {len(channels)} каналов")
+                    sync_download_channels(api_id, api_hash, channels, limit, incremental, parallel, on_archive)
+                    
+                    if uploader:
+                        uploader.shutdown(wait=True)
+                        sent = sum(1 for upload in uploads if upload.result())
+                        print(f"📤 Отправлено архивов: {sent}/{len(uploads)}")
+                else:
+                    print("❌ Каналы не указаны")
+                
+                input("\nНажми Enter чтобы продолжить...")
     
     def _send_file_old(self, file_path, file_type):
-        """Старый метод отправки файла без шифрования"""
+        """Отправка файла без шифрования (возобновляемая потоковая передача)"""
         try:
-            with open(file_path, 'rb') as f:
-                file_data = f.read()
-            
-            file_size = len(file_data)
-            filename = os.path.basename(file_path)
-            
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(30)
-            sock.connect((self.server_ip, self.server_port))
-            
-            header = f"{file_type:<10}"
-            sock.send(header.encode('utf-8'))
-            
-            size_header = f"{file_size:<20}"
-            sock.send(size_header.encode('utf-8'))
-            
-            name_header = f"{filename:<100}"
-            sock.send(name_header.encode('utf-8'))
+            response_data, _ = self._upload_file(file_path, file_type, encrypt=False)
             
-            total_sent = 0
-            chunk_size = 4096
-            
-            while total_sent < file_size:
-                chunk = file_data[total_sent:total_sent + chunk_size]
-                sock.send(chunk)
-                total_sent += len(chunk)
-                
-                percent = (total_sent / file_size) * 100
-                print(f"  📤 Отправлено: {percent:.1f}% ({total_sent}/{file_size})", end='\r')
-            
-            print()
-            
-            sock.settimeout(5)
-            response = sock.recv(4096).decode('utf-8')
-            response_data = json.loads(response)
-            
-            sock.close()
+            if response_data is None:
+                print("❌ Не удалось отправить файл")
+                return False
             
             if response_data.get('status') == 'success':
                 print(f"✅ Файл отправлен (без шифрования)")
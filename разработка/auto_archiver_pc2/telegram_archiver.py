@@ -4,11 +4,374 @@ Telegram архиватор для ПК2
 """
 import asyncio
 import json
+import mimetypes
 import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
 from datetime import datetime
 from telethon import TelegramClient, events
+from telethon.errors import FloodWaitError
 from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
 
+# Файлы канала: сведения о канале и сообщения (по одному JSON на строку)
+HEADER_FILE = "header.json"
+MESSAGES_FILE = "messages.ndjson"
+
+def media_key(media):
+    """
+    Ключ медиа в индексе: (тип, id фото/документа Telegram, размер)
+    
+    Пересланное сообщение ссылается на тот же photo.id / document.id,
+    поэтому один и тот же файл в разных каналах дает один ключ.
+    """
+    if isinstance(media, MessageMediaPhoto) and getattr(media, 'photo', None):
+        return ('photo', media.photo.id, None)
+    if isinstance(media, MessageMediaDocument) and getattr(media, 'document', None):
+        return ('document', media.document.id, getattr(media.document, 'size', None))
+    return None
+
+class MediaIndex:
+    """Индекс скачанных медиа (SQLite): ключ media_key -> путь к файлу"""
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS media_index (
+                kind TEXT NOT NULL,
+                media_id INTEGER NOT NULL,
+                size INTEGER,
+                path TEXT NOT NULL,
+                created TEXT,
+                PRIMARY KEY (kind, media_id)
+            )
+        ''')
+        self.conn.commit()
+        
+        self.stats = {'hits': 0, 'saved_bytes': 0}
+    
+    def lookup(self, key):
+        """Путь к уже скачанному файлу (None если его нет или он изменился)"""
+        kind, media_id, size = key
+        row = self.conn.execute(
+            'SELECT path, size FROM media_index WHERE kind = ? AND media_id = ?', (kind, media_id)
+        ).fetchone()
+        if not row:
+            return None
+        
+        path, indexed_size = row
+        if not os.path.exists(path) or (size and indexed_size and os.path.getsize(path) != size):
+            # Файл удален или подменен - запись больше не годится
+            self.conn.execute('DELETE FROM media_index WHERE kind = ? AND media_id = ?', (kind, media_id))
+            self.conn.commit()
+            return None
+        
+        self.stats['hits'] += 1
+        self.stats['saved_bytes'] += os.path.getsize(path)
+        return path
+    
+    def add(self, key, path):
+        kind, media_id, size = key
+        self.conn.execute(
+            'INSERT OR REPLACE INTO media_index (kind, media_id, size, path, created) VALUES (?, ?, ?, ?, ?)',
+            (kind, media_id, size or os.path.getsize(path), path, datetime.now().isoformat())
+        )
+        self.conn.commit()
+    
+    def close(self):
+        self.conn.close()
+
+class MediaDownloadPool:
+    """
+    Параллельное скачивание медиа (очередь + worker-задачи)
+    
+    Перебор сообщений только ставит файлы в очередь, скачивают их workers
+    задач одновременно. Очередь ограничена - если скачивание отстает,
+    перебор сообщений ждет. FloodWait относится ко всему аккаунту, поэтому
+    указанное Telegram время ждут все workers; при прочих ошибках - пауза
+    backoff, удваивается с каждой попыткой.
+    """
+    
+    def __init__(self, client, workers=4, retries=3, backoff=2):
+        self.client = client
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.backoff = backoff
+        self.queue = asyncio.Queue(maxsize=self.workers * 4)
+        self.tasks = []
+        self.started = None
+        self.paused_until = 0  # time.monotonic() окончания FloodWait
+        
+        self.stats = {
+            'files': 0,
+            'failed': 0,
+            'bytes': 0,
+            'retries': 0,
+            'flood_waits': 0,
+            'seconds': 0
+        }
+    
+    def start(self):
+        self.started = time.perf_counter()
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        return self
+    
+    async def submit(self, media, path, on_done):
+        """
+        Постановка файла в очередь
+        
+        Args:
+            media: Медиа сообщения
+            path: Куда сохранить
+            on_done: Функция (путь или None при ошибке), вызывается после скачивания
+        """
+        await self.queue.put((media, path, on_done))
+    
+    async def _worker(self):
+        while True:
+            media, path, on_done = await self.queue.get()
+            try:
+                on_done(await self._download(media, path))
+            finally:
+                self.queue.task_done()
+    
+    async def _download(self, media, path):
+        """Скачивание одного файла с повторами (None если не удалось)"""
+        for attempt in range(self.retries + 1):
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            
+            try:
+                result = await self.client.download_media(media, file=path)
+                result = result if isinstance(result, str) else path
+                
+                self.stats['files'] += 1
+                if os.path.exists(result):
+                    self.stats['bytes'] += os.path.getsize(result)
+                print(f"  📷 Скачано медиа: {result}")
+                return result
+                
+            except FloodWaitError as e:
+                self.stats['flood_waits'] += 1
+                delay = e.seconds + 1
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                print(f"  ⏳ FloodWait: жду {delay} сек")
+            except Exception as e:
+                delay = self.backoff * 2 ** attempt
+                print(f"  ⚠️ Ошибка скачивания медиа ({attempt + 1}/{self.retries + 1}): {e}")
+            
+            if attempt < self.retries:
+                self.stats['retries'] += 1
+                await asyncio.sleep(delay)
+        
+        self.stats['failed'] += 1
+        return None
+    
+    def cancel(self):
+        """Остановка workers без ожидания очереди (при ошибке скачивания канала)"""
+        for task in self.tasks:
+            task.cancel()
+    
+    async def join(self):
+        """Ожидание всех файлов и остановка workers"""
+        await self.queue.join()
+        self.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        
+        self.stats['seconds'] = time.perf_counter() - self.started
+        return self.stats
+    
+    def print_stats(self):
+        seconds = self.stats['seconds'] or 1e-9
+        mb = self.stats['bytes'] / (1024 * 1024)
+        print(f"   ⚡ Медиа: {self.stats['files']} файлов, {mb:.1f} MB за {self.stats['seconds']:.1f} сек "
+              f"({self.stats['files'] / seconds:.1f} файлов/с, {mb / seconds:.2f} MB/s, потоков: {self.workers})")
+        if self.stats['retries'] or self.stats['failed']:
+            print(f"   🔁 Повторов: {self.stats['retries']} (FloodWait: {self.stats['flood_waits']}), ошибок: {self.stats['failed']}")
+
+class ChannelWriter:
+    """
+    Потоковая запись сообщений канала по мере получения
+    
+    messages.ndjson - по сообщению (JSON) на строку, messages.txt - текстовый
+    дамп. Сообщения в памяти не копятся. Полное скачивание пишет во временные
+    .part файлы и подменяет старые в commit(); синхронизация дописывает в конец,
+    предварительно отрезав хвост незавершенного прошлого запуска (размеры
+    файлов на момент последней контрольной точки).
+    """
+    
+    def __init__(self, folder, append=False, sizes=None):
+        self.folder = folder
+        self.append = append
+        self.messages = 0
+        self.media = 0
+        
+        self.paths = {
+            'ndjson': f"{folder}/{MESSAGES_FILE}",
+            'text': f"{folder}/messages.txt"
+        }
+        self.files = {}
+        for name, path in self.paths.items():
+            if append:
+                f = open(path, 'ab')
+                size = (sizes or {}).get(name)
+                if size is not None and size <= f.tell():
+                    f.truncate(size)
+                    f.seek(size)
+            else:
+                f = open(f"{path}.part", 'wb')
+            self.files[name] = f
+    
+    def write_text(self, text):
+        self.files['text'].write(text.encode('utf-8'))
+    
+    def write(self, msg):
+        """Запись одного сообщения"""
+        self.files['ndjson'].write(json.dumps(msg, ensure_ascii=False).encode('utf-8') + b"\n")
+        self.messages += 1
+        if msg['media_type']:
+            self.media += 1
+        
+        self.write_text(f"[{msg['date']}] ID:{msg['id']}\n")
+        if msg['text']:
+            self.write_text(f"{msg['text']}\n")
+        if msg['media_type']:
+            self.write_text(f"[{msg['media_type'].upper()}: {msg['media_path']}]\n")
+        self.write_text("-"*30 + "\n")
+    
+    def commit(self):
+        """
+        Завершение записи
+        
+        Returns:
+            dict: Размеры файлов (для следующей синхронизации)
+        """
+        sizes = {}
+        for name, f in self.files.items():
+            sizes[name] = f.tell()
+            f.close()
+            if not self.append:
+                os.replace(f"{self.paths[name]}.part", self.paths[name])
+        return sizes
+    
+    def abort(self):
+        """Прерванная запись: временные файлы удаляются, дописанное отрежется при следующем запуске"""
+        for name, f in self.files.items():
+            f.close()
+            if not self.append and os.path.exists(f"{self.paths[name]}.part"):
+                os.remove(f"{self.paths[name]}.part")
+
+# Уже сжатые форматы: повторное сжатие DEFLATE почти ничего не дает, только тратит время
+STORED_MIME_PREFIXES = ('image/', 'video/', 'audio/')
+STORED_MIME_TYPES = {
+    'application/zip', 'application/gzip', 'application/x-7z-compressed',
+    'application/x-rar-compressed', 'application/vnd.rar', 'application/x-bzip2',
+    'application/x-xz', 'application/pdf', 'application/x-tgsticker'
+}
+# Несжатые форматы с "медийным" MIME
+DEFLATED_MIME_TYPES = {'image/bmp', 'image/x-ms-bmp', 'image/svg+xml', 'image/tiff', 'audio/wav', 'audio/x-wav'}
+
+def compress_type_for(path, mime_type=None):
+    """Способ сжатия файла в архиве по MIME (если не известен - по расширению)"""
+    mime_type = mime_type or mimetypes.guess_type(path)[0]
+    if mime_type and mime_type not in DEFLATED_MIME_TYPES:
+        if mime_type.startswith(STORED_MIME_PREFIXES) or mime_type in STORED_MIME_TYPES:
+            return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+class ArchiveWriter:
+    """
+    Zip-архив канала, который пополняется по ходу скачивания
+    
+    Медиа добавляется сразу после скачивания, а не отдельным проходом по папке
+    в конце. Запись идет в отдельном потоке через очередь - сжатие не
+    задерживает цикл событий с загрузками. Фото, видео и прочие уже сжатые
+    форматы кладутся без сжатия (ZIP_STORED). Архив пишется в .part и
+    появляется под своим именем только в close() - и только если записаны
+    все файлы из очереди.
+    """
+    
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        self.part_path = f"{archive_path}.part"
+        self.zip = zipfile.ZipFile(self.part_path, 'w', zipfile.ZIP_DEFLATED)
+        self.queue = queue.Queue()
+        self.names = set()
+        self.failed = []  # (имя в архиве, ошибка) - файлы, которые не удалось записать
+        
+        self.stats = {
+            'files': 0,
+            'stored': 0,
+            'bytes': 0
+        }
+        
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def add(self, path, arcname, mime_type=None):
+        """Постановка файла в очередь на запись (повторное имя пропускается)"""
+        self.queue.put((path, arcname, mime_type))
+    
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            
+            path, arcname, mime_type = item
+            if arcname in self.names:
+                continue
+            
+            try:
+                compress_type = compress_type_for(path, mime_type)
+                self.zip.write(path, arcname, compress_type=compress_type)
+                self.names.add(arcname)
+                self.stats['files'] += 1
+                self.stats['bytes'] += os.path.getsize(path)
+                if compress_type == zipfile.ZIP_STORED:
+                    self.stats['stored'] += 1
+            except Exception as e:
+                # Поток записи не должен падать молча - ошибка проверяется в close()
+                self.failed.append((arcname, e))
+                print(f"  ⚠️ Файл не добавлен в архив {arcname}: {e}")
+    
+    def _finish(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.zip.close()
+    
+    def close(self):
+        """
+        Дописывает очередь и закрывает архив
+        
+        Returns:
+            str: Путь к архиву
+        
+        Raises:
+            RuntimeError: Какой-то файл из очереди не записан (архив удаляется)
+        """
+        self._finish()
+        if self.failed:
+            self.abort()
+            arcname, error = self.failed[0]
+            raise RuntimeError(f"Архив неполный: не записано файлов {len(self.failed)} ({arcname}: {error})")
+        os.replace(self.part_path, self.archive_path)
+        return self.archive_path
+    
+    def abort(self):
+        """Закрытие без сохранения (при ошибке скачивания или записи)"""
+        try:
+            self._finish()
+        except Exception as e:
+            print(f"  ⚠️ Ошибка закрытия архива: {e}")  # Архив все равно удаляется
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
 class TelegramArchiver:
     def __init__(self, api_id=None, api_hash=None, session_name='telegram_session'):
         """
@@ -25,11 +388,19 @@ class TelegramArchiver:
         self.client = None
         self.download_path = "./telegram_archives"
         
+        # Параллельное скачивание медиа
+        self.download_workers = 4
+        self.download_retries = 3
+        self.download_backoff = 2  # секунды, удваивается с каждой попыткой
+        
         # Создаем папки
         os.makedirs(self.download_path, exist_ok=True)
         os.makedirs(f"{self.download_path}/chats", exist_ok=True)
         os.makedirs(f"{self.download_path}/media", exist_ok=True)
         
+        # Индекс уже скачанных медиа (общий для всех каналов)
+        self.media_index = MediaIndex(f"{self.download_path}/media_index.db")
+        
     async def connect(self):
         """Подключение к Telegram"""
         if not self.api_id or not self.api_hash:
@@ -50,18 +421,81 @@ class TelegramArchiver:
             print(f"❌ Ошибка подключения к Telegram: {e}")
             return False
     
-    async def download_channel(self, channel_link, limit=100):
+    def _sync_state_path(self, safe_name):
+        """Файл состояния синхронизации канала (рядом с папкой канала, в архив не попадает)"""
+        return f"{self.download_path}/chats/{safe_name}.sync.json"
+    
+    def _load_sync_state(self, state_path):
+        """Загрузка состояния синхронизации (None если канал еще не скачивался)"""
+        if not os.path.exists(state_path):
+            return None
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️ Не удалось прочитать состояние синхронизации: {e}")
+            return None
+    
+    def _save_sync_state(self, state_path, state):
+        """Атомарное сохранение состояния синхронизации"""
+        state['updated'] = datetime.now().isoformat()
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, state_path)
+    
+    def _convert_legacy_metadata(self, channel_folder):
+        """Перевод metadata.json старого формата в header.json + messages.ndjson"""
+        metadata_file = f"{channel_folder}/metadata.json"
+        with open(metadata_file, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        
+        messages = metadata.pop('messages', [])
+        with open(f"{channel_folder}/{MESSAGES_FILE}", 'wb') as f:
+            for msg in messages:
+                f.write(json.dumps(msg, ensure_ascii=False).encode('utf-8') + b"\n")
+        
+        metadata['format'] = 'ndjson'
+        metadata['messages_file'] = MESSAGES_FILE
+        metadata.setdefault('last_message_id', max([msg['id'] for msg in messages] + [0]))
+        self._write_json(f"{channel_folder}/{HEADER_FILE}", metadata)
+        os.remove(metadata_file)
+        print(f"🔁 Метаданные переведены в {MESSAGES_FILE}: {len(messages)} сообщений")
+    
+    def _write_json(self, path, data):
+        """Атомарная запись небольшого JSON"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    
+    async def download_channel(self, channel_link, limit=100, incremental=False, workers=None, stats=None):
         """
         Скачивание канала
         
+        Сообщения пишутся в messages.ndjson (по одному JSON на строку) сразу по
+        получении, сведения о канале - в небольшой header.json. Память не
+        зависит от размера канала.
+        
+        В инкрементальном режиме скачиваются только сообщения новее последнего
+        сохраненного (min_id из состояния синхронизации) и дописываются в конец
+        messages.ndjson. Сообщения идут от старых к новым, поэтому при limit
+        меньше числа новых сообщений следующий запуск продолжит с места остановки.
+        
         Args:
             channel_link: Ссылка на канал (@username или https://t.me/...)
             limit: Максимальное количество сообщений
+            incremental: Скачать только новые сообщения
+            workers: Сколько медиафайлов качать одновременно (по умолчанию download_workers)
+            stats: Словарь, в который записываются итоги (сообщения, медиа, байты)
         """
         if not self.client:
             print("❌ Клиент не инициализирован")
             return None
         
+        pool = None
+        writer = None
+        archive = None
         try:
             print(f"📥 Скачиваю канал: {channel_link}")
             
@@ -74,11 +508,74 @@ class TelegramArchiver:
             channel_folder = f"{self.download_path}/chats/{safe_name}"
             os.makedirs(channel_folder, exist_ok=True)
             
-            # Собираем сообщения
-            messages_data = []
-            media_count = 0
+            if os.path.exists(f"{channel_folder}/metadata.json") and not os.path.exists(f"{channel_folder}/{MESSAGES_FILE}"):
+                self._convert_legacy_metadata(channel_folder)
+            
+            header_file = f"{channel_folder}/{HEADER_FILE}"
+            old_header = None
+            if os.path.exists(header_file):
+                with open(header_file, 'r', encoding='utf-8') as f:
+                    old_header = json.load(f)
+            
+            state_path = self._sync_state_path(safe_name)
+            state = self._load_sync_state(state_path) or {
+                'channel_id': entity.id,
+                'last_message_id': (old_header or {}).get('last_message_id', 0)
+            }
+            
+            # Без сохраненных сообщений инкрементальная синхронизация - обычное скачивание
+            incremental = incremental and state['last_message_id'] > 0 and old_header is not None
+            
+            if incremental:
+                print(f"🔄 Только новые сообщения (после ID {state['last_message_id']})")
+                messages_iter = self.client.iter_messages(entity, limit=limit, min_id=state['last_message_id'], reverse=True)
+            else:
+                messages_iter = self.client.iter_messages(entity, limit=limit)
+            
+            writer = ChannelWriter(channel_folder, append=incremental, sizes=state.get('sizes'))
+            if incremental:
+                writer.write_text(f"\n=== Синхронизация {datetime.now()} ===\n\n")
+            else:
+                writer.write_text(f"Канал: {channel_name}\n")
+                writer.write_text(f"Ссылка: {channel_link}\n")
+                writer.write_text(f"Дата архивации: {datetime.now()}\n")
+                writer.write_text("="*50 + "\n\n")
+            
+            # Архив собирается по ходу скачивания
+            archive = ArchiveWriter(self._archive_path(channel_name))
+            print(f"📦 Архив: {os.path.basename(archive.archive_path)}")
+            
+            def add_media(path, mime_type):
+                archive.add(path, f"{safe_name}/media/{os.path.basename(path)}", mime_type)
+            
+            # Сообщения пишутся сразу, с медиа - когда оно скачано
+            processed = 0
+            last_message_id = state['last_message_id'] if incremental else 0
+            
+            pool = MediaDownloadPool(
+                self.client,
+                workers=workers or self.download_workers,
+                retries=self.download_retries,
+                backoff=self.download_backoff
+            ).start()
+            
+            # Медиа, которое уже качается в этом запуске: ключ -> ждущие его сообщения
+            pending_media = {}
             
-            async for message in self.client.iter_messages(entity, limit=limit):
+            def media_done(key, msg_data, path, mime_type):
+                waiting = pending_media.pop(key, [msg_data]) if key else [msg_data]
+                if path:
+                    add_media(path, mime_type)
+                    if key:
+                        self.media_index.add(key, path)
+                for item in waiting:
+                    item['media_path'] = path
+                    writer.write(item)
+            
+            async for message in messages_iter:
+                processed += 1
+                last_message_id = max(last_message_id, message.id)
+                
                 msg_data = {
                     'id': message.id,
                     'date': message.date.isoformat() if message.date else None,
@@ -90,110 +587,175 @@ class TelegramArchiver:
                 
                 # Скачиваем медиа если есть
                 if message.media:
-                    media_count += 1
-                    media_filename = f"media_{message.id}_{media_count}"
+                    # id канала в имени - id сообщений в разных каналах совпадают
+                    media_filename = f"media_{entity.id}_{message.id}"
+                    media_mime = None
                     
                     if isinstance(message.media, MessageMediaPhoto):
                         msg_data['media_type'] = 'photo'
+                        media_mime = 'image/jpeg'
                         media_path = f"{self.download_path}/media/{media_filename}.jpg"
                     elif isinstance(message.media, MessageMediaDocument):
                         msg_data['media_type'] = 'document'
                         # Получаем расширение файла
                         doc = message.media.document
+                        media_mime = doc.mime_type
                         mime_type = doc.mime_type if doc.mime_type else 'bin'
                         ext = mime_type.split('/')[-1]
                         media_path = f"{self.download_path}/media/{media_filename}.{ext}"
                     else:
                         media_path = f"{self.download_path}/media/{media_filename}.bin"
                     
-                    # Скачиваем медиа
-                    try:
-                        await self.client.download_media(message.media, file=media_path)
-                        msg_data['media_path'] = media_path
-                        print(f"  📷 Скачано медиа: {media_path}")
-                    except Exception as e:
-                        print(f"  ⚠️ Ошибка скачивания медиа: {e}")
-                
-                messages_data.append(msg_data)
+                    key = media_key(message.media)
+                    if key and key in pending_media:
+                        # Тот же файл уже качается для другого сообщения
+                        pending_media[key].append(msg_data)
+                    else:
+                        # Уже скачанный файл (прошлый запуск или пересылка из другого канала) - ссылаемся на него
+                        indexed_path = self.media_index.lookup(key) if key else None
+                        if indexed_path:
+                            msg_data['media_path'] = indexed_path
+                            writer.write(msg_data)
+                            add_media(indexed_path, media_mime)
+                        else:
+                            if key:
+                                pending_media[key] = [msg_data]
+                            await pool.submit(message.media, media_path,
+                                              lambda path, key=key, msg_data=msg_data, mime_type=media_mime:
+                                                  media_done(key, msg_data, path, mime_type))
+                else:
+                    writer.write(msg_data)
                 
                 # Прогресс
-                if len(messages_data) % 10 == 0:
-                    print(f"  📝 Обработано сообщений: {len(messages_data)}/{limit}")
+                if processed % 10 == 0:
+                    print(f"  📝 [{channel_name}] Обработано сообщений: {processed}/{limit}")
+            
+            # Дожидаемся медиа - сообщения с ним еще не записаны
+            await pool.join()
+            sizes = writer.commit()
             
-            # Сохраняем метаданные
-            metadata = {
+            # Сведения о канале (счетчики с учетом прошлых синхронизаций)
+            previous = old_header if incremental else {}
+            header = {
+                'format': 'ndjson',
+                'messages_file': MESSAGES_FILE,
                 'channel_name': channel_name,
                 'channel_link': channel_link,
-                'total_messages': len(messages_data),
-                'media_count': media_count,
+                'channel_id': entity.id,
+                'total_messages': previous.get('total_messages', 0) + writer.messages,
+                'media_count': previous.get('media_count', 0) + writer.media,
                 'download_date': datetime.now().isoformat(),
-                'messages': messages_data
+                'last_message_id': last_message_id
             }
+            self._write_json(header_file, header)
             
-            metadata_file = f"{channel_folder}/metadata.json"
-            with open(metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
-            
-            # Создаем текстовый дамп
-            text_dump_file = f"{channel_folder}/messages.txt"
-            with open(text_dump_file, 'w', encoding='utf-8') as f:
-                f.write(f"Канал: {channel_name}\n")
-                f.write(f"Ссылка: {channel_link}\n")
-                f.write(f"Сообщений: {len(messages_data)}\n")
-                f.write(f"Медиа: {media_count}\n")
-                f.write(f"Дата архивации: {datetime.now()}\n")
-                f.write("="*50 + "\n\n")
-                
-                for msg in messages_data:
-                    f.write(f"[{msg['date']}] ID:{msg['id']}\n")
-                    if msg['text']:
-                        f.write(f"{msg['text']}\n")
-                    if msg['media_type']:
-                        f.write(f"[{msg['media_type'].upper()}: {msg['media_path']}]\n")
-                    f.write("-"*30 + "\n")
+            # Контрольная точка - только после записи сообщений
+            state['channel_id'] = entity.id
+            state['channel_name'] = channel_name
+            state['last_message_id'] = last_message_id
+            state['sizes'] = sizes
+            state.pop('media', None)  # пути к медиа старого формата - теперь в индексе медиа
+            self._save_sync_state(state_path, state)
             
             print(f"✅ Канал скачан: {channel_name}")
-            print(f"   📊 Сообщений: {len(messages_data)}")
-            print(f"   📷 Медиафайлов: {media_count}")
+            if incremental:
+                print(f"   🆕 Новых сообщений: {writer.messages}")
+            print(f"   📊 Сообщений: {header['total_messages']}")
+            print(f"   📷 Медиафайлов: {header['media_count']}")
+            pool.print_stats()
+            if self.media_index.stats['hits']:
+                print(f"   ♻️ Медиа из индекса (без скачивания): {self.media_index.stats['hits']} "
+                      f"({self.media_index.stats['saved_bytes'] / (1024 * 1024):.1f} MB)")
             print(f"   💾 Файлы сохранены в: {channel_folder}")
             
-            # Создаем архив для отправки
-            archive_path = self._create_archive(channel_folder, channel_name)
+            # Дописываем файлы канала - медиа уже в архиве
+            for name in (HEADER_FILE, MESSAGES_FILE, "messages.txt"):
+                archive.add(f"{channel_folder}/{name}", f"{safe_name}/{name}")
+            archive_path = archive.close()
+            print(f"✅ Архив создан: {archive_path} ({os.path.getsize(archive_path)//1024} KB, "
+                  f"файлов: {archive.stats['files']}, без сжатия: {archive.stats['stored']})")
+            
+            if stats is not None:
+                stats.update({
+                    'channel_name': channel_name,
+                    'messages': writer.messages,
+                    'media': writer.media,
+                    'media_bytes': pool.stats['bytes'],
+                    'archive_bytes': os.path.getsize(archive_path)
+                })
             return archive_path
             
         except Exception as e:
             print(f"❌ Ошибка скачивания канала: {e}")
+            if pool:
+                pool.cancel()
+            if writer:
+                writer.abort()
+            if archive:
+                archive.abort()
             return None
     
-    def _create_archive(self, folder_path, channel_name):
+    async def download_channels(self, channel_links, limit=100, incremental=False, max_parallel=3, on_archive=None):
         """
-        Создание архива из папки
+        Пакетное скачивание нескольких каналов через одно подключение
+        
+        Одновременно скачивается не больше max_parallel каналов. Потоки
+        скачивания медиа (download_workers) делятся между ними, чтобы общее
+        число запросов к Telegram не росло с числом каналов.
         
         Args:
-            folder_path: Путь к папке с данными
-            channel_name: Имя канала
+            channel_links: Список ссылок на каналы
+            limit: Максимальное количество сообщений на канал
+            incremental: Скачать только новые сообщения
+            max_parallel: Сколько каналов скачивать одновременно
+            on_archive: Функция (путь к архиву), вызывается сразу после готовности
+                каждого архива - например, чтобы отправка шла параллельно со
+                скачиванием следующих каналов. Не должна блокировать.
         
         Returns:
-            str: Путь к созданному архиву
+            list: Итоги по каналам (в порядке channel_links)
         """
-        import zipfile
+        max_parallel = max(1, min(max_parallel, len(channel_links) or 1))
+        semaphore = asyncio.Semaphore(max_parallel)
+        workers = max(1, self.download_workers // max_parallel)
+        done = 0
         
+        async def run(channel_link):
+            nonlocal done
+            result = {
+                'channel': channel_link,
+                'archive_path': None,
+                'messages': 0,
+                'media': 0,
+                'media_bytes': 0,
+                'archive_bytes': 0,
+                'seconds': 0
+            }
+            
+            async with semaphore:
+                print(f"▶️ [{channel_link}] Начинаю скачивание")
+                started = time.perf_counter()
+                stats = {}
+                result['archive_path'] = await self.download_channel(channel_link, limit, incremental,
+                                                                     workers=workers, stats=stats)
+                result.update(stats)
+                result['seconds'] = time.perf_counter() - started
+            
+            done += 1
+            status = "✅" if result['archive_path'] else "❌"
+            print(f"{status} [{channel_link}] {result['messages']} сообщений за {result['seconds']:.1f} сек "
+                  f"(готово каналов: {done}/{len(channel_links)})")
+            if on_archive and result['archive_path']:
+                on_archive(result['archive_path'])
+            return result
+        
+        return list(await asyncio.gather(*(run(link) for link in channel_links)))
+    
+    def _archive_path(self, channel_name):
+        """Путь к новому архиву канала"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         archive_name = f"{channel_name}_{timestamp}.zip".replace(' ', '_')
-        archive_path = f"{self.download_path}/{archive_name}"
-        
-        print(f"📦 Создаю архив: {archive_name}")
-        
-        with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(folder_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, os.path.dirname(folder_path))
-                    zipf.write(file_path, arcname)
-                    print(f"  📎 Добавлен файл: {file}")
-        
-        print(f"✅ Архив создан: {archive_path} ({os.path.getsize(archive_path)//1024} KB)")
-        return archive_path
+        return f"{self.download_path}/{archive_name}"
     
     async def get_available_chats(self):
         """Получение списка доступных чатов/каналов"""
@@ -221,8 +783,9 @@ class TelegramArchiver:
         if self.client:
             await self.client.disconnect()
             print("🔌 Соединение с Telegram закрыто")
+        self.media_index.close()
 
-def sync_download_channel(api_id, api_hash, channel_link, limit=100):
+def sync_download_channel(api_id, api_hash, channel_link, limit=100, incremental=False):
     """
     Синхронная версия скачивания канала
     (для использования из обычного кода)
@@ -232,13 +795,72 @@ def sync_download_channel(api_id, api_hash, channel_link, limit=100):
     # Запускаем асинхронную функцию
     async def run():
         if await archiver.connect():
-            archive_path = await archiver.download_channel(channel_link, limit)
+            archive_path = await archiver.download_channel(channel_link, limit, incremental)
             await archiver.close()
             return archive_path
         return None
     
     return asyncio.run(run())
 
+def sync_download_channels(api_id, api_hash, channel_links, limit=100, incremental=False, max_parallel=3, on_archive=None):
+    """
+    Синхронная версия пакетного скачивания каналов
+    (одно подключение на все каналы, в конце печатается сводка)
+    
+    Returns:
+        list: Итоги по каналам (см. TelegramArchiver.download_channels)
+    """
+    archiver = TelegramArchiver(api_id, api_hash)
+    
+    async def run():
+        if await archiver.connect():
+            try:
+                return await archiver.download_channels(channel_links, limit, incremental, max_parallel, on_archive)
+            finally:
+                await archiver.close()
+        return []
+    
+    started = time.perf_counter()
+    results = asyncio.run(run())
+    if results:
+        print(format_batch_summary(results, time.perf_counter() - started))
+    return results
+
+def load_channel_list(path):
+    """Список каналов из файла (по ссылке на строку, # - комментарий)"""
+    channels = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                channels.append(line)
+    return channels
+
+def format_batch_summary(results, total_seconds=None):
+    """Таблица итогов пакетного скачивания"""
+    mb = 1024 * 1024
+    lines = [
+        f"{'Канал':<30} {'Сообщ.':>8} {'Медиа':>7} {'Скачано MB':>11} {'Архив MB':>9} {'Сек':>7}",
+        "-" * 77
+    ]
+    for result in results:
+        name = result.get('channel_name') or result['channel']
+        mark = "✅" if result['archive_path'] else "❌"
+        lines.append(
+            f"{mark} {name[:27]:<27} {result['messages']:>8} {result['media']:>7} "
+            f"{result['media_bytes'] / mb:>11.1f} {result['archive_bytes'] / mb:>9.1f} {result['seconds']:>7.1f}"
+        )
+    
+    lines.append("-" * 77)
+    ok = sum(1 for result in results if result['archive_path'])
+    total = (f"Каналов: {ok}/{len(results)}, сообщений: {sum(r['messages'] for r in results)}, "
+             f"медиа: {sum(r['media'] for r in results)}, "
+             f"скачано: {sum(r['media_bytes'] for r in results) / mb:.1f} MB")
+    if total_seconds is not None:
+        total += f", время: {total_seconds:.1f} сек"
+    lines.append(total)
+    return "\n".join(lines)
+
 def get_telegram_credentials():
     """
     Получение или запрос учетных данных Telegram
@@ -280,7 +902,30 @@ def get_telegram_credentials():
     
     return api_id, api_hash
 
-if __name__ == "__main__":
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # Пакетное скачивание: python telegram_archiver.py @chan1 @chan2 channels.txt [--limit N] [--parallel N] [--full]
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Пакетное скачивание Telegram каналов")
+    parser.add_argument('channels', nargs='+', help="Ссылки на каналы или файлы со списком (по ссылке на строку)")
+    parser.add_argument('--limit', type=int, default=100, help="Сообщений на канал (по умолчанию 100)")
+    parser.add_argument('--parallel', type=int, default=3, help="Каналов одновременно (по умолчанию 3)")
+    parser.add_argument('--full', action='store_true', help="Скачать заново, а не только новые сообщения")
+    args = parser.parse_args()
+    
+    channels = []
+    for item in args.channels:
+        channels.extend(load_channel_list(item) if os.path.isfile(item) else [item])
+    
+    api_id, api_hash = get_telegram_credentials()
+    if not (api_id and api_hash):
+        print("❌ Учетные данные не получены")
+        sys.exit(1)
+    
+    results = sync_download_channels(api_id, api_hash, channels, args.limit, not args.full, args.parallel)
+    sys.exit(0 if results and all(result['archive_path'] for result in results) else 1)
+
+elif __name__ == "__main__":
     # Тестовый запуск
     print("🧪 Тестирование Telegram архиватора...")
     